@@ -0,0 +1,282 @@
+"""
+Benchmark harness for the resource-optimizer Lambda.
+
+Generates synthetic team catalogues and incident streams, runs the
+optimizer end to end without touching AWS, and reports latency
+percentiles, peak memory and solution quality. Results are written as a
+JSON baseline that later runs can be compared against:
+
+    python benchmarks/resource_optimizer.py --output baseline.json
+    python benchmarks/resource_optimizer.py --baseline baseline.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+OPTIMIZER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-functions', 'resource-optimizer')
+sys.path.insert(0, os.path.abspath(OPTIMIZER_DIR))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import app
+import assignment
+import travel_matrix
+from specialization_index import SpecializationIndex
+
+# Specialization mix of a realistic national catalogue
+SPECIALIZATION_MIX = {
+    'Environmental': 25,
+    'Chemical Response': 15,
+    'Flood Response': 15,
+    'Coordination': 10,
+    'Industrial Cleanup': 10,
+    'Medical Response': 8,
+    'Construction': 8,
+    'Water Management': 5,
+    'Radiation Response': 2,
+    'Cross-Border Ops': 2
+}
+
+WASTE_TYPE_MIX = {
+    'Disaster Debris': 35,
+    'Chemical Hazardous': 25,
+    'Industrial Waste': 20,
+    'Medical Biological': 15,
+    'Radioactive': 5
+}
+
+PRIORITY_MIX = {'CRITICAL': 10, 'HIGH': 25, 'MEDIUM': 40, 'LOW': 25}
+
+DEFAULT_TEAM_COUNTS = [10, 1000, 10000]
+DEFAULT_INCIDENT_COUNTS = [1, 100, 1000]
+FULL_TEAM_COUNTS = [10, 1000, 10000, 50000]
+FULL_INCIDENT_COUNTS = [1, 100, 1000, 5000]
+
+REGRESSION_THRESHOLD = 0.2
+
+def weighted_choice(rng, mix):
+    """Pick a key from a {value: weight} mix"""
+    return rng.choices(list(mix), weights=list(mix.values()))[0]
+
+def generate_countries(rng, count):
+    """Synthetic countries with a centre point, neighbours sharing a region"""
+    countries = []
+    for i in range(count):
+        countries.append({
+            'name': f"Country-{i:02d}",
+            'latitude': rng.uniform(-40, 60),
+            'longitude': rng.uniform(-120, 140)
+        })
+    return countries
+
+def generate_teams(rng, countries, count):
+    """Synthetic team catalogue with bases scattered around country centres"""
+    teams = []
+    for i in range(count):
+        country = rng.choice(countries)
+        specialization = weighted_choice(rng, SPECIALIZATION_MIX)
+        teams.append({
+            'team_id': f"{country['name']}-T{i:05d}",
+            'country': country['name'],
+            'specialization': specialization,
+            'status': 'AVAILABLE' if rng.random() < 0.85 else 'DEPLOYED',
+            'capability': rng.randint(4, 10),
+            'base_latitude': country['latitude'] + rng.uniform(-3, 3),
+            'base_longitude': country['longitude'] + rng.uniform(-3, 3)
+        })
+    return teams
+
+def generate_incidents(rng, countries, count):
+    """Synthetic concurrent incidents, each affecting one to three countries"""
+    incidents = []
+    for i in range(count):
+        affected = rng.sample(countries, rng.choice([1, 2, 2, 3]))
+        origin = affected[0]
+        incidents.append({
+            'incident_id': f"INC-SYN-{i:05d}",
+            'priority': weighted_choice(rng, PRIORITY_MIX),
+            'affected_countries': [c['name'] for c in affected],
+            'location': {
+                'latitude': origin['latitude'] + rng.uniform(-2, 2),
+                'longitude': origin['longitude'] + rng.uniform(-2, 2)
+            },
+            'waste_classification': {
+                'primary_type': weighted_choice(rng, WASTE_TYPE_MIX),
+                'hazard_level': rng.randint(1, 5)
+            }
+        })
+    return incidents
+
+def percentiles(samples_ms):
+    """p50/p95/p99 of latency samples in milliseconds"""
+    if not samples_ms:
+        return {'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0}
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 3), 'p95_ms': round(float(p95), 3), 'p99_ms': round(float(p99), 3)}
+
+def run_sequential(teams, incidents):
+    """Optimize incidents one by one, as the API does today"""
+    available = [t for t in teams if t['status'] == 'AVAILABLE']
+    index = SpecializationIndex(available)
+
+    latencies = []
+    required = covered = 0
+    scores = []
+    allocated = {}
+    for incident in incidents:
+        start = time.perf_counter()
+        optimization = app.optimize_resources(incident, available, index)
+        strategy = app.calculate_deployment_strategy(optimization)
+        app.calculate_total_cost(optimization)
+        app.calculate_response_time(strategy)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        required += len(optimization['specializations_covered'])
+        covered += sum(
+            1 for spec in optimization['specializations_covered']
+            if any(spec.lower() in t['specialization'].lower() for t in optimization['selected_teams'])
+        )
+        scores.append(optimization['optimization_score'])
+        for team in optimization['selected_teams']:
+            allocated[team['team_id']] = allocated.get(team['team_id'], 0) + 1
+
+    return {
+        **percentiles(latencies),
+        'total_ms': round(sum(latencies), 3),
+        'coverage': round(covered / required, 4) if required else 1.0,
+        'mean_optimization_score': round(float(np.mean(scores)), 3) if scores else 0.0,
+        'double_allocated_teams': sum(1 for n in allocated.values() if n > 1)
+    }
+
+def run_batch(teams, incidents):
+    """Solve all incidents jointly with the batch assignment solver"""
+    available = [t for t in teams if t['status'] == 'AVAILABLE']
+    for incident in incidents:
+        incident['required_specializations'] = app.batch_specializations(incident)
+
+    start = time.perf_counter()
+    solution = assignment.solve_assignment(incidents, available, app.incident_travel_hours)
+    solve_ms = (time.perf_counter() - start) * 1000
+
+    slots = sum(len(i['required_specializations']) for i in incidents)
+    return {
+        'solve_ms': round(solve_ms, 3),
+        'coverage': round(1 - solution['uncovered_slots'] / slots, 4) if slots else 1.0,
+        'objective': round(solution['objective'], 3)
+    }
+
+def measure(fn, *args):
+    """Run fn and record its peak traced memory"""
+    tracemalloc.start()
+    try:
+        result = fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    result['peak_memory_mb'] = round(peak / 1024 / 1024, 3)
+    return result
+
+def run_case(team_count, incident_count, seed, country_count):
+    """Benchmark one catalogue size x incident count"""
+    rng = random.Random(seed)
+    countries = generate_countries(rng, country_count)
+    teams = generate_teams(rng, countries, team_count)
+    incidents = generate_incidents(rng, countries, incident_count)
+
+    # Fresh in-memory travel matrix so cases do not share cached rows
+    travel_matrix.set_matrix(travel_matrix.TravelTimeMatrix(directory=None))
+
+    return {
+        'teams': team_count,
+        'incidents': incident_count,
+        'sequential': measure(run_sequential, teams, incidents),
+        'batch': measure(run_batch, teams, [dict(i) for i in incidents])
+    }
+
+def compare(results, baseline, threshold):
+    """Report latency regressions against a previous run"""
+    previous = {(c['teams'], c['incidents']): c for c in baseline.get('cases', [])}
+    regressions = []
+    for case in results['cases']:
+        old = previous.get((case['teams'], case['incidents']))
+        if not old:
+            continue
+        checks = [
+            ('sequential.p95_ms', case['sequential']['p95_ms'], old['sequential']['p95_ms']),
+            ('batch.solve_ms', case['batch']['solve_ms'], old['batch']['solve_ms']),
+            ('sequential.peak_memory_mb', case['sequential']['peak_memory_mb'], old['sequential']['peak_memory_mb'])
+        ]
+        for metric, new_value, old_value in checks:
+            if old_value and new_value > old_value * (1 + threshold):
+                regressions.append({
+                    'teams': case['teams'],
+                    'incidents': case['incidents'],
+                    'metric': metric,
+                    'baseline': old_value,
+                    'current': new_value
+                })
+        if case['batch']['coverage'] < old['batch']['coverage']:
+            regressions.append({
+                'teams': case['teams'],
+                'incidents': case['incidents'],
+                'metric': 'batch.coverage',
+                'baseline': old['batch']['coverage'],
+                'current': case['batch']['coverage']
+            })
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the resource optimizer on synthetic scenarios')
+    parser.add_argument('--teams', type=int, nargs='+', help='catalogue sizes to run')
+    parser.add_argument('--incidents', type=int, nargs='+', help='concurrent incident counts to run')
+    parser.add_argument('--full', action='store_true', help='run the full 50k team x 5k incident grid')
+    parser.add_argument('--countries', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare against a previous JSON result')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='relative slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    team_counts = args.teams or (FULL_TEAM_COUNTS if args.full else DEFAULT_TEAM_COUNTS)
+    incident_counts = args.incidents or (FULL_INCIDENT_COUNTS if args.full else DEFAULT_INCIDENT_COUNTS)
+
+    results = {
+        'benchmark': 'resource-optimizer',
+        'created_at': datetime.now().isoformat(),
+        'seed': args.seed,
+        'cases': []
+    }
+    for team_count in team_counts:
+        for incident_count in incident_counts:
+            case = run_case(team_count, incident_count, args.seed, args.countries)
+            results['cases'].append(case)
+            seq, batch = case['sequential'], case['batch']
+            print(f"teams={team_count:>6} incidents={incident_count:>5}  "
+                  f"seq p50={seq['p50_ms']:.2f}ms p95={seq['p95_ms']:.2f}ms p99={seq['p99_ms']:.2f}ms "
+                  f"cov={seq['coverage']:.2f} dup={seq['double_allocated_teams']}  "
+                  f"batch {batch['solve_ms']:.0f}ms cov={batch['coverage']:.2f} "
+                  f"mem={max(seq['peak_memory_mb'], batch['peak_memory_mb']):.1f}MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"REGRESSION teams={r['teams']} incidents={r['incidents']} {r['metric']}: "
+                  f"{r['baseline']} -> {r['current']}")
+        return 1 if regressions else 0
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
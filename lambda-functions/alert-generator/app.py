@@ -1,14 +1,68 @@
+import os
 import json
+import time
 import boto3
 import logging
 from datetime import datetime
 
+import outbox
+import channels
+import templates
+import digest
+import escalation
+import public_alerts
+from dispatcher import AlertDispatcher, DELIVERED_STATUSES
+from rate_limiter import TokenBucketLimiter
+from suppression import AlertSuppressor, incident_cluster
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 sns = boto3.client('sns')
 dynamodb = boto3.resource('dynamodb')
 
+SUPPRESSION_TABLE = os.environ.get('SUPPRESSION_TABLE', 'AlertSuppression')
+SUPPRESSION_WINDOW_SECONDS = int(os.environ.get('SUPPRESSION_WINDOW_SECONDS', '900'))
+RATE_LIMIT_TABLE = os.environ.get('RATE_LIMIT_TABLE', 'AlertRateLimits')
+
+# Concurrent sends allowed per channel
+CHANNEL_CONCURRENCY = {
+    'SMS': 8,
+    'EMAIL': 16,
+    'PUSH': 16,
+    'RADIO': 2
+}
+
+# Workers per channel kept back for CRITICAL and HIGH alerts, out of the above
+CHANNEL_RESERVED_CONCURRENCY = {
+    'SMS': 2,
+    'EMAIL': 4,
+    'PUSH': 4,
+    'RADIO': 1
+}
+
+# Alerts per API call: SNS PublishBatch takes 10, SES bulk email 50 destinations
+CHANNEL_BATCH_SIZES = {
+    'SMS': channels.SNS_BATCH_SIZE,
+    'PUSH': channels.SNS_BATCH_SIZE,
+    'EMAIL': channels.SES_BATCH_SIZE,
+    'RADIO': 1
+}
+
+# Provider sends allowed per second for each channel and country, across all containers
+CHANNEL_RATE_LIMITS = {
+    'SMS': 20,
+    'EMAIL': 14,
+    'PUSH': 100
+}
+
+# Time kept back from the Lambda deadline to log and respond
+DEADLINE_MARGIN_SECONDS = 2
+DEFAULT_SEND_SECONDS = 25
+
+_dispatcher = {'dispatcher': None}
+_suppressor = AlertSuppressor(SUPPRESSION_TABLE, SUPPRESSION_WINDOW_SECONDS)
+
 def lambda_handler(event, context):
     """
     Multi-level emergency alerting with specialized team coordination
@@ -25,13 +79,45 @@ def lambda_handler(event, context):
         affected_countries = body.get('affected_countries', [])
         
         # Generate alerts
-        alerts = generate_alerts(incident_id, alert_level, affected_countries)
+        alerts = generate_alerts(incident_id, alert_level, affected_countries, body.get('language'))
+        
+        # Public safety alert to every subscriber in the affected area
+        area = public_alerts.area_alert(body, alert_level)
+        if area:
+            alerts.append(area)
+        
+        # Collapse repeats of alerts already sent for the same incident cluster
+        to_send, suppressed = alerts, []
+        if not body.get('bypass_suppression'):
+            to_send, suppressed = _suppressor.filter(alerts, incident_cluster(body))
+        
+        # Wait for acknowledgements of alerts that need one, escalating if none comes
+        escalation.track([a for a in to_send if a['channel'] != public_alerts.AREA_CHANNEL])
+        
+        # MEDIUM and LOW email and push wait for their group's next digest
+        buffered_alerts = 0
+        digestable = [] if body.get('immediate') else [a for a in to_send if digest.is_digestable(a)]
+        if digestable:
+            unbuffered = digest.buffer(digestable)
+            buffered_alerts = len(digestable) - len(unbuffered)
+            to_send = [a for a in to_send if not digest.is_digestable(a)] + unbuffered
         
-        # Send alerts
-        sent_alerts = send_alerts(alerts)
+        # Hand alerts to the outbox; the outbox worker sends and retries them.
+        # Alerts the queue rejects are sent directly rather than dropped.
+        deadline = send_deadline(context)
+        not_queued = outbox.enqueue_alerts(to_send, deadline)
+        results = send_alerts(not_queued, deadline) if not_queued else []
+        queued_alerts = len(to_send) - len(not_queued)
+        sent_alerts = sum(1 for r in results if r['status'] == 'SENT')
+        
+        # Alerts that never went out must not hold their suppression window;
+        # ones still in flight at the deadline may well have gone out
+        undelivered = [r['alert'] for r in results if r['status'] not in DELIVERED_STATUSES]
+        if undelivered and not body.get('bypass_suppression'):
+            _suppressor.release(undelivered, incident_cluster(body))
         
         # Log alert activity
-        log_alert_activity(incident_id, alerts, sent_alerts)
+        log_alert_activity(incident_id, alerts, buffered_alerts + queued_alerts + sent_alerts)
         
         return {
             'statusCode': 200,
@@ -39,7 +125,13 @@ def lambda_handler(event, context):
             'body': json.dumps({
                 'alert_id': f"ALERT-{incident_id}",
                 'alerts_generated': len(alerts),
+                'alerts_queued': queued_alerts,
+                'alerts_buffered': buffered_alerts,
                 'alerts_sent': sent_alerts,
+                'alerts_suppressed': len(suppressed),
+                'alerts_failed': sum(1 for r in results if r['status'] == 'FAILED'),
+                'alerts_timed_out': sum(1 for r in results if r['status'] == 'TIMED_OUT'),
+                'alerts_in_flight': sum(1 for r in results if r['status'] == 'IN_FLIGHT'),
                 'status': 'COMPLETED'
             })
         }
@@ -52,86 +144,79 @@ def lambda_handler(event, context):
             'body': json.dumps({'error': str(e)})
         }
 
-def generate_alerts(incident_id, alert_level, affected_countries):
+def generate_alerts(incident_id, alert_level, affected_countries, language=None):
     """Generate appropriate alerts based on level and countries"""
     
-    alert_templates = {
-        'CRITICAL': {
-            'message': f"🚨 CRITICAL CROSS-BORDER INCIDENT: {incident_id}. Immediate coordination required.",
-            'recipients': ['emergency_coordinators', 'border_authorities', 'environmental_agencies'],
-            'channels': ['SMS', 'EMAIL', 'PUSH', 'RADIO']
-        },
-        'HIGH': {
-            'message': f"⚠️ HIGH PRIORITY INCIDENT: {incident_id}. Cross-border coordination initiated.",
-            'recipients': ['emergency_coordinators', 'environmental_agencies'],
-            'channels': ['SMS', 'EMAIL', 'PUSH']
-        },
-        'MEDIUM': {
-            'message': f"📋 INCIDENT ALERT: {incident_id}. Monitoring and coordination in progress.",
-            'recipients': ['emergency_coordinators'],
-            'channels': ['EMAIL', 'PUSH']
-        },
-        'LOW': {
-            'message': f"ℹ️ INCIDENT NOTIFICATION: {incident_id}. Standard response protocols activated.",
-            'recipients': ['emergency_coordinators'],
-            'channels': ['EMAIL']
-        }
-    }
-    
-    template = alert_templates.get(alert_level, alert_templates['MEDIUM'])
+    policy = templates.level_policy(alert_level)
     
     alerts = []
     for country in affected_countries:
-        for recipient_type in template['recipients']:
-            for channel in template['channels']:
+        country_language = templates.language_for(country, language)
+        for recipient_type in policy['recipients']:
+            for channel in policy['channels']:
                 alerts.append({
+                    'incident_id': incident_id,
                     'country': country,
                     'recipient_type': recipient_type,
                     'channel': channel,
-                    'message': template['message'],
+                    'language': country_language,
+                    'message': templates.render(incident_id, alert_level, country_language, channel),
                     'priority': alert_level,
                     'timestamp': datetime.now().isoformat()
                 })
     
     return alerts
 
-def send_alerts(alerts):
-    """Send alerts through various channels"""
-    sent_count = 0
+def send_deadline(context):
+    """Monotonic time by which all sends must finish"""
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        seconds = context.get_remaining_time_in_millis() / 1000 - DEADLINE_MARGIN_SECONDS
+    else:
+        seconds = DEFAULT_SEND_SECONDS
+    return time.monotonic() + max(seconds, 0)
+
+def get_dispatcher():
+    """Per-channel dispatcher, kept for warm invocations"""
+    if _dispatcher['dispatcher'] is None:
+        _dispatcher['dispatcher'] = AlertDispatcher({
+            'SMS': channels.send_sns_alerts,
+            'EMAIL': channels.send_email_alerts,
+            'PUSH': channels.send_sns_alerts,
+            'RADIO': send_radio_alerts
+        }, CHANNEL_CONCURRENCY, CHANNEL_BATCH_SIZES,
+            limiter=TokenBucketLimiter(RATE_LIMIT_TABLE, CHANNEL_RATE_LIMITS),
+            reserved=CHANNEL_RESERVED_CONCURRENCY)
+    return _dispatcher['dispatcher']
+
+def send_alerts(alerts, deadline=None):
+    """Send alerts through various channels concurrently, returning a result per alert"""
+    if deadline is None:
+        deadline = time.monotonic() + DEFAULT_SEND_SECONDS
+    
+    results = get_dispatcher().dispatch(alerts, deadline)
     
+    for result in results:
+        alert = result['alert']
+        if result['status'] == 'SENT':
+            logger.info(f"Sent {alert['channel']} alert to {alert['country']} {alert['recipient_type']}")
+        elif result['status'] == 'TIMED_OUT':
+            logger.warning(f"Timed out sending {alert['channel']} alert to {alert['country']} {alert['recipient_type']}")
+        elif result['status'] == 'IN_FLIGHT':
+            logger.warning(f"Still sending {alert['channel']} alert to {alert['country']} {alert['recipient_type']} "
+                           f"at the deadline; not sending it again")
+    
+    return results
+
+def send_radio_alerts(alerts, deadline):
+    """Send radio alerts one by one; radio systems have no batch interface"""
+    errors = []
     for alert in alerts:
         try:
-            if alert['channel'] == 'SMS':
-                send_sms_alert(alert)
-            elif alert['channel'] == 'EMAIL':
-                send_email_alert(alert)
-            elif alert['channel'] == 'PUSH':
-                send_push_alert(alert)
-            elif alert['channel'] == 'RADIO':
-                send_radio_alert(alert)
-            
-            sent_count += 1
-            logger.info(f"Sent {alert['channel']} alert to {alert['country']} {alert['recipient_type']}")
-            
+            send_radio_alert(alert)
+            errors.append(None)
         except Exception as e:
-            logger.error(f"Failed to send alert: {str(e)}")
-    
-    return sent_count
-
-def send_sms_alert(alert):
-    """Send SMS alert"""
-    # In real implementation, use SNS SMS
-    logger.info(f"SMS Alert: {alert['message']}")
-
-def send_email_alert(alert):
-    """Send email alert"""
-    # In real implementation, use SES
-    logger.info(f"Email Alert: {alert['message']}")
-
-def send_push_alert(alert):
-    """Send push notification"""
-    # In real implementation, use SNS mobile push
-    logger.info(f"Push Alert: {alert['message']}")
+            errors.append(str(e))
+    return errors
 
 def send_radio_alert(alert):
     """Send radio alert"""
@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import random
+import logging
+
+import boto3
+from botocore.exceptions import ClientError
+
+import outbox
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+sns = boto3.client('sns')
+ses = boto3.client('ses')
+dynamodb = boto3.resource('dynamodb')
+
+ALERTS_TOPIC_ARN = os.environ.get('ALERTS_TOPIC_ARN', '')
+RECIPIENTS_TABLE = os.environ.get('RECIPIENTS_TABLE', 'AlertRecipients')
+EMAIL_SOURCE = os.environ.get('ALERT_EMAIL_SOURCE', '')
+EMAIL_TEMPLATE = os.environ.get('ALERT_EMAIL_TEMPLATE', 'EmergencyAlert')
+
+# API batch limits
+SNS_BATCH_SIZE = 10
+SES_BATCH_SIZE = 50
+SES_MAX_ADDRESSES = 50
+
+MAX_SEND_ATTEMPTS = 3
+RETRY_BASE_SECONDS = 0.1
+RECIPIENT_CACHE_SECONDS = 300
+
+# SES bulk statuses worth retrying; the rest are permanent
+SES_RETRYABLE = {'TransientFailure', 'AccountThrottled', 'Failed'}
+
+# SNS errors worth retrying on a direct publish
+SNS_RETRYABLE = {'Throttling', 'ThrottledException', 'InternalError', 'KMSThrottling'}
+
+_recipient_cache = {}
+
+def with_retries(send_batch, alerts, deadline):
+    """
+    Send a batch and retry only the entries that failed transiently, with
+    exponential backoff and jitter. ``send_batch(alerts)`` returns
+    ({index: error}, retryable_indexes). Returns one error (or None) per alert.
+    """
+    errors = [None] * len(alerts)
+    pending = list(range(len(alerts)))
+    for attempt in range(MAX_SEND_ATTEMPTS):
+        failed, retryable = send_batch([alerts[i] for i in pending])
+        for k, error in failed.items():
+            errors[pending[k]] = error
+        for k in range(len(pending)):
+            if k not in failed:
+                errors[pending[k]] = None
+
+        pending = [pending[k] for k in sorted(retryable)]
+        if not pending:
+            break
+        backoff = random.uniform(0, RETRY_BASE_SECONDS * (2 ** attempt))
+        if time.monotonic() + backoff >= deadline:
+            break
+        time.sleep(backoff)
+        logger.info(f"Retrying {len(pending)} failed alert entries (attempt {attempt + 2})")
+    return errors
+
+def message_attributes(alert):
+    """SNS attributes subscribers filter on"""
+    return {
+        'channel': {'DataType': 'String', 'StringValue': alert['channel']},
+        'country': {'DataType': 'String', 'StringValue': alert['country']},
+        'recipient_type': {'DataType': 'String', 'StringValue': alert['recipient_type']},
+        'priority': {'DataType': 'String', 'StringValue': alert['priority']}
+    }
+
+def publish_batch(alerts):
+    """One SNS PublishBatch call (at most 10 alerts)"""
+    entries = [{
+        'Id': str(k),
+        'Message': alert['message'],
+        'MessageAttributes': message_attributes(alert)
+    } for k, alert in enumerate(alerts)]
+
+    try:
+        response = sns.publish_batch(TopicArn=ALERTS_TOPIC_ARN, PublishBatchRequestEntries=entries)
+    except Exception as e:
+        # Whole call failed (throttled, network): every entry is retryable
+        return {k: str(e) for k in range(len(alerts))}, set(range(len(alerts)))
+
+    failed, retryable = {}, set()
+    for entry in response.get('Failed', []):
+        k = int(entry['Id'])
+        failed[k] = f"{entry.get('Code')}: {entry.get('Message', '')}"
+        if not entry.get('SenderFault'):
+            retryable.add(k)
+    return failed, retryable
+
+def publish_direct(alerts):
+    """
+    Publish alerts addressed to one subscriber each: SMS to a phone number,
+    push to a platform endpoint. SNS has no batch call for these.
+    """
+    failed, retryable = {}, set()
+    for k, alert in enumerate(alerts):
+        target = {'PhoneNumber': alert['endpoint']} if alert['channel'] == 'SMS' else {'TargetArn': alert['endpoint']}
+        try:
+            sns.publish(Message=alert['message'], **target)
+        except ClientError as e:
+            failed[k] = f"{e.response['Error']['Code']}: {e.response['Error'].get('Message', '')}"
+            if e.response['Error']['Code'] in SNS_RETRYABLE:
+                retryable.add(k)
+        except Exception as e:
+            failed[k] = str(e)
+            retryable.add(k)
+    return failed, retryable
+
+def send_sns_alerts(alerts, deadline):
+    """
+    Publish SMS or push alerts: group alerts to the alerts topic in batches
+    of 10, subscriber alerts directly to their endpoint
+    """
+    errors = [None] * len(alerts)
+    for send_batch, indexes in (
+        (publish_batch, [i for i, alert in enumerate(alerts) if not alert.get('endpoint')]),
+        (publish_direct, [i for i, alert in enumerate(alerts) if alert.get('endpoint')])
+    ):
+        for k in range(0, len(indexes), SNS_BATCH_SIZE):
+            batch = indexes[k:k + SNS_BATCH_SIZE]
+            for i, error in zip(batch, with_retries(send_batch, [alerts[i] for i in batch], deadline)):
+                errors[i] = error
+    return errors
+
+def recipient_addresses(country, recipient_type):
+    """Email addresses of a recipient group, cached in the container"""
+    key = f"{country}#{recipient_type}"
+    cached = _recipient_cache.get(key)
+    now = time.monotonic()
+    if cached and now - cached[0] < RECIPIENT_CACHE_SECONDS:
+        return cached[1]
+
+    try:
+        item = dynamodb.Table(RECIPIENTS_TABLE).get_item(Key={'group_key': key}).get('Item') or {}
+        addresses = list(item.get('email_addresses', []))
+    except Exception as e:
+        logger.error(f"Failed to load recipients for {key}: {str(e)}")
+        addresses = cached[1] if cached else []
+
+    _recipient_cache[key] = (now, addresses)
+    return addresses
+
+def send_bulk_email(deliveries):
+    """One SES SendBulkTemplatedEmail call, one destination per (alert, addresses) delivery"""
+    destinations = [{
+        'Destination': {'BccAddresses': addresses},
+        'ReplacementTemplateData': json.dumps({
+            'message': alert['message'],
+            'incident_id': alert.get('incident_id', ''),
+            'priority': alert['priority'],
+            'country': alert['country']
+        })
+    } for alert, addresses in deliveries]
+
+    failed, retryable = {}, set()
+    try:
+        response = ses.send_bulk_templated_email(
+            Source=EMAIL_SOURCE,
+            Template=EMAIL_TEMPLATE,
+            DefaultTemplateData=json.dumps({'message': '', 'incident_id': '', 'priority': '', 'country': ''}),
+            Destinations=destinations
+        )
+    except Exception as e:
+        return {k: str(e) for k in range(len(deliveries))}, set(range(len(deliveries)))
+
+    for k, status in enumerate(response.get('Status', [])):
+        if status.get('Status') != 'Success':
+            failed[k] = f"{status.get('Status')}: {status.get('Error', '')}"
+            if status.get('Status') in SES_RETRYABLE:
+                retryable.add(k)
+    return failed, retryable
+
+def send_email_alerts(alerts, deadline):
+    """
+    Send email alerts through SES bulk templated email. A recipient group
+    larger than SES_MAX_ADDRESSES is split over several destinations, and
+    destinations are sent 50 per call. An alert with ``email_addresses``
+    goes to those addresses instead of its group.
+
+    An alert fails only if none of its destinations was sent. When some
+    were, the alert counts as sent and the addresses of the failed
+    destinations are queued as an alert of their own, so a retry never
+    reaches recipients who already have the email.
+    """
+    errors = [None] * len(alerts)
+    deliveries, owners = [], []
+    for i, alert in enumerate(alerts):
+        addresses = alert.get('email_addresses') or recipient_addresses(alert['country'], alert['recipient_type'])
+        if not addresses:
+            errors[i] = f"No email recipients for {alert['country']} {alert['recipient_type']}"
+            continue
+        for k in range(0, len(addresses), SES_MAX_ADDRESSES):
+            deliveries.append((alert, addresses[k:k + SES_MAX_ADDRESSES]))
+            owners.append(i)
+
+    delivered, failed = set(), {}
+    for start in range(0, len(deliveries), SES_BATCH_SIZE):
+        batch = deliveries[start:start + SES_BATCH_SIZE]
+        for k, error in enumerate(with_retries(send_bulk_email, batch, deadline)):
+            i = owners[start + k]
+            if error is None:
+                delivered.add(i)
+                continue
+            failed.setdefault(i, []).extend(batch[k][1])
+            if errors[i] is None:
+                errors[i] = error
+
+    partial = sorted(i for i in failed if i in delivered)
+    remainders = [dict(alerts[i], email_addresses=failed[i]) for i in partial]
+    not_queued = {id(alert) for alert in outbox.enqueue_alerts(remainders, deadline)} if remainders else set()
+    for i, remainder in zip(partial, remainders):
+        if id(remainder) in not_queued:
+            errors[i] = f"{errors[i]}; {len(failed[i])} addresses not queued for retry"
+            continue
+        logger.warning(f"Queued {alerts[i]['country']} {alerts[i]['recipient_type']} email again for "
+                       f"{len(failed[i])} addresses: {errors[i]}")
+        errors[i] = None
+    return errors
@@ -0,0 +1,186 @@
+"""
+Digest delivery of low priority alerts.
+
+MEDIUM and LOW alerts on digest channels are not sent as they happen.
+They are buffered in the digests table under a time-partitioned key,
+``<minute>#<shard>``, and a scheduled flush sends one consolidated message
+per recipient group (country, recipient type, channel, language) for each
+closed DIGEST_WINDOW_SECONDS window, one minute after it closes. The
+flush queries only the minute partitions of windows that have closed since
+its last run.
+"""
+import os
+import time
+import uuid
+import zlib
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+import outbox
+import templates
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+dynamodb = boto3.resource('dynamodb')
+
+DIGEST_TABLE = os.environ.get('DIGEST_TABLE', 'AlertDigests')
+DIGEST_WINDOW_SECONDS = int(os.environ.get('DIGEST_WINDOW_SECONDS', '900'))
+
+DIGEST_LEVELS = {'MEDIUM', 'LOW'}
+DIGEST_CHANNELS = {'EMAIL', 'PUSH'}
+
+BUCKET_SECONDS = 60
+DIGEST_SHARDS = 4
+
+# Minute partitions one flush works through after an outage
+MAX_BUCKETS_PER_RUN = 240
+
+# Buffered alerts a flush never reached are removed after this long
+BUFFER_TTL_SECONDS = 7 * 86400
+
+# Alert lines listed in one email digest
+MAX_DIGEST_LINES = 50
+
+FLUSH_CURSOR = {'digest_bucket': '__flush__', 'entry_key': 'cursor'}
+
+def is_digestable(alert):
+    """Whether an alert waits for the next digest instead of going out now"""
+    return (alert['priority'] in DIGEST_LEVELS and alert['channel'] in DIGEST_CHANNELS
+            and not alert.get('endpoint'))
+
+def group_key(alert):
+    language = alert.get('language') or templates.DEFAULT_LANGUAGE
+    return f"{alert['country']}#{alert['recipient_type']}#{alert['channel']}#{language}"
+
+def buffer(alerts):
+    """
+    Store alerts for their recipient group's next digest. Returns the
+    alerts that could not be stored, to be sent right away instead.
+    """
+    if not alerts:
+        return []
+    now = time.time()
+    bucket = int(now // BUCKET_SECONDS)
+    try:
+        with dynamodb.Table(DIGEST_TABLE).batch_writer() as batch:
+            for alert in alerts:
+                group = group_key(alert)
+                batch.put_item(Item={
+                    'digest_bucket': f"{bucket}#{zlib.crc32(group.encode()) % DIGEST_SHARDS}",
+                    'entry_key': f"{group}#{alert['timestamp']}#{uuid.uuid4().hex[:8]}",
+                    'group_key': group,
+                    'incident_id': alert['incident_id'],
+                    'country': alert['country'],
+                    'recipient_type': alert['recipient_type'],
+                    'channel': alert['channel'],
+                    'language': alert.get('language') or templates.DEFAULT_LANGUAGE,
+                    'priority': alert['priority'],
+                    'message': alert['message'],
+                    'timestamp': alert['timestamp'],
+                    'expires_at': int(now) + BUFFER_TTL_SECONDS
+                })
+    except Exception as e:
+        logger.error(f"Failed to buffer {len(alerts)} digest alerts: {str(e)}")
+        return alerts
+    return []
+
+def buffered_entries(partition):
+    """Every buffered alert of one partition"""
+    table = dynamodb.Table(DIGEST_TABLE)
+    kwargs = {'KeyConditionExpression': Key('digest_bucket').eq(partition)}
+    entries = []
+    while True:
+        response = table.query(**kwargs)
+        entries.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return entries
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def digest_alert(entries):
+    """One consolidated alert for a recipient group's entries in a window"""
+    entries = sorted(entries, key=lambda e: e['timestamp'])
+    first = entries[0]
+    incident_ids = list(dict.fromkeys(e['incident_id'] for e in entries))
+    header = templates.render_fields('DIGEST', first['language'], first['channel'],
+                                     count=len(entries), minutes=DIGEST_WINDOW_SECONDS // 60)
+
+    if first['channel'] == 'EMAIL':
+        # Identical updates are listed once with how often they came
+        counts = {}
+        for entry in entries:
+            counts[entry['message']] = counts.get(entry['message'], 0) + 1
+        lines = [f"- {message}" + (f" (x{n})" if n > 1 else '') for message, n in counts.items()]
+        if len(lines) > MAX_DIGEST_LINES:
+            lines = lines[:MAX_DIGEST_LINES] + [f"- ... {len(lines) - MAX_DIGEST_LINES} more"]
+        message = '\n'.join([header] + lines)
+    else:
+        limit = templates.CHANNEL_MAX_CHARS.get(first['channel'])
+        message = f"{header} {', '.join(incident_ids)}"
+        if limit and len(message) > limit:
+            message = message[:limit - len(templates.ELLIPSIS)] + templates.ELLIPSIS
+
+    return {
+        'incident_id': incident_ids[0] if len(incident_ids) == 1 else 'DIGEST',
+        'incident_ids': incident_ids,
+        'country': first['country'],
+        'recipient_type': first['recipient_type'],
+        'channel': first['channel'],
+        'language': first['language'],
+        'message': message,
+        'priority': 'MEDIUM' if any(e['priority'] == 'MEDIUM' for e in entries) else 'LOW',
+        'digest_size': len(entries),
+        'timestamp': datetime.now().isoformat()
+    }
+
+def flush_handler(event, context):
+    """
+    Send a digest for every recipient group with alerts buffered in windows
+    that have closed. Runs on a schedule shorter than the window.
+    """
+    deadline = time.monotonic() + (context.get_remaining_time_in_millis() / 1000 - 2 if context else 50)
+    table = dynamodb.Table(DIGEST_TABLE)
+    window_buckets = max(DIGEST_WINDOW_SECONDS // BUCKET_SECONDS, 1)
+    current_bucket = int(time.time() // BUCKET_SECONDS)
+    # A window is flushed once one more bucket has passed after it closed, so
+    # an alert timed just before the boundary and written late is still read
+    closed_through = ((current_bucket - 1) // window_buckets) * window_buckets - 1
+
+    cursor = table.get_item(Key=FLUSH_CURSOR).get('Item', {}).get('last_bucket')
+    first_bucket = int(cursor) + 1 if cursor is not None else closed_through - MAX_BUCKETS_PER_RUN + 1
+    last_bucket = min(closed_through, first_bucket + MAX_BUCKETS_PER_RUN - 1)
+    if last_bucket < first_bucket:
+        return {'digests_sent': 0, 'alerts_digested': 0}
+
+    partitions = [f"{bucket}#{shard}" for bucket in range(first_bucket, last_bucket + 1)
+                  for shard in range(DIGEST_SHARDS)]
+    with ThreadPoolExecutor(max_workers=DIGEST_SHARDS) as pool:
+        entries = [entry for found in pool.map(buffered_entries, partitions) for entry in found]
+
+    # One digest per recipient group per window
+    groups = {}
+    for entry in entries:
+        window = int(entry['digest_bucket'].split('#')[0]) // window_buckets
+        groups.setdefault((window, entry['group_key']), []).append(entry)
+
+    sent = digested = 0
+    done_through = last_bucket
+    with table.batch_writer() as batch:
+        for (window, group), group_entries in sorted(groups.items()):
+            if time.monotonic() >= deadline or outbox.enqueue_alerts([digest_alert(group_entries)], deadline):
+                # Keep the entries, and query their window again next run
+                logger.error(f"Digest of {group} for window {window} not queued; retrying next run")
+                done_through = min(done_through, window * window_buckets - 1)
+                continue
+            sent += 1
+            digested += len(group_entries)
+            for entry in group_entries:
+                batch.delete_item(Key={'digest_bucket': entry['digest_bucket'], 'entry_key': entry['entry_key']})
+
+    table.put_item(Item=dict(FLUSH_CURSOR, last_bucket=done_through))
+    logger.info(f"Sent {sent} digests covering {digested} alerts from {len(partitions)} partitions")
+    return {'digests_sent': sent, 'alerts_digested': digested}
@@ -0,0 +1,187 @@
+import time
+import heapq
+import logging
+import itertools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+PRIORITY_RANKS = {'CRITICAL': 0, 'HIGH': 1, 'MEDIUM': 2, 'LOW': 3}
+
+# Batches ranked at or above this may use a channel's reserved workers
+URGENT_RANK = PRIORITY_RANKS['HIGH']
+
+# Statuses of alerts that were, or may yet be, handed to the provider; they are never re-sent
+DELIVERED_STATUSES = {'SENT', 'IN_FLIGHT'}
+
+class AlertDispatcher:
+    """
+    Sends alerts concurrently with a separate worker pool per channel, so
+    each channel's concurrency is capped on its own and a slow channel
+    never holds workers another channel could use. Alerts are grouped per
+    channel into batches sized for that channel's batch API; each worker
+    sends one batch. Pools are created on first use and kept for warm
+    invocations.
+
+    Batches wait in a heap per channel ordered by priority, then age, and
+    a free worker always takes the most urgent one. ``reserved`` workers
+    of a channel only take CRITICAL and HIGH batches, so a backlog of
+    lower priority sends cannot hold every worker when an urgent alert
+    arrives.
+
+    ``senders`` maps a channel to ``send(alerts, deadline)`` returning one
+    error message (or None) per alert. With a ``limiter``, each batch first
+    takes tokens for its channel and country, so sends are paced to the
+    provider rate shared by every container.
+    """
+
+    def __init__(self, senders, limits, batch_sizes=None, default_limit=4, limiter=None, reserved=None):
+        self.senders = senders
+        self.limits = limits
+        self.batch_sizes = batch_sizes or {}
+        self.default_limit = default_limit
+        self.limiter = limiter
+        self.reserved = reserved or {}
+        self._pools = {}     # channel -> (general pool, reserved pool or None)
+        self._queues = {}    # channel -> heap of (rank, age, sequence, future, alerts, deadline)
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+
+    def pools(self, channel):
+        """General and reserved worker pools for a channel"""
+        with self._lock:
+            if channel not in self._pools:
+                limit = self.limits.get(channel, self.default_limit)
+                reserved = min(self.reserved.get(channel, 0), limit - 1)
+                self._pools[channel] = (
+                    ThreadPoolExecutor(max_workers=limit - reserved,
+                                       thread_name_prefix=f"alert-{channel.lower()}"),
+                    ThreadPoolExecutor(max_workers=reserved,
+                                       thread_name_prefix=f"alert-{channel.lower()}-urgent") if reserved > 0 else None
+                )
+                self._queues[channel] = []
+            return self._pools[channel]
+
+    def submit(self, channel, alerts, deadline):
+        """Queue a batch by priority and age, and wake a worker to take the most urgent batch"""
+        rank = PRIORITY_RANKS.get(alerts[0].get('priority'), len(PRIORITY_RANKS))
+        future = Future()
+        general, urgent = self.pools(channel)
+        with self._lock:
+            heapq.heappush(self._queues[channel],
+                           (rank, alerts[0].get('timestamp', ''), next(self._sequence), future, alerts, deadline))
+        general.submit(self.run_next, channel, None)
+        if urgent is not None and rank <= URGENT_RANK:
+            urgent.submit(self.run_next, channel, URGENT_RANK)
+        return future
+
+    def run_next(self, channel, max_rank):
+        """Send the most urgent queued batch of a channel, if it ranks at or above ``max_rank``"""
+        with self._lock:
+            queue = self._queues[channel]
+            while queue and queue[0][3].cancelled():
+                heapq.heappop(queue)
+            if not queue or (max_rank is not None and queue[0][0] > max_rank):
+                return
+            _, _, _, future, alerts, deadline = heapq.heappop(queue)
+            if not future.set_running_or_notify_cancel():
+                return
+
+        try:
+            future.set_result(self.send_batch(channel, alerts, deadline))
+        except Exception as e:
+            future.set_exception(e)
+
+    def dispatch(self, alerts, deadline):
+        """
+        Send every alert before ``deadline`` (a time.monotonic() value).
+        Returns one result per alert, in order: {'alert', 'status', 'error',
+        'latency_ms'} with status SENT, FAILED, TIMED_OUT (never handed to
+        the provider, safe to send again) or IN_FLIGHT (its provider call
+        was still running at the deadline and may well succeed).
+        """
+        results = [None] * len(alerts)
+        by_channel = {}
+        for i, alert in enumerate(alerts):
+            if alert['channel'] not in self.senders:
+                results[i] = {'alert': alert, 'status': 'FAILED',
+                              'error': f"Unknown channel {alert['channel']}", 'latency_ms': 0.0}
+                continue
+            by_channel.setdefault(alert['channel'], []).append(i)
+
+        futures = {}
+        for channel, indexes in by_channel.items():
+            # Batch alerts of like priority together so urgent ones are not held by a low priority batch
+            indexes.sort(key=lambda i: (PRIORITY_RANKS.get(alerts[i].get('priority'), len(PRIORITY_RANKS)),
+                                        alerts[i].get('timestamp', '')))
+            size = self.batch_sizes.get(channel, 1)
+            for k in range(0, len(indexes), size):
+                batch = indexes[k:k + size]
+                futures[self.submit(channel, [alerts[i] for i in batch], deadline)] = batch
+
+        wait(futures, timeout=max(deadline - time.monotonic(), 0))
+
+        for future, batch in futures.items():
+            if future.done() and not future.cancelled():
+                if future.exception() is None:
+                    for i, result in zip(batch, future.result()):
+                        results[i] = result
+                else:
+                    for i in batch:
+                        results[i] = {'alert': alerts[i], 'status': 'FAILED',
+                                      'error': str(future.exception()), 'latency_ms': None}
+                continue
+            # Queued batches are dropped; one already in flight finishes in the background
+            if future.cancel():
+                status, error = 'TIMED_OUT', 'Deadline exceeded'
+            else:
+                status, error = 'IN_FLIGHT', 'Deadline exceeded while sending'
+            for i in batch:
+                results[i] = {'alert': alerts[i], 'status': status, 'error': error, 'latency_ms': None}
+        return results
+
+    def send_batch(self, channel, alerts, deadline):
+        """Run one channel send, unless the deadline passed while it was queued"""
+        start = time.monotonic()
+        if start >= deadline:
+            return [{'alert': alert, 'status': 'TIMED_OUT', 'error': 'Deadline exceeded', 'latency_ms': 0.0}
+                    for alert in alerts]
+
+        results = [None] * len(alerts)
+        allowed = self.pace(channel, alerts, deadline)
+        for i in range(len(alerts)):
+            if i not in allowed:
+                results[i] = {'alert': alerts[i], 'status': 'TIMED_OUT',
+                              'error': 'Rate limit not available before deadline', 'latency_ms': None}
+        if not allowed:
+            return results
+
+        sending = [alerts[i] for i in allowed]
+        try:
+            errors = self.senders[channel](sending, deadline)
+        except Exception as e:
+            logger.error(f"Failed to send {len(sending)} {channel} alerts: {str(e)}")
+            errors = [str(e)] * len(sending)
+
+        latency_ms = round((time.monotonic() - start) * 1000, 2)
+        for i, error in zip(allowed, errors):
+            results[i] = {'alert': alerts[i], 'status': 'FAILED' if error else 'SENT',
+                          'error': error, 'latency_ms': latency_ms}
+        return results
+
+    def pace(self, channel, alerts, deadline):
+        """Indexes of the alerts in a batch that got rate limit tokens"""
+        if self.limiter is None:
+            return list(range(len(alerts)))
+
+        by_country = {}
+        for i, alert in enumerate(alerts):
+            by_country.setdefault(alert['country'], []).append(i)
+
+        allowed = []
+        for country, indexes in by_country.items():
+            granted = self.limiter.acquire(channel, country, len(indexes), deadline)
+            allowed.extend(indexes[:granted])
+        return sorted(allowed)
@@ -0,0 +1,364 @@
+"""
+Acknowledgement tracking and escalation of unacknowledged alerts.
+
+Alerts of a level in ACK_TIMEOUT_SECONDS must be acknowledged per
+(incident, country, recipient type). Each pending acknowledgement has an
+item in the acknowledgements table and a timer in the timers table,
+partitioned by the minute it is due and a shard: ``<minute>#<shard>``. The
+scheduler runs every minute and queries only the partitions that have come
+due since its last run, so the cost of a run follows the timers due, not
+the timers pending. A due timer whose acknowledgement is still pending
+escalates one step along ESCALATION_STEPS: louder channels first, then
+the next recipient tier.
+"""
+import os
+import json
+import time
+import zlib
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+import outbox
+import templates
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+dynamodb = boto3.resource('dynamodb')
+dynamodb_client = boto3.client('dynamodb')
+
+ACKNOWLEDGEMENTS_TABLE = os.environ.get('ACKNOWLEDGEMENTS_TABLE', 'AlertAcknowledgements')
+TIMERS_TABLE = os.environ.get('ESCALATION_TIMERS_TABLE', 'AlertEscalationTimers')
+
+# Seconds an alert of each level waits for an acknowledgement before escalating
+ACK_TIMEOUT_SECONDS = {
+    'CRITICAL': 300,
+    'HIGH': 900
+}
+
+# Each step re-alerts on more channels or a higher recipient tier, then waits again
+ESCALATION_STEPS = [
+    {'recipient_type': None, 'channels': ['SMS', 'PUSH', 'RADIO'], 'wait_seconds': 300},
+    {'recipient_type': 'regional_supervisors', 'channels': ['SMS', 'EMAIL', 'PUSH'], 'wait_seconds': 600},
+    {'recipient_type': 'national_authorities', 'channels': ['SMS', 'EMAIL', 'PUSH', 'RADIO'], 'wait_seconds': 900}
+]
+
+BUCKET_SECONDS = 60
+TIMER_SHARDS = 8
+
+# Buckets one scheduler run works through after an outage
+MAX_BUCKETS_PER_RUN = 120
+
+# Timers left behind are removed this long after they were due
+TIMER_TTL_SECONDS = 86400
+
+SCHEDULER_KEY = '__scheduler__'
+
+def ack_key(incident_id, country, recipient_type):
+    return f"{incident_id}#{country}#{recipient_type}"
+
+def timer_partition(due_at, key):
+    """Minute bucket and shard a timer is stored under"""
+    return f"{int(due_at // BUCKET_SECONDS)}#{zlib.crc32(key.encode()) % TIMER_SHARDS}"
+
+def timer_put(key, due_at, step):
+    """TransactWriteItems Put of a timer"""
+    return {
+        'Put': {
+            'TableName': TIMERS_TABLE,
+            'Item': {
+                'timer_bucket': {'S': timer_partition(due_at, key)},
+                'ack_key': {'S': key},
+                'due_at': {'N': str(int(due_at))},
+                'step': {'N': str(step)},
+                'expires_at': {'N': str(int(due_at) + TIMER_TTL_SECONDS)}
+            }
+        }
+    }
+
+def track(alerts):
+    """
+    Start waiting for acknowledgements of the alerts that need one. Tags
+    each such alert with its ``ack_key``. The acknowledgement and its timer
+    are written in one transaction, so nothing is pending without a timer.
+    A key already pending keeps its timer.
+    """
+    now = time.time()
+    started = {}
+    for alert in alerts:
+        timeout = ACK_TIMEOUT_SECONDS.get(alert['priority'])
+        if timeout is None:
+            continue
+        key = ack_key(alert['incident_id'], alert['country'], alert['recipient_type'])
+        alert['ack_key'] = key
+        if key in started:
+            continue
+        started[key] = True
+
+        try:
+            dynamodb_client.transact_write_items(TransactItems=[{
+                'Put': {
+                    'TableName': ACKNOWLEDGEMENTS_TABLE,
+                    'Item': {
+                        'ack_key': {'S': key},
+                        'incident_id': {'S': str(alert['incident_id'])},
+                        'country': {'S': alert['country']},
+                        'recipient_type': {'S': alert['recipient_type']},
+                        'alert_level': {'S': alert['priority']},
+                        'language': {'S': alert.get('language') or templates.DEFAULT_LANGUAGE},
+                        'status': {'S': 'PENDING'},
+                        'step': {'N': '0'},
+                        'timer_bucket': {'S': timer_partition(now + timeout, key)},
+                        'created_at': {'S': datetime.now().isoformat()}
+                    },
+                    'ConditionExpression': 'attribute_not_exists(ack_key) OR #status <> :pending',
+                    'ExpressionAttributeNames': {'#status': 'status'},
+                    'ExpressionAttributeValues': {':pending': {'S': 'PENDING'}}
+                }
+            }, timer_put(key, now + timeout, 0)])
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                logger.error(f"Failed to track acknowledgement {key}: {str(e)}")
+        except Exception as e:
+            logger.error(f"Failed to track acknowledgement {key}: {str(e)}")
+    return len(started)
+
+def acknowledge(key, acknowledged_by=None):
+    """Mark an acknowledgement received. Returns the item, or None if unknown."""
+    try:
+        response = dynamodb.Table(ACKNOWLEDGEMENTS_TABLE).update_item(
+            Key={'ack_key': key},
+            UpdateExpression='SET #status = :acked, acknowledged_at = :at, acknowledged_by = :by',
+            ConditionExpression='attribute_exists(ack_key) AND ack_key <> :scheduler',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={
+                ':acked': 'ACKNOWLEDGED',
+                ':at': datetime.now().isoformat(),
+                ':by': acknowledged_by or 'unknown',
+                ':scheduler': SCHEDULER_KEY
+            },
+            ReturnValues='ALL_OLD'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return None
+        raise
+
+    previous = response.get('Attributes', {})
+    if previous.get('status') == 'PENDING' and previous.get('timer_bucket'):
+        # The scheduler skips acknowledged timers anyway; this only saves it the read
+        try:
+            dynamodb.Table(TIMERS_TABLE).delete_item(Key={'timer_bucket': previous['timer_bucket'], 'ack_key': key})
+        except Exception as e:
+            logger.warning(f"Failed to delete timer of {key}: {str(e)}")
+    return previous
+
+def acknowledge_handler(event, context):
+    """POST /alerts/acknowledge with an ack_key, or incident_id, country and recipient_type"""
+    try:
+        body = json.loads(event['body']) if 'body' in event else event
+        key = body.get('ack_key') or ack_key(body.get('incident_id'), body.get('country'), body.get('recipient_type'))
+        previous = acknowledge(key, body.get('acknowledged_by'))
+        if previous is None:
+            return {
+                'statusCode': 404,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': f"No alert awaiting acknowledgement for {key}"})
+            }
+        return {
+            'statusCode': 200,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'ack_key': key,
+                'status': 'ACKNOWLEDGED',
+                'previous_status': previous.get('status'),
+                'escalation_step': int(previous.get('step', 0))
+            })
+        }
+    except Exception as e:
+        logger.error(f"Acknowledgement error: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)})
+        }
+
+def due_timers(partition, now):
+    """Timers of one partition that are due"""
+    table = dynamodb.Table(TIMERS_TABLE)
+    kwargs = {'KeyConditionExpression': Key('timer_bucket').eq(partition)}
+    timers = []
+    while True:
+        response = table.query(**kwargs)
+        timers.extend(item for item in response.get('Items', []) if item['due_at'] <= now)
+        if 'LastEvaluatedKey' not in response:
+            return timers
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def load_acknowledgements(keys):
+    """{ack_key: item} for many keys, 100 per BatchGetItem"""
+    items = {}
+    keys = list(keys)
+    for i in range(0, len(keys), 100):
+        request = {ACKNOWLEDGEMENTS_TABLE: {'Keys': [{'ack_key': k} for k in keys[i:i + 100]]}}
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response['Responses'].get(ACKNOWLEDGEMENTS_TABLE, []):
+                items[item['ack_key']] = item
+            request = response.get('UnprocessedKeys')
+    return items
+
+def queued_marker(step_number, channel):
+    """Entry of an item's ``queued_channels`` set for a step's alert on a channel"""
+    return f"{step_number}#{channel}"
+
+def escalation_alerts(item, step):
+    """
+    Alerts one escalation step sends for an unacknowledged item, leaving out
+    channels an earlier, partly failed attempt at the same step already queued
+    """
+    recipient_type = step['recipient_type'] or item['recipient_type']
+    step_number = int(item['step']) + 1
+    queued = item.get('queued_channels') or set()
+    return [{
+        'incident_id': item['incident_id'],
+        'country': item['country'],
+        'recipient_type': recipient_type,
+        'channel': channel,
+        'language': item['language'],
+        'message': templates.render(item['incident_id'], item['alert_level'], item['language'], channel),
+        'priority': item['alert_level'],
+        'ack_key': item['ack_key'],
+        'escalation_step': step_number,
+        'timestamp': datetime.now().isoformat()
+    } for channel in step['channels'] if queued_marker(step_number, channel) not in queued]
+
+def record_queued(item, alerts):
+    """
+    Note on a pending item which of a step's alerts were queued, so that
+    retrying the step does not queue them again
+    """
+    try:
+        dynamodb.Table(ACKNOWLEDGEMENTS_TABLE).update_item(
+            Key={'ack_key': item['ack_key']},
+            UpdateExpression='ADD queued_channels :queued',
+            ConditionExpression='#status = :pending AND step = :current',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={
+                ':queued': {queued_marker(a['escalation_step'], a['channel']) for a in alerts},
+                ':pending': 'PENDING',
+                ':current': int(item['step'])
+            }
+        )
+    except Exception as e:
+        logger.error(f"Failed to record queued escalation alerts of {item['ack_key']}: {str(e)}")
+
+def escalate(item, now, deadline):
+    """
+    Move an unacknowledged item one step up. The step's alerts are queued
+    first and raise if they cannot be, leaving the due timer in place for
+    the next run; the channels that were queued are recorded on the item
+    and skipped when the step is retried. The step then advances together with its new timer in one
+    transaction, conditional on the step not having been taken already, so
+    an item is never left on a step without a timer. Returns whether this
+    run escalated it.
+    """
+    current = int(item['step'])
+    if current >= len(ESCALATION_STEPS):
+        dynamodb.Table(ACKNOWLEDGEMENTS_TABLE).update_item(
+            Key={'ack_key': item['ack_key']},
+            UpdateExpression='SET #status = :exhausted REMOVE timer_bucket',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':exhausted': 'UNACKNOWLEDGED'}
+        )
+        logger.error(f"Alert {item['ack_key']} unacknowledged after every escalation step")
+        return False
+
+    step = ESCALATION_STEPS[current]
+    due_at = now + step['wait_seconds']
+    alerts = escalation_alerts(item, step)
+    not_queued = outbox.enqueue_alerts(alerts, deadline)
+    if not_queued:
+        queued = [a for a in alerts if all(a is not n for n in not_queued)]
+        if queued:
+            record_queued(item, queued)
+        raise RuntimeError(f"{len(not_queued)} escalation alerts not queued")
+
+    try:
+        dynamodb_client.transact_write_items(TransactItems=[timer_put(item['ack_key'], due_at, current + 1), {
+            'Update': {
+                'TableName': ACKNOWLEDGEMENTS_TABLE,
+                'Key': {'ack_key': {'S': item['ack_key']}},
+                'UpdateExpression': 'SET step = :next, timer_bucket = :bucket, escalated_at = :at',
+                'ConditionExpression': '#status = :pending AND step = :current',
+                'ExpressionAttributeNames': {'#status': 'status'},
+                'ExpressionAttributeValues': {
+                    ':next': {'N': str(current + 1)},
+                    ':bucket': {'S': timer_partition(due_at, item['ack_key'])},
+                    ':at': {'S': datetime.now().isoformat()},
+                    ':pending': {'S': 'PENDING'},
+                    ':current': {'N': str(current)}
+                }
+            }
+        }])
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'TransactionCanceledException':
+            raise
+        reasons = e.response.get('CancellationReasons', [])
+        if not any(reason.get('Code') == 'ConditionalCheckFailed' for reason in reasons):
+            raise
+        # Acknowledged or escalated by an overlapping run since the item was read
+        logger.warning(f"Step {current + 1} of {item['ack_key']} already taken; its alerts were queued again")
+        return False
+
+    logger.info(f"Escalated {item['ack_key']} to step {current + 1}")
+    return True
+
+def scheduler_handler(event, context):
+    """
+    Escalate every unacknowledged alert whose timer has come due. Runs on
+    a one minute schedule.
+    """
+    now = time.time()
+    deadline = time.monotonic() + (context.get_remaining_time_in_millis() / 1000 - 2 if context else 50)
+    acks = dynamodb.Table(ACKNOWLEDGEMENTS_TABLE)
+    current_bucket = int(now // BUCKET_SECONDS)
+
+    cursor = acks.get_item(Key={'ack_key': SCHEDULER_KEY}).get('Item', {}).get('last_bucket')
+    first_bucket = int(cursor) + 1 if cursor is not None else current_bucket - MAX_BUCKETS_PER_RUN
+    last_bucket = min(current_bucket, first_bucket + MAX_BUCKETS_PER_RUN - 1)
+    partitions = [f"{bucket}#{shard}" for bucket in range(first_bucket, last_bucket + 1)
+                  for shard in range(TIMER_SHARDS)]
+
+    with ThreadPoolExecutor(max_workers=TIMER_SHARDS) as pool:
+        timers = [timer for found in pool.map(lambda p: due_timers(p, now), partitions) for timer in found]
+
+    items = load_acknowledgements({timer['ack_key'] for timer in timers})
+    escalated = 0
+    # The current minute may still gain due timers; it is queried again next run
+    done_through = min(last_bucket, current_bucket - 1)
+    with dynamodb.Table(TIMERS_TABLE).batch_writer() as batch:
+        for timer in timers:
+            item = items.get(timer['ack_key'])
+            # Skip timers of acknowledged alerts, and stale ones from a step already taken
+            if item and item.get('status') == 'PENDING' and int(item['step']) == int(timer['step']) \
+                    and item.get('timer_bucket') == timer['timer_bucket']:
+                try:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError('Scheduler deadline reached')
+                    escalated += escalate(item, now, deadline)
+                except Exception as e:
+                    # Leave the timer, and query its partition again next run
+                    logger.error(f"Failed to escalate {timer['ack_key']}: {str(e)}")
+                    done_through = min(done_through, int(timer['timer_bucket'].split('#')[0]) - 1)
+                    continue
+            batch.delete_item(Key={'timer_bucket': timer['timer_bucket'], 'ack_key': timer['ack_key']})
+
+    acks.put_item(Item={'ack_key': SCHEDULER_KEY, 'last_bucket': done_through})
+    logger.info(f"Checked {len(partitions)} timer partitions: {len(timers)} due, {escalated} escalated")
+    return {'timers_due': len(timers), 'escalated': escalated}
@@ -0,0 +1,79 @@
+import os
+import json
+import random
+import logging
+
+import boto3
+
+import channels
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+sqs = boto3.client('sqs')
+
+OUTBOX_QUEUE_URL = os.environ.get('ALERT_OUTBOX_QUEUE_URL', '')
+
+# SQS SendMessageBatch and ChangeMessageVisibilityBatch limit
+QUEUE_BATCH_SIZE = 10
+
+# Redelivery delay after a failed send: exponential from the base, with jitter
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 900
+
+def send_message_batch(alerts):
+    """One SQS SendMessageBatch call (at most 10 alerts)"""
+    entries = [{
+        'Id': str(k),
+        'MessageBody': json.dumps(alert),
+        'MessageAttributes': {
+            'channel': {'DataType': 'String', 'StringValue': alert['channel']},
+            'priority': {'DataType': 'String', 'StringValue': alert['priority']}
+        }
+    } for k, alert in enumerate(alerts)]
+
+    try:
+        response = sqs.send_message_batch(QueueUrl=OUTBOX_QUEUE_URL, Entries=entries)
+    except Exception as e:
+        return {k: str(e) for k in range(len(alerts))}, set(range(len(alerts)))
+
+    failed, retryable = {}, set()
+    for entry in response.get('Failed', []):
+        k = int(entry['Id'])
+        failed[k] = f"{entry.get('Code')}: {entry.get('Message', '')}"
+        if not entry.get('SenderFault'):
+            retryable.add(k)
+    return failed, retryable
+
+def enqueue_alerts(alerts, deadline):
+    """
+    Write alerts to the outbox queue in batches of 10. Returns the alerts
+    that could not be queued.
+    """
+    not_queued = []
+    for i in range(0, len(alerts), QUEUE_BATCH_SIZE):
+        batch = alerts[i:i + QUEUE_BATCH_SIZE]
+        for alert, error in zip(batch, channels.with_retries(send_message_batch, batch, deadline)):
+            if error:
+                logger.error(f"Failed to queue {alert['channel']} alert for {alert['country']}: {error}")
+                not_queued.append(alert)
+    return not_queued
+
+def retry_delay(receive_count):
+    """Seconds before a message is redelivered after its nth failed receive"""
+    ceiling = min(RETRY_BASE_SECONDS * (2 ** (receive_count - 1)), RETRY_MAX_SECONDS)
+    return int(random.uniform(ceiling / 2, ceiling))
+
+def delay_retries(records):
+    """Push failed messages back by their backoff delay"""
+    for i in range(0, len(records), QUEUE_BATCH_SIZE):
+        entries = [{
+            'Id': str(k),
+            'ReceiptHandle': record['receiptHandle'],
+            'VisibilityTimeout': retry_delay(int(record['attributes'].get('ApproximateReceiveCount', 1)))
+        } for k, record in enumerate(records[i:i + QUEUE_BATCH_SIZE])]
+        try:
+            sqs.change_message_visibility_batch(QueueUrl=OUTBOX_QUEUE_URL, Entries=entries)
+        except Exception as e:
+            # The messages still come back after the queue's visibility timeout
+            logger.warning(f"Failed to delay {len(entries)} alert retries: {str(e)}")
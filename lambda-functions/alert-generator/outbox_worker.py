@@ -0,0 +1,45 @@
+import json
+import logging
+
+import outbox
+import public_alerts
+from app import get_dispatcher, send_alerts, send_deadline
+from dispatcher import DELIVERED_STATUSES
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+def lambda_handler(event, context):
+    """
+    Drain the alert outbox: send a batch of queued alerts and hand failed
+    ones back to the queue with a backoff delay. Messages that keep failing
+    move to the dead-letter queue after the queue's maxReceiveCount.
+    Alerts still in flight at the deadline are not handed back, since
+    their send may well succeed. Area alerts are expanded to their
+    subscribers here.
+    """
+    records = event.get('Records', [])
+    alerts = [json.loads(record['body']) for record in records]
+    deadline = send_deadline(context)
+
+    results = [None] * len(records)
+    direct = [i for i, alert in enumerate(alerts) if alert['channel'] != public_alerts.AREA_CHANNEL]
+    for i, result in zip(direct, send_alerts([alerts[i] for i in direct], deadline)):
+        results[i] = result
+    for i, alert in enumerate(alerts):
+        if results[i] is None:
+            # Subscriber sends are not logged one by one
+            results[i] = public_alerts.expand_area(alert, get_dispatcher().dispatch, deadline)
+
+    retry = []
+    for record, result in zip(records, results):
+        if result['status'] in DELIVERED_STATUSES:
+            continue
+        alert = result['alert']
+        logger.warning(f"Retrying {alert['channel']} alert to {alert['country']} {alert['recipient_type']} "
+                       f"(receive {record['attributes'].get('ApproximateReceiveCount')}): {result['error']}")
+        retry.append(record)
+
+    outbox.delay_retries(retry)
+    logger.info(f"Sent {len(records) - len(retry)} of {len(records)} queued alerts")
+    return {'batchItemFailures': [{'itemIdentifier': record['messageId']} for record in retry]}
@@ -0,0 +1,143 @@
+import time
+import logging
+from datetime import datetime
+
+import numpy as np
+
+import outbox
+from dispatcher import DELIVERED_STATUSES
+import templates
+import subscriber_index
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Channel of an alert that stands for every subscriber in an area
+AREA_CHANNEL = 'AREA'
+
+# Subscriber channels used for public alerts by level
+PUBLIC_CHANNELS = {
+    'CRITICAL': ['SMS', 'PUSH'],
+    'HIGH': ['SMS', 'PUSH'],
+    'MEDIUM': ['PUSH'],
+    'LOW': ['PUSH']
+}
+
+# Time kept back from the deadline to queue the rest of an area
+EXPAND_MARGIN_SECONDS = 3
+
+def area_alert(body, alert_level):
+    """
+    Alert for every subscriber in the request's ``public_alert`` area: a
+    ``polygon`` of [lat, lng] vertices (e.g. a downwind plume), or a
+    ``radius_km`` around ``centre`` or the incident location. None when the
+    request has no area. Subscribers get the message in their country's
+    language unless the request sets ``language``.
+    """
+    area = body.get('public_alert')
+    if not area:
+        return None
+
+    if area.get('polygon'):
+        shape = {'polygon': [[float(lat), float(lng)] for lat, lng in area['polygon']]}
+    else:
+        centre = area.get('centre') or body.get('location') or {}
+        if centre.get('latitude') is None or centre.get('longitude') is None or not area.get('radius_km'):
+            raise ValueError('public_alert needs a polygon, or radius_km and a centre or incident location')
+        shape = {'latitude': float(centre['latitude']), 'longitude': float(centre['longitude']),
+                 'radius_km': float(area['radius_km'])}
+
+    return {
+        'incident_id': body.get('incident_id'),
+        'country': 'PUBLIC',
+        'recipient_type': 'subscribers',
+        'channel': AREA_CHANNEL,
+        'channels': area.get('channels') or PUBLIC_CHANNELS.get(alert_level, ['PUSH']),
+        'area': shape,
+        'cursor': 0,
+        'language': body.get('language'),
+        'message': templates.render(body.get('incident_id'), alert_level,
+                                    templates.language_for(None, body.get('language')), 'PUSH'),
+        'priority': alert_level,
+        'timestamp': datetime.now().isoformat()
+    }
+
+def subscriber_alerts(alert, rows):
+    """One alert per matched subscriber row, rendered for the subscriber's language and channel"""
+    alerts = []
+    for row in rows:
+        country = row['country'].decode()
+        channel = subscriber_index.SUBSCRIBER_CHANNELS[row['channel']]
+        language = templates.language_for(country, alert.get('language'))
+        alerts.append({
+            'incident_id': alert['incident_id'],
+            'country': country,
+            'recipient_type': 'public',
+            'channel': channel,
+            'endpoint': row['endpoint'].decode(),
+            'language': language,
+            'message': templates.render(alert['incident_id'], alert['priority'], language, channel),
+            'priority': alert['priority'],
+            'timestamp': alert['timestamp']
+        })
+    return alerts
+
+def expand_area(alert, send_alerts, deadline):
+    """
+    Stream subscribers in an area alert's shape from the index, one chunk
+    at a time, into ``send_alerts``. Subscriber alerts that fail go to the
+    outbox to be retried on their own; those the outbox rejects are given
+    one more try at the end and are otherwise dropped and logged, never
+    failing the area. When the deadline approaches, the rest of the area is
+    queued again with a cursor to resume from.
+
+    Returns a dispatcher-style result for the area alert. It is SENT once
+    every subscriber has been handled or the rest is queued, so the area
+    message is not redelivered to subscribers already sent to. It fails
+    only when no subscriber index is available or the rest of the area
+    could not be queued.
+    """
+    start = time.monotonic()
+    index = subscriber_index.get_index()
+    if index is None:
+        return {'alert': alert, 'status': 'FAILED', 'error': 'No subscriber index available', 'latency_ms': 0.0}
+    area = alert['area']
+    if 'polygon' in area:
+        chunks = index.within_polygon(area['polygon'], start_row=alert.get('cursor', 0))
+    else:
+        chunks = index.within_radius(area['latitude'], area['longitude'], area['radius_km'],
+                                     start_row=alert.get('cursor', 0))
+    codes = [subscriber_index.SUBSCRIBER_CHANNELS.index(c) for c in alert['channels']
+             if c in subscriber_index.SUBSCRIBER_CHANNELS]
+    send_by = deadline - EXPAND_MARGIN_SECONDS
+
+    sent = retried = 0
+    not_queued = []
+    error = None
+    for rows, next_row in chunks:
+        alerts = subscriber_alerts(alert, rows[np.isin(rows['channel'], codes)])
+        results = send_alerts(alerts, send_by) if alerts else []
+        retry = [r['alert'] for r in results if r['status'] not in DELIVERED_STATUSES]
+        sent += len(results) - len(retry)
+        if retry:
+            rejected = outbox.enqueue_alerts(retry, deadline)
+            retried += len(retry) - len(rejected)
+            not_queued.extend(rejected)
+
+        if time.monotonic() >= send_by:
+            if outbox.enqueue_alerts([dict(alert, cursor=next_row)], deadline):
+                error = 'Failed to queue the rest of the area'
+            else:
+                logger.info(f"Queued the rest of area alert {alert['incident_id']} from row {next_row}")
+            break
+
+    if not_queued:
+        dropped = outbox.enqueue_alerts(not_queued, deadline)
+        retried += len(not_queued) - len(dropped)
+        if dropped:
+            logger.error(f"Area alert {alert['incident_id']}: dropped {len(dropped)} subscriber alerts "
+                         f"whose retries could not be queued")
+
+    logger.info(f"Area alert {alert['incident_id']}: sent {sent} subscriber alerts, queued {retried} for retry")
+    return {'alert': alert, 'status': 'FAILED' if error else 'SENT', 'error': error,
+            'latency_ms': round((time.monotonic() - start) * 1000, 2)}
@@ -0,0 +1,121 @@
+import time
+import logging
+import threading
+
+import boto3
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+dynamodb = boto3.resource('dynamodb')
+
+# Share of a window's tokens one container leases at a time
+LEASE_FRACTION = 4
+
+# Window counters are kept this long after the window closes
+COUNTER_TTL_SECONDS = 60
+
+MAX_LEASE_ATTEMPTS = 3
+
+class TokenBucketLimiter:
+    """
+    Distributed token bucket per (channel, country).
+
+    Each bucket refills to ``rates[channel]`` tokens every window. The
+    shared counter for a window is a DynamoDB item that containers take
+    tokens from with a conditional ADD, so the total taken across every
+    container never exceeds the rate. Containers lease tokens in chunks and
+    spend them locally, so most sends need no table call. When the bucket
+    is empty, ``acquire`` waits for the next window.
+
+    If the table is unreachable, a container allows itself one lease per
+    window. It keeps sending, at a reduced rate.
+    """
+
+    def __init__(self, table_name, rates, window_seconds=1.0):
+        self.table_name = table_name
+        self.rates = rates
+        self.window_seconds = window_seconds
+        self._leases = {}    # bucket -> [window, tokens left, more available]
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def lock(self, bucket):
+        """Lock serializing token use of one bucket within the container"""
+        with self._guard:
+            if bucket not in self._locks:
+                self._locks[bucket] = threading.Lock()
+            return self._locks[bucket]
+
+    def lease_size(self, rate):
+        return max(1, rate // LEASE_FRACTION)
+
+    def acquire(self, channel, country, count, deadline):
+        """
+        Take ``count`` tokens for a channel and country, waiting for refills
+        until ``deadline`` (a time.monotonic() value). Returns how many were
+        granted, which is less than ``count`` only when the deadline came
+        first.
+        """
+        rate = self.rates.get(channel)
+        if not rate:
+            return count
+
+        bucket = f"{channel}#{country}"
+        granted = 0
+        with self.lock(bucket):
+            while granted < count:
+                window = int(time.time() // self.window_seconds)
+                lease = self._leases.get(bucket)
+                if lease is None or lease[0] != window:
+                    lease = self._leases[bucket] = [window, 0, True]
+
+                if lease[1] == 0 and lease[2]:
+                    want = min(max(count - granted, self.lease_size(rate)), rate)
+                    lease[1], lease[2] = self.lease(bucket, window, rate, want)
+
+                take = min(lease[1], count - granted)
+                lease[1] -= take
+                granted += take
+                if granted >= count or lease[2]:
+                    continue
+
+                # Bucket empty for this window: wait for the refill
+                wait = (window + 1) * self.window_seconds - time.time()
+                if time.monotonic() + wait >= deadline:
+                    break
+                time.sleep(max(wait, 0))
+        return granted
+
+    def lease(self, bucket, window, rate, want):
+        """
+        Take up to ``want`` tokens from a window's shared counter. Returns
+        (tokens, whether more may be left in the window).
+        """
+        table = dynamodb.Table(self.table_name)
+        key = f"{bucket}#{window}"
+        expires_at = int((window + 1) * self.window_seconds) + COUNTER_TTL_SECONDS
+        for _ in range(MAX_LEASE_ATTEMPTS):
+            try:
+                table.update_item(
+                    Key={'bucket_key': key},
+                    UpdateExpression='SET expires_at = :expires ADD taken :want',
+                    ConditionExpression='attribute_not_exists(taken) OR taken <= :room',
+                    ExpressionAttributeValues={':want': want, ':room': rate - want, ':expires': expires_at},
+                    ReturnValuesOnConditionCheckFailure='ALL_OLD'
+                )
+                return want, True
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    logger.error(f"Rate limit lease failed for {bucket}: {str(e)}")
+                    return min(want, self.lease_size(rate)), False
+                taken = e.response.get('Item', {}).get('taken', {}).get('N')
+                remaining = rate - int(taken) if taken else 0
+                if remaining <= 0:
+                    return 0, False
+                want = min(want, remaining)
+            except Exception as e:
+                logger.error(f"Rate limit lease failed for {bucket}: {str(e)}")
+                return min(want, self.lease_size(rate)), False
+        return 0, False
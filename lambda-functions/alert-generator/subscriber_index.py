@@ -0,0 +1,359 @@
+"""
+Location index of public alert subscribers.
+
+Subscribers are stored sorted by a Z-order (interleaved bit) geohash of
+their location in two memory-mapped arrays: ``cells.npy`` holds the
+sorted 64-bit cell codes and ``subscribers.npy`` the matching rows. An
+area query covers its bounding box with a few cell ranges, finds each
+range by binary search on the cell codes and reads only those rows, in
+chunks, filtering them exactly against the radius or polygon. Nothing
+outside the matching ranges is paged in, so the index can hold millions
+of subscribers.
+
+The index is built offline from the AlertSubscribers table, packed as a
+tar of the two arrays and uploaded to the index bucket:
+
+    SUBSCRIBERS_TABLE=<SubscribersTableName> \
+        python subscriber_index.py --output /tmp/subscriber-index --bucket <ArtifactsBucketName>
+
+The build runs outside the stack, with credentials that can scan the
+table and write to the bucket. Workers only download the index, into
+INDEX_DIR; they never scan the table.
+"""
+import os
+import sys
+import time
+import shutil
+import tarfile
+import argparse
+import logging
+
+import boto3
+import numpy as np
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+dynamodb = boto3.resource('dynamodb')
+s3 = boto3.client('s3')
+
+SUBSCRIBERS_TABLE = os.environ.get('SUBSCRIBERS_TABLE', 'AlertSubscribers')
+INDEX_DIR = os.environ.get('SUBSCRIBER_INDEX_DIR', '/tmp/subscriber-index')
+INDEX_BUCKET = os.environ.get('SUBSCRIBER_INDEX_BUCKET')
+INDEX_KEY = os.environ.get('SUBSCRIBER_INDEX_KEY', 'indexes/subscriber-index.tar')
+
+# Seconds between checks for a newer index in the bucket
+INDEX_CHECK_SECONDS = float(os.environ.get('SUBSCRIBER_INDEX_CHECK_SECONDS', '300'))
+
+INDEX_FILES = ('cells.npy', 'subscribers.npy')
+
+# Bits of latitude and of longitude in a cell code
+CELL_BITS = 26
+
+# Most cell ranges an area query is covered with
+MAX_COVER_CELLS = 64
+
+CHUNK_ROWS = 5000
+EARTH_RADIUS_KM = 6371.0
+
+SUBSCRIBER_CHANNELS = ('SMS', 'PUSH')
+
+SUBSCRIBER_DTYPE = np.dtype([
+    ('latitude', '<f4'),
+    ('longitude', '<f4'),
+    ('channel', 'u1'),
+    ('country', 'S24'),
+    ('endpoint', 'S128')
+])
+
+def spread_bits(x):
+    """Spread the low 32 bits of each value to the even bit positions"""
+    x = np.asarray(x, dtype=np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        x = (x | (x << np.uint64(shift))) & np.uint64(mask)
+    return x
+
+def grid_position(latitude, longitude, bits=CELL_BITS):
+    """Row and column of each location on a 2**bits grid"""
+    size = 2 ** bits
+    rows = np.clip((np.asarray(latitude, dtype=np.float64) + 90.0) / 180.0 * size, 0, size - 1)
+    cols = np.clip((np.asarray(longitude, dtype=np.float64) + 180.0) / 360.0 * size, 0, size - 1)
+    return rows.astype(np.uint64), cols.astype(np.uint64)
+
+def cell_codes(latitude, longitude):
+    """Z-order cell code of each location"""
+    rows, cols = grid_position(latitude, longitude)
+    return (spread_bits(rows) << np.uint64(1)) | spread_bits(cols)
+
+def covering_ranges(lat_min, lat_max, lng_min, lng_max, max_cells=MAX_COVER_CELLS):
+    """
+    Sorted, merged [start, end) code ranges of the coarsest level cells
+    that cover a bounding box with at most ``max_cells`` cells
+    """
+    (row_lo, row_hi), (col_lo, col_hi) = (
+        grid_position([lat_min, lat_max], [lng_min, lng_max])
+    )
+    level = CELL_BITS
+    while level > 0:
+        shift = np.uint64(CELL_BITS - level)
+        rows = int(row_hi >> shift) - int(row_lo >> shift) + 1
+        cols = int(col_hi >> shift) - int(col_lo >> shift) + 1
+        if rows * cols <= max_cells:
+            break
+        level -= 1
+
+    shift = np.uint64(CELL_BITS - level)
+    rows = np.arange(int(row_lo >> shift), int(row_hi >> shift) + 1, dtype=np.uint64)
+    cols = np.arange(int(col_lo >> shift), int(col_hi >> shift) + 1, dtype=np.uint64)
+    codes = np.sort(((spread_bits(rows)[:, None] << np.uint64(1)) | spread_bits(cols)[None, :]).ravel())
+
+    span = 2 * (CELL_BITS - level)
+    ranges = []
+    for code in codes.tolist():
+        start, end = code << span, (code + 1) << span
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    return ranges
+
+def longitude_spans(lng_min, lng_max):
+    """
+    A longitude interval as spans within [-180, 180], split in two when it
+    crosses the antimeridian
+    """
+    if lng_max - lng_min >= 360.0:
+        return [(-180.0, 180.0)]
+    if lng_min < -180.0:
+        return [(lng_min + 360.0, 180.0), (-180.0, lng_max)]
+    if lng_max > 180.0:
+        return [(lng_min, 180.0), (-180.0, lng_max - 360.0)]
+    return [(lng_min, lng_max)]
+
+def merge_ranges(ranges):
+    """Sorted union of [start, end) code ranges"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def haversine_km(latitude, longitude, lats, lngs):
+    """Distance in km from one point to each of many"""
+    lat1, lng1 = np.radians(latitude), np.radians(longitude)
+    lat2, lng2 = np.radians(lats.astype(np.float64)), np.radians(lngs.astype(np.float64))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def in_polygon(polygon, lats, lngs):
+    """Ray casting point-in-polygon test for many points; polygon is [[lat, lng], ...]"""
+    inside = np.zeros(len(lats), dtype=bool)
+    lats, lngs = lats.astype(np.float64), lngs.astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for (y1, x1), (y2, x2) in zip(polygon, polygon[1:] + polygon[:1]):
+            crosses = (y1 > lats) != (y2 > lats)
+            inside ^= crosses & (lngs < (x2 - x1) * (lats - y1) / (y2 - y1) + x1)
+    return inside
+
+class SubscriberIndex:
+    """Read-only view of a built index directory"""
+
+    def __init__(self, directory):
+        self.cells = np.load(os.path.join(directory, 'cells.npy'), mmap_mode='r')
+        self.rows = np.load(os.path.join(directory, 'subscribers.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.cells)
+
+    def scan(self, ranges, keep, start_row=0, chunk_rows=CHUNK_ROWS):
+        """
+        Yield (matching rows, next row) per chunk of rows in the code
+        ranges that ``keep(lats, lngs)`` accepts. ``next row`` is a cursor
+        a later scan can resume from with ``start_row``.
+        """
+        for start, end in ranges:
+            first = int(np.searchsorted(self.cells, np.uint64(start), side='left'))
+            last = int(np.searchsorted(self.cells, np.uint64(end), side='left'))
+            for s in range(max(first, start_row), last, chunk_rows):
+                e = min(s + chunk_rows, last)
+                block = np.asarray(self.rows[s:e])
+                matches = block[keep(block['latitude'], block['longitude'])]
+                if len(matches):
+                    yield matches, e
+
+    def within_radius(self, latitude, longitude, radius_km, start_row=0, chunk_rows=CHUNK_ROWS):
+        """
+        Subscribers within ``radius_km`` of a point, in chunks. A circle
+        across the antimeridian is covered on both sides of it, and one
+        over a pole at every longitude.
+        """
+        # Bounding box of the spherical cap; its longitude reach is widest off the centre's parallel
+        angle = radius_km / EARTH_RADIUS_KM
+        dlat = np.degrees(angle)
+        if abs(latitude) + dlat >= 90.0:
+            dlng = 180.0
+        else:
+            dlng = np.degrees(np.arcsin(min(np.sin(angle) / np.cos(np.radians(latitude)), 1.0)))
+        spans = longitude_spans(longitude - dlng, longitude + dlng)
+        ranges = merge_ranges([r for lng_min, lng_max in spans
+                               for r in covering_ranges(latitude - dlat, latitude + dlat, lng_min, lng_max)])
+        return self.scan(ranges, lambda lats, lngs: haversine_km(latitude, longitude, lats, lngs) <= radius_km,
+                         start_row, chunk_rows)
+
+    def within_polygon(self, polygon, start_row=0, chunk_rows=CHUNK_ROWS):
+        """Subscribers inside a polygon of [lat, lng] vertices, in chunks"""
+        lats = [float(p[0]) for p in polygon]
+        lngs = [float(p[1]) for p in polygon]
+        polygon = [[lat, lng] for lat, lng in zip(lats, lngs)]
+        ranges = covering_ranges(min(lats), max(lats), min(lngs), max(lngs))
+        return self.scan(ranges, lambda la, ln: in_polygon(polygon, la, ln), start_row, chunk_rows)
+
+def subscriber_rows(items):
+    """Table items as index rows, skipping subscribers without a location"""
+    channels = {channel: k for k, channel in enumerate(SUBSCRIBER_CHANNELS)}
+    rows = []
+    for item in items:
+        if item.get('latitude') is None or item.get('longitude') is None or item.get('channel') not in channels:
+            continue
+        rows.append((float(item['latitude']), float(item['longitude']), channels[item['channel']],
+                     str(item.get('country', '')).encode(), str(item['endpoint']).encode()))
+    return np.array(rows, dtype=SUBSCRIBER_DTYPE)
+
+def scan_subscribers():
+    """Subscriber rows from the table, one page at a time"""
+    table = dynamodb.Table(SUBSCRIBERS_TABLE)
+    kwargs = {'ProjectionExpression': 'latitude, longitude, channel, country, endpoint'}
+    while True:
+        response = table.scan(**kwargs)
+        yield subscriber_rows(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def build(pages, directory=INDEX_DIR, chunk_rows=CHUNK_ROWS * 20):
+    """
+    Write an index from pages of subscriber rows. Rows are spooled to disk
+    unsorted and then copied out in cell order, so only the cell codes are
+    ever held in memory.
+    """
+    staging = f"{directory}.building"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    spool_path = os.path.join(staging, 'spool.bin')
+    count = 0
+    with open(spool_path, 'wb') as spool:
+        for page in pages:
+            spool.write(page.tobytes())
+            count += len(page)
+
+    spool = np.memmap(spool_path, dtype=SUBSCRIBER_DTYPE, mode='r', shape=(count,)) if count else \
+        np.zeros(0, dtype=SUBSCRIBER_DTYPE)
+    codes = cell_codes(spool['latitude'], spool['longitude'])
+    order = np.argsort(codes, kind='stable')
+    np.save(os.path.join(staging, 'cells.npy'), codes[order])
+
+    rows = np.lib.format.open_memmap(os.path.join(staging, 'subscribers.npy'), mode='w+',
+                                     dtype=SUBSCRIBER_DTYPE, shape=(count,))
+    for s in range(0, count, chunk_rows):
+        chunk = order[s:s + chunk_rows]
+        ascending = np.argsort(chunk)          # read the spool front to back
+        block = np.empty(len(chunk), dtype=SUBSCRIBER_DTYPE)
+        block[ascending] = spool[chunk[ascending]]
+        rows[s:s + len(chunk)] = block
+    rows.flush()
+    del rows, spool
+    os.remove(spool_path)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(staging, directory)
+    return count
+
+def pack(directory, path):
+    """Write an index directory as an uncompressed tar of its arrays"""
+    with tarfile.open(path, 'w') as tar:
+        for name in INDEX_FILES:
+            tar.add(os.path.join(directory, name), arcname=name)
+
+def unpack(stream, directory=INDEX_DIR):
+    """
+    Extract a packed index from a stream into ``directory``. Only the
+    index arrays are read from the archive. Indexes already open keep their
+    mapped files until they are closed.
+    """
+    staging = f"{directory}.download"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    with tarfile.open(fileobj=stream, mode='r|') as tar:
+        for member in tar:
+            if member.isfile() and member.name in INDEX_FILES:
+                with open(os.path.join(staging, member.name), 'wb') as f:
+                    shutil.copyfileobj(tar.extractfile(member), f, 1024 * 1024)
+    missing = [name for name in INDEX_FILES if not os.path.exists(os.path.join(staging, name))]
+    if missing:
+        raise ValueError(f"Subscriber index archive has no {', '.join(missing)}")
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(staging, directory)
+
+_index = {'index': None, 'etag': None, 'checked_at': 0.0}
+
+def get_index():
+    """
+    The offline-built index, or None when no index is available.
+
+    With SUBSCRIBER_INDEX_BUCKET set, the index is downloaded from S3 and
+    its ETag is re-checked at most every INDEX_CHECK_SECONDS; an unchanged
+    index is not downloaded again. Otherwise an index already in INDEX_DIR
+    is used.
+    """
+    now = time.monotonic()
+    if _index['index'] is not None and now - _index['checked_at'] < INDEX_CHECK_SECONDS:
+        return _index['index']
+    _index['checked_at'] = now
+
+    if not INDEX_BUCKET:
+        if _index['index'] is None and os.path.exists(os.path.join(INDEX_DIR, INDEX_FILES[0])):
+            _index['index'] = SubscriberIndex(INDEX_DIR)
+        return _index['index']
+
+    kwargs = {'Bucket': INDEX_BUCKET, 'Key': INDEX_KEY}
+    if _index['etag']:
+        kwargs['IfNoneMatch'] = _index['etag']
+    try:
+        response = s3.get_object(**kwargs)
+        unpack(response['Body'], INDEX_DIR)
+        _index['index'], _index['etag'] = SubscriberIndex(INDEX_DIR), response['ETag']
+        logger.info(f"Loaded subscriber index s3://{INDEX_BUCKET}/{INDEX_KEY} ({response['ETag']}), "
+                    f"{len(_index['index'])} subscribers")
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('304', 'NotModified'):
+            # Keep serving the index already loaded, if any
+            logger.error(f"Failed to load subscriber index s3://{INDEX_BUCKET}/{INDEX_KEY}: {str(e)}")
+    except Exception as e:
+        logger.error(f"Failed to load subscriber index s3://{INDEX_BUCKET}/{INDEX_KEY}: {str(e)}")
+    return _index['index']
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the public alert subscriber location index')
+    parser.add_argument('--output', default=INDEX_DIR, help='index directory')
+    parser.add_argument('--bucket', default=INDEX_BUCKET, help='upload the packed index to this S3 bucket')
+    parser.add_argument('--key', default=INDEX_KEY, help='S3 key of the uploaded index')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    count = build(scan_subscribers(), args.output)
+    print(f"Indexed {count} subscribers in {time.perf_counter() - start:.1f}s -> {args.output}")
+    if args.bucket:
+        archive = f"{args.output}.tar"
+        pack(args.output, archive)
+        s3.upload_file(archive, args.bucket, args.key)
+        print(f"Uploaded to s3://{args.bucket}/{args.key}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import time
+import logging
+
+import boto3
+from botocore.exceptions import ClientError
+
+import templates
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+dynamodb = boto3.resource('dynamodb')
+
+MAX_LOCAL_KEYS = 10000
+
+# How long to trust a window held elsewhere when its expiry is not returned
+LOCAL_FALLBACK_SECONDS = 60
+
+LEVEL_RANKS = {'LOW': 1, 'MEDIUM': 2, 'HIGH': 3, 'CRITICAL': 4}
+
+def incident_cluster(body):
+    """
+    Cluster an alert belongs to: an explicit cluster id, else a ~1 degree
+    cell around the incident location, else the incident itself
+    """
+    if body.get('incident_cluster'):
+        return str(body['incident_cluster'])
+    location = body.get('location') or {}
+    if location.get('latitude') is not None and location.get('longitude') is not None:
+        return f"cell:{round(float(location['latitude']))}:{round(float(location['longitude']))}"
+    return f"incident:{body.get('incident_id')}"
+
+def suppression_key(alert, cluster):
+    """Alerts with the same key inside the window are repeats"""
+    return f"{alert['country']}#{alert['recipient_type']}#{alert['channel']}#{cluster}"
+
+class AlertSuppressor:
+    """
+    Collapses repeated alerts inside a time window per key.
+
+    The first alert for a key claims the window in a shared TTL table with a
+    conditional write; repeats within the window are suppressed and only
+    counted. The next alert after the window carries that count. A higher
+    alert level always gets through. Keys already known to be claimed are
+    suppressed from an in-container cache without a table read, and their
+    counts are written once per key at the end of the invocation.
+
+    Windows claimed for alerts that could not be delivered are released,
+    so the next alert for their key is not suppressed.
+    """
+
+    def __init__(self, table_name, window_seconds):
+        self.table_name = table_name
+        self.window_seconds = window_seconds
+        self._local = {}    # key -> (expires_at, level_rank)
+
+    def filter(self, alerts, cluster):
+        """Split alerts into (to_send, suppressed)"""
+        now = int(time.time())
+        if len(self._local) > MAX_LOCAL_KEYS:
+            self._local = {k: v for k, v in self._local.items() if v[0] > now}
+        to_send, suppressed = [], []
+        pending_counts = {}
+
+        for alert in alerts:
+            key = suppression_key(alert, cluster)
+            rank = LEVEL_RANKS.get(alert['priority'], 2)
+
+            local = self._local.get(key)
+            if local and local[0] > now and local[1] >= rank:
+                pending_counts[key] = pending_counts.get(key, 0) + 1
+                suppressed.append(alert)
+                continue
+
+            claimed, previous_count = self.claim(key, rank, now)
+            if not claimed:
+                pending_counts[key] = pending_counts.get(key, 0) + 1
+                suppressed.append(alert)
+                continue
+
+            if previous_count:
+                alert['suppressed_count'] = previous_count
+                if alert['channel'] in templates.CHANNELS:
+                    alert['message'] = templates.render(
+                        alert['incident_id'], alert['priority'],
+                        alert.get('language') or templates.DEFAULT_LANGUAGE,
+                        alert['channel'], previous_count
+                    )
+            to_send.append(alert)
+
+        for key, count in pending_counts.items():
+            self.record_suppressed(key, count)
+        return to_send, suppressed
+
+    def claim(self, key, rank, now):
+        """
+        Try to open a window for a key. Returns (claimed, suppressed count
+        carried over from the previous window). Fails open so an unreachable
+        table never blocks an alert.
+        """
+        expires_at = now + self.window_seconds
+        try:
+            response = dynamodb.Table(self.table_name).update_item(
+                Key={'suppression_key': key},
+                UpdateExpression='SET expires_at = :expires, level_rank = :rank, suppressed_count = :zero',
+                ConditionExpression='attribute_not_exists(suppression_key) OR expires_at <= :now OR level_rank < :rank',
+                ExpressionAttributeValues={':expires': expires_at, ':rank': rank, ':zero': 0, ':now': now},
+                ReturnValues='ALL_OLD',
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                # Someone else holds the window; remember it locally until it closes
+                held_until = e.response.get('Item', {}).get('expires_at', {}).get('N')
+                self._local[key] = (int(held_until) if held_until else now + LOCAL_FALLBACK_SECONDS, rank)
+                return False, 0
+            logger.error(f"Suppression check failed for {key}: {str(e)}")
+            return True, 0
+        except Exception as e:
+            logger.error(f"Suppression check failed for {key}: {str(e)}")
+            return True, 0
+
+        self._local[key] = (expires_at, rank)
+        return True, int(response.get('Attributes', {}).get('suppressed_count', 0))
+
+    def record_suppressed(self, key, count):
+        """Add suppressed repeats to a key's shared count"""
+        try:
+            dynamodb.Table(self.table_name).update_item(
+                Key={'suppression_key': key},
+                UpdateExpression='ADD suppressed_count :count',
+                ConditionExpression='attribute_exists(suppression_key)',
+                ExpressionAttributeValues={':count': count}
+            )
+        except Exception as e:
+            logger.warning(f"Failed to record {count} suppressed alerts for {key}: {str(e)}")
+
+    def release(self, alerts, cluster):
+        """
+        Close the windows claimed for alerts that were neither queued nor
+        sent, so the next alert for their keys goes out. The suppressed count
+        they carried is put back for it.
+        """
+        now = int(time.time())
+        for alert in alerts:
+            key = suppression_key(alert, cluster)
+            local = self._local.pop(key, None)
+            if not local:
+                continue
+            try:
+                dynamodb.Table(self.table_name).update_item(
+                    Key={'suppression_key': key},
+                    UpdateExpression='SET expires_at = :now ADD suppressed_count :carried',
+                    ConditionExpression='expires_at = :expires',
+                    ExpressionAttributeValues={
+                        ':now': now, ':expires': local[0], ':carried': alert.get('suppressed_count', 0)
+                    }
+                )
+            except Exception as e:
+                logger.warning(f"Failed to release suppression window for {key}: {str(e)}")
@@ -0,0 +1,175 @@
+"""
+Alert message templates per level, channel and language.
+
+Templates are read from alert_templates.json once per container and
+compiled for every (level, channel, language): placeholders are parsed,
+SMS variants drop pictographs and have their fixed text cut so that a
+rendered message never exceeds MAX_SMS_SEGMENTS. Each level also has a
+variant followed by the SUPPRESSED note, with the suppressed count as a
+placeholder, fitted to the same limits. Rendered messages are cached per
+(incident, level, language, channel, suppressed count), so a fan-out
+renders each variant once.
+"""
+import os
+import json
+import string
+import unicodedata
+from functools import lru_cache
+
+TEMPLATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alert_templates.json')
+
+DEFAULT_LEVEL = 'MEDIUM'
+DEFAULT_LANGUAGE = 'en'
+
+# Note on how many repeats were suppressed since the last alert, appended to a level's message
+SUPPRESSED_NOTE = 'SUPPRESSED'
+
+COUNTRY_LANGUAGES = {
+    'Bangladesh': 'bn',
+    'India': 'hi',
+    'Germany': 'de',
+    'Netherlands': 'nl',
+    'United States': 'en',
+    'Canada': 'en'
+}
+
+CHANNELS = ('SMS', 'EMAIL', 'PUSH', 'RADIO')
+
+# Longest value substituted for each placeholder
+FIELD_MAX_LENGTHS = {'incident_id': 40, 'count': 6, 'minutes': 6}
+
+# SMS segment sizes: GSM 03.38 septets, or UCS-2 code units for other text
+MAX_SMS_SEGMENTS = 2
+GSM7_SINGLE, GSM7_MULTI = 160, 153
+UCS2_SINGLE, UCS2_MULTI = 70, 67
+
+GSM7_BASIC = set(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM7_EXTENDED = set("^{}\\[~]|€")
+
+# Longest message on other channels, in characters
+CHANNEL_MAX_CHARS = {'PUSH': 240}
+
+ELLIPSIS = '...'
+
+def is_gsm7(text):
+    return all(c in GSM7_BASIC or c in GSM7_EXTENDED for c in text)
+
+def sms_units(text, gsm7):
+    """Septets (GSM-7) or UTF-16 code units (UCS-2) a text takes in an SMS"""
+    if gsm7:
+        return sum(2 if c in GSM7_EXTENDED else 1 for c in text)
+    return len(text.encode('utf-16-le')) // 2
+
+def sms_budget(gsm7, segments=MAX_SMS_SEGMENTS):
+    """Units that fit in ``segments`` SMS segments"""
+    if segments == 1:
+        return GSM7_SINGLE if gsm7 else UCS2_SINGLE
+    return segments * (GSM7_MULTI if gsm7 else UCS2_MULTI)
+
+def strip_pictographs(text):
+    """Drop emoji and symbols, which force UCS-2 and cost two units each"""
+    kept = ''.join(c for c in text if unicodedata.category(c) != 'So' and c != '\ufe0f')
+    return kept.strip()
+
+class CompiledTemplate:
+    """A template parsed into literal text and placeholders, cut to its channel's length limit"""
+
+    def __init__(self, text, channel):
+        if channel == 'SMS':
+            text = strip_pictographs(text)
+        self.parts = [(literal, field) for literal, field, _, _ in string.Formatter().parse(text)]
+        self.fields = [field for _, field in self.parts if field]
+
+        if channel == 'SMS':
+            self.gsm7 = is_gsm7(text.replace('{', '').replace('}', ''))
+            budget = sms_budget(self.gsm7)
+            measure = lambda s: sms_units(s, self.gsm7)
+        else:
+            budget = CHANNEL_MAX_CHARS.get(channel)
+            measure = len
+        if budget is not None:
+            self.fit(budget - sum(FIELD_MAX_LENGTHS.get(f, 0) for f in self.fields), measure)
+
+    def fit(self, budget, measure):
+        """Cut fixed text from the end until it fits in ``budget``"""
+        literal_units = sum(measure(literal) for literal, _ in self.parts)
+        if literal_units <= budget:
+            return
+        overflow = literal_units - budget + measure(ELLIPSIS)
+        parts = list(self.parts)
+        for k in range(len(parts) - 1, -1, -1):
+            literal, field = parts[k]
+            while literal and overflow > 0:
+                overflow -= measure(literal[-1])
+                literal = literal[:-1]
+            parts[k] = (literal, field)
+            if overflow <= 0:
+                parts[k] = (literal.rstrip() + ELLIPSIS, field)
+                break
+        self.parts = parts
+
+    def render(self, values):
+        pieces = []
+        for literal, field in self.parts:
+            pieces.append(literal)
+            if field:
+                value = str(values.get(field, ''))
+                pieces.append(value[:FIELD_MAX_LENGTHS[field]] if field in FIELD_MAX_LENGTHS else value)
+        return ''.join(pieces)
+
+def load_templates(path=TEMPLATES_PATH):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def channel_text(messages, channel):
+    """A language may override the text for a channel: {"default": ..., "SMS": ...}"""
+    return messages.get(channel, messages['default']) if isinstance(messages, dict) else messages
+
+def compile_templates(templates):
+    """
+    {(level, channel, language): CompiledTemplate} for every level, channel
+    and language, plus (level, channel, language, 'repeat') variants that
+    end with the suppressed note
+    """
+    notes = templates.get(SUPPRESSED_NOTE, {}).get('messages', {})
+    compiled = {}
+    for level, template in templates.items():
+        for language, messages in template['messages'].items():
+            for channel in CHANNELS:
+                text = channel_text(messages, channel)
+                compiled[(level, channel, language)] = CompiledTemplate(text, channel)
+                if language in notes and level != SUPPRESSED_NOTE:
+                    note = channel_text(notes[language], channel)
+                    compiled[(level, channel, language, 'repeat')] = CompiledTemplate(f"{text} {note}", channel)
+    return compiled
+
+TEMPLATES = load_templates()
+COMPILED = compile_templates(TEMPLATES)
+
+def render_fields(template_name, language, channel, repeat=False, **values):
+    """Message of a named template with arbitrary placeholder values, uncached"""
+    variant = ('repeat',) if repeat else ()
+    template = (COMPILED.get((template_name, channel, language) + variant)
+                or COMPILED[(template_name, channel, DEFAULT_LANGUAGE) + variant])
+    return template.render(values)
+
+def level_policy(alert_level):
+    """Recipients and channels of an alert level"""
+    return TEMPLATES.get(alert_level, TEMPLATES[DEFAULT_LEVEL])
+
+def language_for(country, override=None):
+    """Language alerts to a country are sent in"""
+    return override or COUNTRY_LANGUAGES.get(country, DEFAULT_LANGUAGE)
+
+@lru_cache(maxsize=4096)
+def render(incident_id, alert_level, language, channel, suppressed_count=0):
+    """
+    Message for an incident, level, language and channel; English when the
+    language has no template. A suppressed count adds the localized note.
+    """
+    level = alert_level if alert_level in TEMPLATES else DEFAULT_LEVEL
+    return render_fields(level, language, channel, repeat=bool(suppressed_count),
+                         incident_id=incident_id, count=suppressed_count)
@@ -0,0 +1,212 @@
+import os
+import json
+import logging
+from decimal import Decimal
+from datetime import datetime
+
+import boto3
+from botocore.exceptions import ClientError
+
+from team_catalogue import to_plain
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+dynamodb = boto3.resource('dynamodb')
+
+ALLOCATION_STATE_TABLE = os.environ.get('ALLOCATION_STATE_TABLE', 'ResourceAllocationState')
+
+class AllocationState:
+    """
+    The current team plan, one entry per open incident:
+    {'incident': incident_data, 'slots': [[specialization, team_id or None], ...],
+     'version': stored version or None}.
+
+    Slots are stored as an ordered list rather than by slot id so a finished
+    slot can be dropped without renumbering the others. A reverse
+    team -> incident map lets a team event find its incident in O(1).
+
+    ``version`` is the version of the stored item the entry was read from,
+    kept for removed incidents too, so that save_state only overwrites or
+    deletes what this container last read.
+    """
+
+    def __init__(self):
+        self.incidents = {}
+        self._team_incident = {}
+        self._versions = {}
+
+    def set_incident(self, incident, slots, version=None):
+        """Replace an incident's slots, keeping the stored version it was read at unless given"""
+        incident_id = incident['incident_id']
+        self.remove_incident(incident_id)
+        if version is not None:
+            self._versions[incident_id] = version
+        incident = {k: v for k, v in incident.items() if k != 'required_specializations'}
+        self.incidents[incident_id] = {'incident': incident, 'slots': [list(s) for s in slots],
+                                       'version': self._versions.get(incident_id)}
+        for _, team_id in slots:
+            if team_id:
+                self._team_incident[team_id] = incident_id
+
+    def remove_incident(self, incident_id):
+        """Drop an incident, returning the team ids it held"""
+        entry = self.incidents.pop(incident_id, None)
+        if not entry:
+            return []
+        held = [team_id for _, team_id in entry['slots'] if team_id]
+        for team_id in held:
+            self._team_incident.pop(team_id, None)
+        return held
+
+    def stored_version(self, incident_id):
+        """Version of the stored item this state last read or wrote, None when never stored"""
+        return self._versions.get(incident_id)
+
+    def forget(self, incident_id):
+        """Drop an incident along with its stored version, as after reading that it was deleted"""
+        self._versions.pop(incident_id, None)
+        return self.remove_incident(incident_id)
+
+    def incident_of(self, team_id):
+        """Incident a team is allocated to, if any"""
+        return self._team_incident.get(team_id)
+
+    def vacate(self, team_id, keep_slot=True):
+        """
+        Take a team off its slot. The slot stays open for a replacement
+        unless ``keep_slot`` is False (the team finished that work).
+        Returns the incident id, or None when the team held no slot.
+        """
+        incident_id = self._team_incident.pop(team_id, None)
+        if incident_id is None:
+            return None
+        slots = self.incidents[incident_id]['slots']
+        for n, (specialization, held) in enumerate(slots):
+            if held == team_id:
+                if keep_slot:
+                    slots[n] = [specialization, None]
+                else:
+                    del slots[n]
+                break
+        return incident_id
+
+    def held_teams(self, exclude_incidents=()):
+        """Team ids allocated to incidents other than the excluded ones"""
+        exclude_incidents = set(exclude_incidents)
+        return {team_id for team_id, incident_id in self._team_incident.items()
+                if incident_id not in exclude_incidents}
+
+    def uncovered(self):
+        """(incident_id, specialization) for every open slot"""
+        return [(incident_id, specialization)
+                for incident_id, entry in self.incidents.items()
+                for specialization, team_id in entry['slots'] if team_id is None]
+
+    def solver_input(self, incident_id):
+        """Incident with required_specializations and its fixed slot assignments"""
+        entry = self.incidents[incident_id]
+        incident = dict(entry['incident'], required_specializations=[s for s, _ in entry['slots']])
+        fixed = {f"{incident_id}#{n}": team_id for n, (_, team_id) in enumerate(entry['slots']) if team_id}
+        return incident, fixed
+
+def slots_from_solution(incident, solution):
+    """[specialization, team_id] pairs of one incident from an assignment solution"""
+    assigned = solution['slot_assignments']
+    return [[specialization, assigned.get(f"{incident['incident_id']}#{n}")]
+            for n, specialization in enumerate(incident['required_specializations'])]
+
+_state = {'state': None}
+
+def get_state():
+    """Allocation state, loaded from DynamoDB once per container"""
+    if _state['state'] is None:
+        _state['state'] = load_state()
+    return _state['state']
+
+def load_state():
+    """Read every persisted incident allocation"""
+    state = AllocationState()
+    try:
+        table = dynamodb.Table(ALLOCATION_STATE_TABLE)
+        kwargs = {}
+        while True:
+            response = table.scan(**kwargs)
+            for item in response.get('Items', []):
+                item = to_plain(item)
+                state.set_incident(item['incident'], item.get('slots', []), int(item.get('version', 0)))
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    except Exception as e:
+        logger.error(f"Failed to load allocation state: {str(e)}")
+    return state
+
+def refresh_incident(state, incident_id):
+    """Replace an incident's entry with the stored item, or drop it when none is stored"""
+    item = dynamodb.Table(ALLOCATION_STATE_TABLE).get_item(
+        Key={'incident_id': incident_id}, ConsistentRead=True
+    ).get('Item')
+    if item is None:
+        state.forget(incident_id)
+        return
+    item = to_plain(item)
+    state.set_incident(item['incident'], item.get('slots', []), int(item.get('version', 0)))
+
+def save_state(state, incident_ids):
+    """
+    Persist only the given incidents, deleting those no longer in the plan.
+
+    Every write is conditional on the stored version still being the one
+    this state read, so a container working from an old copy cannot bring
+    back a closed incident or overwrite a newer plan. Incidents that lost
+    that race are re-read into ``state``. Returns {incident_id: team ids}
+    of the teams the rejected plan held that the stored one does not, for
+    the caller to release.
+    """
+    table = dynamodb.Table(ALLOCATION_STATE_TABLE)
+    timestamp = datetime.now().isoformat()
+    conflicts = {}
+    for incident_id in set(incident_ids):
+        entry = state.incidents.get(incident_id)
+        version = state.stored_version(incident_id)
+        if version is None:
+            condition, values = 'attribute_not_exists(incident_id)', {}
+        else:
+            condition, values = 'version = :expected', {':expected': version}
+        try:
+            if entry is None:
+                table.delete_item(Key={'incident_id': incident_id}, ConditionExpression=condition,
+                                  **({'ExpressionAttributeValues': values} if values else {}))
+                state.forget(incident_id)
+                continue
+            table.put_item(
+                Item=json.loads(json.dumps({
+                    'incident_id': incident_id,
+                    'incident': entry['incident'],
+                    'slots': entry['slots'],
+                    'version': (version or 0) + 1,
+                    'updated_at': timestamp
+                }, default=str), parse_float=Decimal),
+                ConditionExpression=condition,
+                **({'ExpressionAttributeValues': values} if values else {})
+            )
+            state.set_incident(entry['incident'], entry['slots'], (version or 0) + 1)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                logger.error(f"Failed to save allocation state of {incident_id}: {str(e)}")
+                continue
+            planned = {team_id for _, team_id in (entry['slots'] if entry else []) if team_id}
+            try:
+                refresh_incident(state, incident_id)
+            except Exception as e:
+                logger.error(f"Failed to re-read allocation state of {incident_id}: {str(e)}")
+                continue
+            stored = state.incidents.get(incident_id)
+            kept = {team_id for _, team_id in (stored['slots'] if stored else []) if team_id}
+            logger.warning(f"Allocation of {incident_id} changed elsewhere; keeping the stored plan")
+            if planned - kept:
+                conflicts[incident_id] = sorted(planned - kept)
+        except Exception as e:
+            logger.error(f"Failed to save allocation state of {incident_id}: {str(e)}")
+    return conflicts
@@ -1,14 +1,83 @@
+import os
 import json
+import time
 import boto3
 import logging
 from datetime import datetime
+from decimal import Decimal
 import math
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.dynamodb.conditions import Attr
+
+import numpy as np
+
+import allocation_state
+import assignment
+import demand_forecast
+import equipment_allocation
+import pareto
+import prepositioning
+import reservation
+import risk_simulation
+import routing
+import shift_scheduling
+import team_catalogue
+import travel_matrix
+from specialization_index import SpecializationIndex, normalize_specialization, specialization_keys
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 dynamodb = boto3.resource('dynamodb')
 
+INCIDENTS_TABLE = os.environ.get('INCIDENTS_TABLE', 'DisasterIncidents')
+OPTIMIZATION_TABLE = os.environ.get('OPTIMIZATION_TABLE', 'ResourceOptimization')
+CLOSED_STATUSES = ['CLOSED', 'RESOLVED']
+
+# Incidents of a batch plan reserved concurrently, one transaction each
+RESERVATION_WORKERS = 8
+
+# Capability points a team loses per hour of travel when ranking candidates
+ETA_WEIGHT_PER_HOUR = 0.5
+
+# Candidates ranked by travel time at first when picking a team; more are taken only if one could still win
+PICK_CANDIDATES = 16
+MOBILIZATION_HOURS = 1
+
+# Cost estimates (in USD)
+COST_RATES = {
+    'team_per_hour': 500,
+    'equipment_base': 10000,
+    'vehicle_per_hour': 100
+}
+
+# Requirement tables; values are tuples so cached lookups can be shared safely
+SPECIALIZATIONS_BY_WASTE_TYPE = {
+    'Chemical Hazardous': ('Chemical Response', 'Environmental'),
+    'Medical Biological': ('Medical Response', 'Environmental'),
+    'Industrial Waste': ('Industrial Cleanup', 'Environmental'),
+    'Disaster Debris': ('Flood Response', 'Construction'),
+    'Radioactive': ('Radiation Response', 'Environmental')
+}
+
+BASE_EQUIPMENT = ('Communication Systems', 'Safety Equipment', 'Transportation')
+
+SPECIALIZED_EQUIPMENT = {
+    'Chemical Hazardous': ('Chemical Suits', 'Neutralization Agents', 'Containment Systems'),
+    'Medical Biological': ('Biohazard Suits', 'Sterilization Equipment', 'Medical Waste Containers'),
+    'Industrial Waste': ('Heavy Machinery', 'Industrial Containers', 'Filtration Systems'),
+    'Disaster Debris': ('Heavy Machinery', 'Sorting Equipment', 'Disposal Trucks')
+}
+
+# Last batch solution, reused to warm-start re-solves in this container
+_batch_state = {'solution': None}
+
+# Per-item equipment solutions, reused while stock and demand are unchanged
+_equipment_allocator = equipment_allocation.EquipmentAllocator()
+
 def lambda_handler(event, context):
     """
     Intelligent resource allocation with cost optimization and deployment strategies
@@ -20,31 +89,97 @@ def lambda_handler(event, context):
         else:
             body = event
         
+        # The risk sample count sizes the simulation arrays, so it is bounded before any work
+        if body.get('simulate_risk') and risk_samples(body) is None:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': f"risk_samples must be an integer from "
+                                             f"{risk_simulation.MIN_SAMPLES} to {risk_simulation.MAX_SAMPLES}"})
+            }
+        
+        # Batch mode optimizes every open incident together
+        if body.get('mode') == 'batch':
+            return {
+                'statusCode': 200,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps(optimize_batch(body), default=str)
+            }
+        
+        # Pareto mode returns the trade-off set of plans for one incident
+        if body.get('mode') == 'pareto':
+            return {
+                'statusCode': 200,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps(optimize_pareto(body), default=str)
+            }
+        
+        # Forecast mode plans team moves ahead of predicted incidents
+        if body.get('mode') == 'forecast':
+            plan = plan_prepositioning(body)
+            if plan is None:
+                return {
+                    'statusCode': 503,
+                    'headers': {'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Demand forecast model unavailable; train it offline with demand_forecast.py'})
+                }
+            return {
+                'statusCode': 200,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps(plan, default=str)
+            }
+        
+        # Delta mode repairs the persisted plan after team or incident changes
+        if body.get('mode') == 'delta':
+            return {
+                'statusCode': 200,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps(optimize_delta(body), default=str)
+            }
+        
         incident_id = body.get('incident_id')
         incident_data = body.get('incident_data', {})
         
         # Get available resources
-        available_resources = get_available_resources(incident_data.get('affected_countries', []))
+        countries = incident_data.get('affected_countries', [])
+        available_resources = get_available_resources(countries)
         
         # Optimize resource allocation
-        optimization = optimize_resources(incident_data, available_resources)
+        optimization = optimize_resources(incident_data, available_resources,
+                                          team_catalogue.get_specialization_index(countries),
+                                          incident_id)
+        
+        # Allocate equipment from depots
+        optimization['equipment_allocation'] = allocate_equipment([(incident_id, incident_data, optimization)])[incident_id]
         
         # Calculate deployment strategy
         deployment_strategy = calculate_deployment_strategy(optimization)
+        route_deployment([(incident_data, deployment_strategy)])
+        
+        # Rotate crews through shifts over the incident duration
+        shift_schedule = schedule_crews([(incident_id, incident_data, optimization, deployment_strategy)])[incident_id]
         
         # Store optimization results
         store_optimization_results(incident_id, optimization, deployment_strategy)
+        travel_matrix.get_matrix().flush()
+        
+        result = {
+            'optimization_id': f"OPT-{incident_id}",
+            'resource_allocation': optimization,
+            'deployment_strategy': deployment_strategy,
+            'estimated_cost': calculate_total_cost(optimization),
+            'estimated_response_time': calculate_response_time(deployment_strategy),
+            'shift_schedule': shift_schedule
+        }
+        
+        # Optional Monte Carlo risk profile for coordinators reviewing the plan
+        if body.get('simulate_risk'):
+            result['risk_profile'] = simulate_risk(optimization, deployment_strategy, body)
         
         return {
             'statusCode': 200,
             'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'optimization_id': f"OPT-{incident_id}",
-                'resource_allocation': optimization,
-                'deployment_strategy': deployment_strategy,
-                'estimated_cost': calculate_total_cost(optimization),
-                'estimated_response_time': calculate_response_time(deployment_strategy)
-            }, default=str)
+            'body': json.dumps(result, default=str)
         }
         
     except Exception as e:
@@ -56,44 +191,10 @@ def lambda_handler(event, context):
         }
 
 def get_available_resources(countries):
-    """Get available response teams and equipment"""
-    
-    # Sample resource database
-    resources = {
-        'Bangladesh': [
-            {'team_id': 'BD-HAZMAT-01', 'specialization': 'Chemical Response', 'status': 'AVAILABLE', 'capability': 9},
-            {'team_id': 'BD-FLOOD-02', 'specialization': 'Flood Response', 'status': 'AVAILABLE', 'capability': 8}
-        ],
-        'India': [
-            {'team_id': 'IN-BORDER-01', 'specialization': 'Cross-Border Ops', 'status': 'AVAILABLE', 'capability': 9},
-            {'team_id': 'IN-ENV-02', 'specialization': 'Environmental', 'status': 'DEPLOYED', 'capability': 7}
-        ],
-        'United States': [
-            {'team_id': 'US-HAZMAT-01', 'specialization': 'Chemical Response', 'status': 'AVAILABLE', 'capability': 10},
-            {'team_id': 'US-FLOOD-02', 'specialization': 'Flood Response', 'status': 'AVAILABLE', 'capability': 9}
-        ],
-        'Canada': [
-            {'team_id': 'CA-COORD-01', 'specialization': 'Coordination', 'status': 'AVAILABLE', 'capability': 8},
-            {'team_id': 'CA-ENV-02', 'specialization': 'Environmental', 'status': 'AVAILABLE', 'capability': 8}
-        ],
-        'Germany': [
-            {'team_id': 'DE-IND-01', 'specialization': 'Industrial Cleanup', 'status': 'AVAILABLE', 'capability': 9},
-            {'team_id': 'DE-CHEM-02', 'specialization': 'Chemical Response', 'status': 'AVAILABLE', 'capability': 9}
-        ],
-        'Netherlands': [
-            {'team_id': 'NL-ENV-01', 'specialization': 'Environmental', 'status': 'AVAILABLE', 'capability': 8},
-            {'team_id': 'NL-WATER-02', 'specialization': 'Water Management', 'status': 'AVAILABLE', 'capability': 10}
-        ]
-    }
-    
-    available = []
-    for country in countries:
-        if country in resources:
-            available.extend([team for team in resources[country] if team['status'] == 'AVAILABLE'])
-    
-    return available
+    """Get available response teams from the cached team catalogue"""
+    return team_catalogue.get_available_teams(countries)
 
-def optimize_resources(incident_data, available_resources):
+def optimize_resources(incident_data, available_resources, team_index=None, reserve_for=None, exclude=()):
     """Optimize resource allocation based on incident requirements"""
     
     waste_type = incident_data.get('waste_classification', {}).get('primary_type', 'Unknown')
@@ -104,7 +205,26 @@ def optimize_resources(incident_data, available_resources):
     required_specializations = determine_required_specializations(waste_type, hazard_level)
     
     # Select optimal teams
-    selected_teams = select_optimal_teams(available_resources, required_specializations, priority)
+    countries = incident_data.get('affected_countries')
+    location = incident_location(incident_data)
+    if team_index is None:
+        team_index = SpecializationIndex(available_resources)
+        countries = None
+    assignments = select_team_assignments(available_resources, required_specializations, priority,
+                                          team_index, countries, location, exclude)
+    
+    # Reserve the selected teams, falling back to the next-best candidate when one is taken
+    if reserve_for:
+        assignments = reservation.reserve_teams(
+            reserve_for, assignments,
+            lambda specialization, exclude: pick_team(team_index, specialization, countries, exclude, location)
+        )
+    selected_teams = [team for _, team in assignments]
+    
+    return build_optimization(incident_data, selected_teams, required_specializations)
+
+def build_optimization(incident_data, selected_teams, required_specializations):
+    """Assemble the allocation result for one incident"""
     
     # Calculate resource requirements
     resource_requirements = calculate_resource_requirements(incident_data, selected_teams)
@@ -112,81 +232,476 @@ def optimize_resources(incident_data, available_resources):
     return {
         'selected_teams': selected_teams,
         'resource_requirements': resource_requirements,
-        'specializations_covered': required_specializations,
-        'optimization_score': calculate_optimization_score(selected_teams, required_specializations)
+        'specializations_covered': list(required_specializations),
+        'optimization_score': calculate_optimization_score(selected_teams, required_specializations),
+        'team_etas': calculate_team_etas(selected_teams, incident_location(incident_data))
     }
 
-def determine_required_specializations(waste_type, hazard_level):
-    """Determine required team specializations"""
-    
-    specialization_map = {
-        'Chemical Hazardous': ['Chemical Response', 'Environmental'],
-        'Medical Biological': ['Medical Response', 'Environmental'],
-        'Industrial Waste': ['Industrial Cleanup', 'Environmental'],
-        'Disaster Debris': ['Flood Response', 'Construction'],
-        'Radioactive': ['Radiation Response', 'Environmental']
+def incident_location(incident_data):
+    """Incident coordinates, or None when the incident has no usable location"""
+    location = incident_data.get('location') or {}
+    if location.get('latitude') is None or location.get('longitude') is None:
+        return None
+    return location
+
+def calculate_team_etas(teams, location):
+    """Travel hours of teams with a known base to the incident location"""
+    if not location or not teams:
+        return {}
+    minutes = travel_matrix.get_matrix().eta_minutes(teams, location)
+    return {
+        team['team_id']: round(float(m) / 60, 2)
+        for team, m in zip(teams, minutes) if m != travel_matrix.UNKNOWN_MINUTES
+    }
+
+def incident_travel_hours(teams, incident_data):
+    """Travel hours of teams to an incident, 0 when unknown"""
+    location = incident_location(incident_data)
+    if not location:
+        return np.zeros(len(teams))
+    return travel_matrix.get_matrix().eta_hours(teams, location)
+
+def optimize_batch(body):
+    """Jointly allocate teams across all open incidents"""
+    
+    start = time.perf_counter()
+    
+    incidents = body.get('incidents') or load_open_incidents()
+    for incident in incidents:
+        incident['required_specializations'] = batch_specializations(incident)
+    
+    state = allocation_state.get_state()
+    
+    # Incidents closed since they were planned leave the plan and free their teams
+    stale = set()
+    if not body.get('incidents'):
+        stale = set(state.incidents) - {i['incident_id'] for i in incidents}
+        for incident_id in stale:
+            reservation.release_teams(incident_id, state.remove_incident(incident_id))
+    
+    teams = plan_candidate_teams(state, [i['incident_id'] for i in incidents])
+    
+    # Warm-start from the previous solution when only some incidents or teams changed
+    changed_incidents = body.get('changed_incident_ids', [])
+    changed_teams = body.get('changed_team_ids', [])
+    previous = _batch_state['solution']
+    if previous and (changed_incidents or changed_teams) and not stale:
+        solution = assignment.resolve_assignment(previous, incidents, teams, changed_incidents, changed_teams,
+                                                 incident_travel_hours)
+    else:
+        solution = assignment.solve_assignment(incidents, teams, incident_travel_hours)
+    
+    solve_ms = (time.perf_counter() - start) * 1000
+    
+    # Mark the planned teams DEPLOYED so single-incident requests cannot take them
+    solution = reserve_solution(state, incidents, solution, teams)
+    _batch_state['solution'] = solution
+    
+    # Persist the plan so later deltas repair it instead of re-solving everything
+    for incident in incidents:
+        state.set_incident(incident, allocation_state.slots_from_solution(incident, solution))
+    conflicts = save_plan(state, {i['incident_id'] for i in incidents} | stale)
+    if conflicts:
+        # The stored plan of these incidents differs from the solution
+        _batch_state['solution'] = None
+    
+    results = build_batch_results([i for i in incidents if i['incident_id'] not in conflicts], solution, body)
+    
+    store_batch_results(results)
+    travel_matrix.get_matrix().flush()
+    
+    logger.info(f"Batch optimized {len(incidents)} incidents over {len(teams)} teams in {solve_ms:.0f} ms")
+    
+    return {
+        'optimization_id': f"OPT-BATCH-{datetime.now().strftime('%Y%m%d%H%M%S')}",
+        'incidents': results,
+        'uncovered_slots': solution['uncovered_slots'],
+        'objective': solution['objective'],
+        'solve_time_ms': solve_ms
     }
+
+def save_plan(state, incident_ids):
+    """
+    Persist the plan of some incidents. Plans changed elsewhere since this
+    container read them are kept, and the teams reserved for the rejected
+    plan are released. Returns the ids of those incidents.
+    """
+    conflicts = allocation_state.save_state(state, incident_ids)
+    for incident_id, team_ids in conflicts.items():
+        reservation.release_teams(incident_id, team_ids)
+    return set(conflicts)
+
+def plan_candidate_teams(state, incident_ids, exclude=()):
+    """
+    AVAILABLE teams, plus the teams the persisted plan already holds for the
+    given incidents. Held teams are DEPLOYED, so they are passed to the
+    solver as available again; their reservation is renewed or released
+    once the new plan is known.
+    """
+    teams = [t for t in team_catalogue.get_teams(status='AVAILABLE') if t['team_id'] not in exclude]
+    seen = {t['team_id'] for t in teams}
+    for incident_id in incident_ids:
+        entry = state.incidents.get(incident_id)
+        for _, team_id in (entry['slots'] if entry else []):
+            team = team_catalogue.get_team(team_id) if team_id else None
+            if team and team_id not in seen and team.get('status') == 'DEPLOYED':
+                teams.append(dict(team, status='AVAILABLE'))
+                seen.add(team_id)
+    return teams
+
+def reserve_solution(state, incidents, solution, teams):
+    """
+    Reserve the teams of an assignment solution with the same conditional
+    writes as single-incident requests, one transaction per incident.
+    
+    Teams the persisted plan held for these incidents but the solution no
+    longer gives them are released first. A team taken elsewhere since the
+    catalogue was read is replaced by the best team the solution left
+    unassigned. Returns the solution rebuilt from the reserved teams.
+    """
+    assigned = solution['slot_assignments']
+    by_incident = {}
+    for slot_id, team_id in assigned.items():
+        by_incident.setdefault(assignment.slot_incident_id(slot_id), []).append(slot_id)
+    
+    for incident in incidents:
+        incident_id = incident['incident_id']
+        entry = state.incidents.get(incident_id)
+        keep = {assigned[slot_id] for slot_id in by_incident.get(incident_id, [])}
+        dropped = [team_id for _, team_id in (entry['slots'] if entry else []) if team_id and team_id not in keep]
+        if dropped:
+            reservation.release_teams(incident_id, dropped, publish=False)
+    
+    teams_by_id = {t['team_id']: t for t in teams}
+    slots = {slot['slot_id']: slot for slot in assignment.build_slots(incidents)}
+    used = set(assigned.values())
+    spare = SpecializationIndex(t for t in teams if t['team_id'] not in used)
+    lock = threading.Lock()
+    
+    def replacement(slot_id, exclude):
+        slot = slots[slot_id]
+        with lock:
+            team = pick_team(spare, slot['specialization'], slot['incident'].get('affected_countries', []),
+                             used | exclude, incident_location(slot['incident']))
+            if team:
+                used.add(team['team_id'])
+        return team
+    
+    def reserve(incident_id):
+        pairs = [(slot_id, teams_by_id[assigned[slot_id]]) for slot_id in by_incident[incident_id]]
+        return reservation.reserve_teams(incident_id, pairs, replacement, publish=False)
+    
+    with ThreadPoolExecutor(max_workers=RESERVATION_WORKERS) as executor:
+        reserved = list(executor.map(reserve, list(by_incident)))
+    if team_catalogue.is_table_backed():
+        team_catalogue.note_table_change()
+    
+    kept = {slot_id: team['team_id'] for pairs in reserved for slot_id, team in pairs}
+    if kept == assigned:
+        return solution
+    teams_by_id.update((team['team_id'], team) for pairs in reserved for _, team in pairs)
+    return assignment.build_solution(incidents, list(slots.values()), kept, teams_by_id, incident_travel_hours)
+
+def build_batch_results(incidents, solution, body):
+    """Per-incident allocation, equipment, deployment and cost for a batch solution"""
+    
+    optimizations = []
+    for incident in incidents:
+        allocation = solution['incidents'][incident['incident_id']]
+        optimization = build_optimization(incident, allocation['selected_teams'],
+                                          incident['required_specializations'])
+        optimization['uncovered_specializations'] = allocation['uncovered']
+        optimizations.append((incident['incident_id'], incident, optimization))
+    
+    # Share depot stock across all incidents in one transportation problem per item
+    equipment = allocate_equipment(optimizations)
+    
+    strategies = []
+    for incident_id, incident, optimization in optimizations:
+        optimization['equipment_allocation'] = equipment[incident_id]
+        strategies.append((incident, calculate_deployment_strategy(optimization)))
+    
+    # Plan vehicle tours for every phase, sharing vehicles between incidents at the same staging area
+    route_deployment(strategies)
+    
+    # Relief teams are drawn from one pool across all incidents
+    schedules = schedule_crews([(incident_id, incident, optimization, deployment_strategy)
+                                for (incident_id, incident, optimization), (_, deployment_strategy)
+                                in zip(optimizations, strategies)])
+    
+    results = []
+    for (incident_id, incident, optimization), (_, deployment_strategy) in zip(optimizations, strategies):
+        result = {
+            'incident_id': incident_id,
+            'resource_allocation': optimization,
+            'deployment_strategy': deployment_strategy,
+            'estimated_cost': calculate_total_cost(optimization),
+            'estimated_response_time': calculate_response_time(deployment_strategy),
+            'shift_schedule': schedules[incident_id]
+        }
+        if body.get('simulate_risk'):
+            result['risk_profile'] = simulate_risk(optimization, deployment_strategy, body)
+        results.append(result)
+    
+    return results
+
+def optimize_delta(body):
+    """
+    Repair the persisted plan after a list of events, re-solving only the
+    incidents they touch and reserving the teams of the repaired plan:
+    
+      TEAM_OFFLINE        team leaves its slot, which is refilled
+      TEAM_RELEASED       team finished its slot and rejoins the pool
+      INCIDENT_ESCALATED  incident requirements are recomputed (also for new incidents)
+                          and teams no longer needed are released
+      INCIDENT_CLOSED     incident is dropped and its teams released
+    """
+    
+    start = time.perf_counter()
+    state = allocation_state.get_state()
+    
+    affected = set()
+    closed = set()
+    released_teams = []
+    for event in body.get('events', []):
+        event_type = event.get('type')
+        
+        if event_type in ('TEAM_OFFLINE', 'TEAM_RELEASED'):
+            team_id = event['team_id']
+            offline = event_type == 'TEAM_OFFLINE'
+            incident_id = state.vacate(team_id, keep_slot=offline)
+            
+            # Persist the change so other containers and single-incident requests see it
+            if not offline and (incident_id or event.get('incident_id')):
+                reservation.release_teams(incident_id or event['incident_id'], [team_id])
+                team = team_catalogue.get_team(team_id)
+            else:
+                team = reservation.set_team_status(team_id, 'OFFLINE' if offline else 'AVAILABLE')
+            if offline and incident_id:
+                affected.add(incident_id)
+            if not offline and team and team.get('status') == 'AVAILABLE':
+                released_teams.append(team)
+        
+        elif event_type == 'INCIDENT_ESCALATED':
+            incident = dict(event['incident_data'])
+            incident_id = incident['incident_id']
+            previous = state.incidents.get(incident_id)
+            if previous:
+                incident = {**previous['incident'], **incident}
+            required = batch_specializations(incident)
+            
+            # Keep teams already serving a specialization the incident still needs
+            held = {}
+            for specialization, team_id in (previous['slots'] if previous else []):
+                if team_id:
+                    held.setdefault(specialization, []).append(team_id)
+            slots = [[s, held[s].pop() if held.get(s) else None] for s in required]
+            state.set_incident(incident, slots)
+            affected.add(incident_id)
+            
+            # Teams whose specialization is no longer needed go back to the pool
+            dropped = [team_id for team_ids in held.values() for team_id in team_ids]
+            if dropped:
+                reservation.release_teams(incident_id, dropped)
+                released_teams.extend(t for t in map(team_catalogue.get_team, dropped)
+                                      if t and t.get('status') == 'AVAILABLE')
+        
+        elif event_type == 'INCIDENT_CLOSED':
+            incident_id = event['incident_id']
+            team_ids = state.remove_incident(incident_id)
+            reservation.release_teams(incident_id, team_ids)
+            equipment_allocation.release_stock(incident_id)
+            closed.add(incident_id)
+            affected.discard(incident_id)
+    
+    # Incidents with an open slot a freed team could fill
+    released_keys = set()
+    for team in released_teams:
+        released_keys.update(specialization_keys(team['specialization']))
+    for incident_id, specialization in state.uncovered():
+        if normalize_specialization(specialization) in released_keys:
+            affected.add(incident_id)
+    
+    affected -= closed
+    affected &= set(state.incidents)
+    
+    incidents = []
+    fixed = {}
+    for incident_id in affected:
+        incident, incident_fixed = state.solver_input(incident_id)
+        incidents.append(incident)
+        fixed.update(incident_fixed)
     
-    base_specializations = specialization_map.get(waste_type, ['Environmental'])
+    # Teams held by untouched incidents stay where they are
+    held = state.held_teams(exclude_incidents=affected)
+    teams = plan_candidate_teams(state, affected, exclude=held)
+    solution = assignment.solve_assignment(incidents, teams, incident_travel_hours, fixed)
+    solution = reserve_solution(state, incidents, solution, teams)
+    
+    for incident in incidents:
+        state.set_incident(incident, allocation_state.slots_from_solution(incident, solution))
+    conflicts = save_plan(state, affected | closed)
+    incidents = [i for i in incidents if i['incident_id'] not in conflicts]
+    
+    # Slot numbering may have changed, so the next batch run starts cold
+    _batch_state['solution'] = None
+    
+    solve_ms = (time.perf_counter() - start) * 1000
+    
+    results = build_batch_results(incidents, solution, body)
+    store_batch_results(results)
+    travel_matrix.get_matrix().flush()
+    
+    logger.info(f"Delta repaired {len(incidents)} of {len(state.incidents)} incidents in {solve_ms:.0f} ms")
+    
+    return {
+        'optimization_id': f"OPT-DELTA-{datetime.now().strftime('%Y%m%d%H%M%S')}",
+        'incidents': results,
+        'closed_incidents': sorted(closed),
+        'uncovered_slots': solution['uncovered_slots'],
+        'solve_time_ms': solve_ms
+    }
+
+def allocate_equipment(entries):
+    """
+    Allocate depot equipment to (incident_id, incident_data, optimization)
+    entries and reserve the shipped units, re-solving when another execution
+    took stock in the meantime
+    """
+    
+    demands = [{
+        'incident_id': incident_id,
+        'priority': incident_data.get('priority', 'MEDIUM'),
+        'units': optimization['resource_requirements']['equipment_units']
+    } for incident_id, incident_data, optimization in entries]
+    incident_ids = [demand['incident_id'] for demand in demands]
+    
+    for attempt in range(equipment_allocation.MAX_STOCK_ATTEMPTS):
+        depots = equipment_allocation.load_depots(fresh=attempt > 0)
+        sites = equipment_allocation.depot_sites(depots)
+        travel_hours = np.zeros((len(depots), len(entries)))
+        for j, (_, incident_data, _) in enumerate(entries):
+            travel_hours[:, j] = incident_travel_hours(sites, incident_data)
+        
+        allocation = _equipment_allocator.allocate(equipment_allocation.stock_for(depots, incident_ids),
+                                                   demands, travel_hours)
+        if equipment_allocation.reserve_stock(depots, allocation):
+            return allocation
+        logger.info("Depot stock changed while allocating equipment, re-solving")
+    
+    logger.error(f"Could not reserve equipment for {len(entries)} incidents")
+    return equipment_allocation.unallocated(demands)
+
+def batch_specializations(incident_data):
+    """Required specializations for an incident, with coordination for CRITICAL ones"""
+    
+    waste_type = incident_data.get('waste_classification', {}).get('primary_type', 'Unknown')
+    hazard_level = incident_data.get('waste_classification', {}).get('hazard_level', 3)
+    
+    specializations = list(determine_required_specializations(waste_type, hazard_level))
+    if incident_data.get('priority') == 'CRITICAL' and 'Coordination' not in specializations:
+        specializations.append('Coordination')
+    
+    return specializations
+
+def load_open_incidents():
+    """Load every incident that is not closed"""
+    table = dynamodb.Table(INCIDENTS_TABLE)
+    kwargs = {'FilterExpression': ~Attr('status').is_in(CLOSED_STATUSES)}
+    incidents = []
+    while True:
+        response = table.scan(**kwargs)
+        incidents.extend(team_catalogue.to_plain(item) for item in response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return incidents
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+@lru_cache(maxsize=256)
+def determine_required_specializations(waste_type, hazard_level):
+    """Determine required team specializations, as a cached tuple keyed by (waste_type, hazard_level)"""
+    
+    base_specializations = SPECIALIZATIONS_BY_WASTE_TYPE.get(waste_type, ('Environmental',))
     
     # Add coordination for high-priority incidents
     if hazard_level >= 4:
-        base_specializations.append('Coordination')
+        return base_specializations + ('Coordination',)
     
     return base_specializations
 
-def select_optimal_teams(available_resources, required_specializations, priority):
+@lru_cache(maxsize=256)
+def required_equipment(waste_type):
+    """Equipment list for a waste type, as a cached tuple"""
+    return BASE_EQUIPMENT + SPECIALIZED_EQUIPMENT.get(waste_type, ())
+
+def select_optimal_teams(available_resources, required_specializations, priority,
+                         team_index=None, countries=None):
     """Select optimal teams based on requirements"""
+    return [team for _, team in select_team_assignments(available_resources, required_specializations,
+                                                        priority, team_index, countries)]
+
+def select_team_assignments(available_resources, required_specializations, priority,
+                            team_index=None, countries=None, location=None, exclude=()):
+    """Select the best team for each requirement, as (specialization, team) pairs, skipping excluded team ids"""
     
-    selected = []
-    covered_specializations = set()
+    # The shared catalogue index already holds the available teams; otherwise index the given list
+    if team_index is None:
+        team_index = SpecializationIndex(available_resources)
+        countries = None
     
-    # Sort teams by capability score
-    sorted_teams = sorted(available_resources, key=lambda x: x['capability'], reverse=True)
+    assignments = []
+    selected_ids = set(exclude)
+    covered_specializations = set()
     
     for specialization in required_specializations:
-        best_team = None
-        best_score = 0
-        
-        for team in sorted_teams:
-            if team['team_id'] not in [t['team_id'] for t in selected]:
-                if specialization.lower() in team['specialization'].lower():
-                    score = team['capability']
-                    if score > best_score:
-                        best_score = score
-                        best_team = team
-        
+        best_team = pick_team(team_index, specialization, countries, selected_ids, location)
         if best_team:
-            selected.append(best_team)
+            assignments.append((specialization, best_team))
+            selected_ids.add(best_team['team_id'])
             covered_specializations.add(specialization)
     
     # Add coordination team for critical incidents
     if priority == 'CRITICAL' and 'Coordination' not in covered_specializations:
-        coord_teams = [t for t in sorted_teams if 'coord' in t['specialization'].lower()]
-        if coord_teams and coord_teams[0]['team_id'] not in [t['team_id'] for t in selected]:
-            selected.append(coord_teams[0])
+        coord_team = pick_team(team_index, 'Coordination', countries, selected_ids, location)
+        if coord_team:
+            assignments.append(('Coordination', coord_team))
+    
+    return assignments
+
+def pick_team(team_index, specialization, countries, exclude, location=None):
+    """
+    Best available team for a specialization, ranked by capability and
+    travel time. Candidates come off the index best first; travel only
+    lowers a score, so once the best score reaches the capability of the
+    last candidate taken no team further down can beat it.
+    """
+    
+    if not location:
+        return team_index.best(specialization, countries, exclude)
     
-    return selected
+    limit = PICK_CANDIDATES
+    while True:
+        candidates = team_index.candidates(specialization, countries, limit, exclude)
+        if not candidates:
+            return None
+        
+        # One row slice of the travel matrix gives every candidate's ETA
+        hours = travel_matrix.get_matrix().eta_hours(candidates, location)
+        scores = np.array([t['capability'] for t in candidates], dtype=np.float64) - ETA_WEIGHT_PER_HOUR * hours
+        best = int(np.argmax(scores))
+        if len(candidates) < limit or scores[best] >= candidates[-1]['capability']:
+            return candidates[best]
+        limit *= 4
 
 def calculate_resource_requirements(incident_data, selected_teams):
     """Calculate detailed resource requirements"""
     
-    base_equipment = ['Communication Systems', 'Safety Equipment', 'Transportation']
-    
     waste_type = incident_data.get('waste_classification', {}).get('primary_type', 'Unknown')
-    
-    specialized_equipment = {
-        'Chemical Hazardous': ['Chemical Suits', 'Neutralization Agents', 'Containment Systems'],
-        'Medical Biological': ['Biohazard Suits', 'Sterilization Equipment', 'Medical Waste Containers'],
-        'Industrial Waste': ['Heavy Machinery', 'Industrial Containers', 'Filtration Systems'],
-        'Disaster Debris': ['Heavy Machinery', 'Sorting Equipment', 'Disposal Trucks']
-    }
-    
-    equipment = base_equipment + specialized_equipment.get(waste_type, [])
+    equipment = required_equipment(waste_type)
     
     return {
         'personnel': len(selected_teams) * 5,  # Assume 5 people per team
-        'equipment': equipment,
+        'equipment': list(equipment),
+        'equipment_units': equipment_allocation.equipment_demand(equipment, len(selected_teams)),
         'vehicles': len(selected_teams) * 2,   # 2 vehicles per team
         'estimated_duration_hours': calculate_estimated_duration(incident_data)
     }
@@ -205,13 +720,16 @@ def calculate_deployment_strategy(optimization):
         country_groups[country].append(team)
     
     deployment_phases = []
+    etas = optimization.get('team_etas', {})
     
-    # Phase 1: Immediate response (highest capability teams)
-    immediate_teams = sorted(teams, key=lambda x: x['capability'], reverse=True)[:2]
+    # Phase 1: Immediate response (highest capability teams, discounted by travel time)
+    immediate_teams = sorted(
+        teams, key=lambda x: x['capability'] - ETA_WEIGHT_PER_HOUR * etas.get(x['team_id'], 0), reverse=True
+    )[:2]
     deployment_phases.append({
         'phase': 'IMMEDIATE',
         'teams': immediate_teams,
-        'deployment_time_hours': 2,
+        'deployment_time_hours': phase_arrival_hours(immediate_teams, etas, 2),
         'objective': 'Initial assessment and containment'
     })
     
@@ -221,7 +739,7 @@ def calculate_deployment_strategy(optimization):
         deployment_phases.append({
             'phase': 'FULL_DEPLOYMENT',
             'teams': remaining_teams,
-            'deployment_time_hours': 6,
+            'deployment_time_hours': phase_arrival_hours(remaining_teams, etas, 6),
             'objective': 'Complete response and cleanup'
         })
     
@@ -231,22 +749,217 @@ def calculate_deployment_strategy(optimization):
         'total_deployment_time': max([p['deployment_time_hours'] for p in deployment_phases])
     }
 
+def route_deployment(entries):
+    """
+    Plan vehicle tours for (incident_data, deployment_strategy) entries and
+    replace phase deployment times with routed arrival times.
+
+    Vehicles leave the staging area (the depot nearest each incident),
+    collect the teams of a phase from their bases, return to the staging
+    area and convoy to the incident. Teams of the same phase staging at the
+    same depot share one capacitated routing problem.
+    """
+    depots = equipment_allocation.load_depots()
+    if not depots:
+        return
+    sites = equipment_allocation.depot_sites(depots)
+    matrix = travel_matrix.get_matrix()
+    deadline = time.perf_counter() + routing.ROUTING_TIME_BUDGET_SECONDS
+    
+    # Group routable teams by (staging depot, phase)
+    groups = {}
+    convoy_hours = {}
+    for n, (incident_data, deployment_strategy) in enumerate(entries):
+        location = incident_location(incident_data)
+        if not location:
+            continue
+        hours = matrix.eta_hours(sites, location)
+        staging = int(np.argmin(hours))
+        convoy_hours[n] = float(hours[staging])
+        for phase in deployment_strategy['deployment_phases']:
+            for team in phase['teams']:
+                if team.get('base_latitude') is None or team.get('base_longitude') is None:
+                    continue
+                groups.setdefault((staging, phase['phase']), []).append((n, phase, team))
+    
+    routed_phases = {}
+    vehicle = 0
+    for (staging, phase_name), stops in groups.items():
+        times = routing.build_time_matrix([sites[staging]] + [team for _, _, team in stops])
+        
+        # Distant teams drive to the staging area themselves
+        for k in np.flatnonzero(times[1:, 0] > routing.MAX_PICKUP_HOURS):
+            n, phase, _ = stops[k]
+            arrival = MOBILIZATION_HOURS + times[k + 1, 0] + convoy_hours[n]
+            routed = routed_phases.setdefault(id(phase), {'phase': phase, 'arrival': 0.0, 'routes': []})
+            routed['arrival'] = max(routed['arrival'], arrival)
+        
+        pickup = np.flatnonzero(times[1:, 0] <= routing.MAX_PICKUP_HOURS)
+        keep = np.concatenate([[0], pickup + 1])
+        times = times[np.ix_(keep, keep)]
+        stops = [stops[k] for k in pickup]
+        
+        loads = [routing.PERSONNEL_PER_TEAM] * len(stops)
+        routes = routing.solve_cvrp(times, loads,
+                                    time_budget=max(deadline - time.perf_counter(), 0))
+        
+        for route in routes:
+            vehicle += 1
+            tour_hours = routing.route_duration(route, times)
+            tour = {
+                'vehicle_id': f"VEH-{vehicle:04d}",
+                'staging_area': depots[staging]['depot_id'],
+                'team_ids': [stops[s - 1][2]['team_id'] for s in route],
+                'tour_hours': round(float(tour_hours), 2)
+            }
+            for s in route:
+                n, phase, _ = stops[s - 1]
+                arrival = MOBILIZATION_HOURS + tour_hours + convoy_hours[n]
+                routed = routed_phases.setdefault(id(phase), {'phase': phase, 'arrival': 0.0, 'routes': []})
+                routed['arrival'] = max(routed['arrival'], arrival)
+                if tour not in routed['routes']:
+                    routed['routes'].append(tour)
+    
+    for routed in routed_phases.values():
+        routed['phase']['deployment_time_hours'] = round(float(routed['arrival']), 1)
+        routed['phase']['routes'] = routed['routes']
+    
+    for _, deployment_strategy in entries:
+        phases = deployment_strategy['deployment_phases']
+        if phases:
+            deployment_strategy['total_deployment_time'] = max(p['deployment_time_hours'] for p in phases)
+
+def schedule_crews(entries):
+    """Shift timelines for (incident_id, incident_data, optimization, deployment_strategy) entries"""
+    
+    plans = []
+    incidents = {}
+    for incident_id, incident_data, optimization, deployment_strategy in entries:
+        incidents[incident_id] = incident_data
+        start = calculate_response_time(deployment_strategy)
+        slots = [
+            (team['specialization'], team, phase['deployment_time_hours'])
+            for phase in deployment_strategy['deployment_phases'] for team in phase['teams']
+        ]
+        plans.append({
+            'incident_id': incident_id,
+            'priority': incident_data.get('priority', 'MEDIUM'),
+            'end_hours': start + optimization['resource_requirements']['estimated_duration_hours'],
+            'slots': slots
+        })
+    
+    def relief_candidates(specialization, incident_id):
+        incident_data = incidents[incident_id]
+        countries = incident_data.get('affected_countries', [])
+        candidates = team_catalogue.get_specialization_index(countries).candidates(specialization, countries)
+        location = incident_location(incident_data)
+        if not location or not candidates:
+            return [(team, MOBILIZATION_HOURS) for team in candidates]
+        arrivals = MOBILIZATION_HOURS + travel_matrix.get_matrix().eta_hours(candidates, location)
+        return [(candidates[k], float(arrivals[k])) for k in np.argsort(arrivals, kind='stable')]
+    
+    return shift_scheduling.schedule_shifts(plans, relief_candidates)
+
+def phase_arrival_hours(teams, etas, default_hours):
+    """Hours until the last team of a phase arrives, or the default when no ETA is known"""
+    known = [etas[t['team_id']] for t in teams if t['team_id'] in etas]
+    if not known:
+        return default_hours
+    return round(MOBILIZATION_HOURS + max(known), 1)
+
 def calculate_optimization_score(selected_teams, required_specializations):
-    """Calculate optimization effectiveness score"""
+    """Calculate optimization effectiveness score (0-100)"""
     
     if not selected_teams:
         return 0
     
-    # Base score from team capabilities
-    capability_score = sum(team['capability'] for team in selected_teams) / len(selected_teams)
+    # Base score from team capabilities, 0-10 scaled to 0-1
+    capability_score = sum(team['capability'] for team in selected_teams) / len(selected_teams) / 10
     
-    # Coverage score (how many required specializations are covered)
+    # Coverage score (share of required specializations covered)
     covered = sum(1 for spec in required_specializations 
                  if any(spec.lower() in team['specialization'].lower() for team in selected_teams))
-    coverage_score = (covered / len(required_specializations)) * 100 if required_specializations else 100
+    coverage_score = covered / len(required_specializations) if required_specializations else 1
+    
+    # Combined score, both parts on the same 0-1 scale
+    return round((capability_score * 0.6 + coverage_score * 0.4) * 100, 1)
+
+def optimize_pareto(body):
+    """
+    Approximately non-dominated plans for one incident across cost, response
+    time and coverage, so coordinators can choose the trade-off themselves
+    """
+    
+    incident_data = body.get('incident_data', {})
+    countries = incident_data.get('affected_countries', [])
+    location = incident_location(incident_data)
+    team_index = team_catalogue.get_specialization_index(countries)
+    
+    required_specializations = batch_specializations(incident_data)
     
-    # Combined score
-    return (capability_score * 0.6 + coverage_score * 0.4)
+    slots = []
+    for specialization in required_specializations:
+        candidates = team_index.candidates(specialization, countries)
+        if location and candidates:
+            etas = travel_matrix.get_matrix().eta_hours(candidates, location)
+        else:
+            etas = np.zeros(len(candidates))
+        slots.append((specialization, candidates, etas))
+    
+    # Teams are paid and vehicles run from dispatch until the incident is closed
+    duration = calculate_estimated_duration(incident_data)
+    hourly = COST_RATES['team_per_hour'] + 2 * COST_RATES['vehicle_per_hour']
+    plans, elapsed_ms = pareto.pareto_plans(
+        slots,
+        lambda team, eta: (MOBILIZATION_HOURS + eta + duration) * hourly,
+        fixed_cost=COST_RATES['equipment_base'],
+        max_plans=int(body.get('max_plans', pareto.MAX_PARETO_PLANS))
+    )
+    travel_matrix.get_matrix().flush()
+    
+    return {
+        'optimization_id': f"OPT-PARETO-{body.get('incident_id')}",
+        'plans': [{
+            'teams': [team for _, team in plan['assignments']],
+            'specializations_covered': [specialization for specialization, _ in plan['assignments']],
+            'estimated_cost': round(plan['cost'], 2),
+            'estimated_response_time': round(MOBILIZATION_HOURS + plan['eta_hours'], 1) if plan['assignments'] else None,
+            'coverage': round(plan['coverage'], 3),
+            'optimization_score': calculate_optimization_score([team for _, team in plan['assignments']],
+                                                               required_specializations)
+        } for plan in plans],
+        'required_specializations': required_specializations,
+        'search_time_ms': elapsed_ms
+    }
+
+def plan_prepositioning(body):
+    """
+    Forecast incident demand for the coming days and move teams ahead of
+    it. None when no trained forecast model is available.
+    """
+    
+    start = time.perf_counter()
+    horizon_days = int(body.get('horizon_days', 3))
+    
+    model = demand_forecast.get_model()
+    if model is None:
+        return None
+    forecast = demand_forecast.forecast(model, horizon_days)
+    demand = prepositioning.regional_demand(model, forecast, determine_required_specializations)
+    plan = prepositioning.plan_moves(model, demand, team_catalogue.get_teams(status='AVAILABLE'))
+    travel_matrix.get_matrix().flush()
+    
+    return {
+        'optimization_id': f"OPT-FORECAST-{datetime.now().strftime('%Y%m%d%H%M%S')}",
+        'horizon_days': horizon_days,
+        'forecast': sorted(
+            (row for row in forecast if row['expected_incidents'] > 0),
+            key=lambda row: -row['expected_incidents']
+        ),
+        'demand': {region: {s: round(v, 2) for s, v in needs.items()} for region, needs in demand.items()},
+        **plan,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 2)
+    }
 
 def calculate_total_cost(optimization):
     """Calculate estimated total cost"""
@@ -254,17 +967,29 @@ def calculate_total_cost(optimization):
     teams = optimization['selected_teams']
     requirements = optimization['resource_requirements']
     
-    # Cost estimates (in USD)
-    team_cost_per_hour = 500
-    equipment_base_cost = 10000
-    vehicle_cost_per_hour = 100
-    
-    personnel_cost = len(teams) * team_cost_per_hour * requirements['estimated_duration_hours']
-    equipment_cost = equipment_base_cost
-    vehicle_cost = requirements['vehicles'] * vehicle_cost_per_hour * requirements['estimated_duration_hours']
+    personnel_cost = len(teams) * COST_RATES['team_per_hour'] * requirements['estimated_duration_hours']
+    equipment_cost = COST_RATES['equipment_base']
+    vehicle_cost = requirements['vehicles'] * COST_RATES['vehicle_per_hour'] * requirements['estimated_duration_hours']
     
     return personnel_cost + equipment_cost + vehicle_cost
 
+def risk_samples(body):
+    """The request's risk sample count, or None when it is not an integer in the allowed range"""
+    samples = body.get('risk_samples', risk_simulation.DEFAULT_SAMPLES)
+    if not isinstance(samples, int) or isinstance(samples, bool):
+        return None
+    if not risk_simulation.MIN_SAMPLES <= samples <= risk_simulation.MAX_SAMPLES:
+        return None
+    return samples
+
+def simulate_risk(optimization, deployment_strategy, body):
+    """Percentile distributions of response time and cost for a plan"""
+    return risk_simulation.simulate_plan_risk(
+        optimization, deployment_strategy, COST_RATES, MOBILIZATION_HOURS,
+        samples=risk_samples(body),
+        seed=body.get('risk_seed')
+    )
+
 def calculate_response_time(deployment_strategy):
     """Calculate estimated response time"""
     
@@ -295,13 +1020,40 @@ def calculate_estimated_duration(incident_data):
 def store_optimization_results(incident_id, optimization, deployment_strategy):
     """Store optimization results in DynamoDB"""
     try:
-        table = dynamodb.Table('ResourceOptimization')
-        table.put_item(Item={
+        table = dynamodb.Table(OPTIMIZATION_TABLE)
+        table.put_item(Item=convert_decimals({
             'incident_id': incident_id,
             'optimization_timestamp': datetime.now().isoformat(),
             'selected_teams': optimization['selected_teams'],
             'deployment_strategy': deployment_strategy,
             'optimization_score': optimization['optimization_score']
-        })
+        }))
     except Exception as e:
         logger.error(f"Failed to store optimization results: {str(e)}")
+
+def store_batch_results(results):
+    """Store batch optimization results with batched writes"""
+    try:
+        table = dynamodb.Table(OPTIMIZATION_TABLE)
+        timestamp = datetime.now().isoformat()
+        with table.batch_writer() as batch:
+            for result in results:
+                batch.put_item(Item=convert_decimals({
+                    'incident_id': result['incident_id'],
+                    'optimization_timestamp': timestamp,
+                    'selected_teams': result['resource_allocation']['selected_teams'],
+                    'deployment_strategy': result['deployment_strategy'],
+                    'optimization_score': result['resource_allocation']['optimization_score']
+                }))
+    except Exception as e:
+        logger.error(f"Failed to store batch optimization results: {str(e)}")
+
+def convert_decimals(obj):
+    """Convert float values to Decimal for DynamoDB"""
+    if isinstance(obj, dict):
+        return {k: convert_decimals(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [convert_decimals(v) for v in obj]
+    elif isinstance(obj, float):
+        return Decimal(str(obj))
+    return obj
@@ -0,0 +1,190 @@
+import math
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from specialization_index import SpecializationIndex
+
+# Objective weights
+PRIORITY_WEIGHTS = {'CRITICAL': 8, 'HIGH': 4, 'MEDIUM': 2, 'LOW': 1}
+COVERAGE_VALUE = 10          # value of covering a slot, on the 0-10 capability scale
+TRAVEL_COST_PER_HOUR = 0.5   # score lost per hour of team travel
+
+# Each slot keeps only its best candidates; exact whenever a connected
+# component has no more slots than this
+MAX_CANDIDATES_PER_SLOT = 64
+
+AVERAGE_SPEED_KMH = 60
+
+def build_slots(incidents):
+    """Expand incidents into one slot per required specialization"""
+    slots = []
+    for incident in incidents:
+        for n, specialization in enumerate(incident['required_specializations']):
+            slots.append({
+                'slot_id': f"{incident['incident_id']}#{n}",
+                'incident': incident,
+                'specialization': specialization,
+                'weight': PRIORITY_WEIGHTS.get(incident.get('priority', 'MEDIUM'), 2)
+            })
+    return slots
+
+def slot_incident_id(slot_id):
+    """Incident id a slot id belongs to"""
+    return slot_id.rsplit('#', 1)[0]
+
+def estimate_travel_hours(team, incident):
+    """Great-circle travel estimate from team base to incident location"""
+    location = incident.get('location') or {}
+    if 'base_latitude' not in team or 'latitude' not in location:
+        return 0.0
+    distance = haversine_km(float(team['base_latitude']), float(team['base_longitude']),
+                            float(location['latitude']), float(location['longitude']))
+    return distance / AVERAGE_SPEED_KMH
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in kilometres"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+def estimate_travel_hours_many(teams, incident):
+    """Travel estimates for several teams to one incident"""
+    return np.array([estimate_travel_hours(team, incident) for team in teams], dtype=np.float64)
+
+def score_teams(slot, teams, travel_times):
+    """Weighted coverage value of putting each team in a slot, net of travel"""
+    if not teams:
+        return np.zeros(0)
+    capability = np.array([team['capability'] for team in teams], dtype=np.float64)
+    hours = np.asarray(travel_times(teams, slot['incident']), dtype=np.float64)
+    return slot['weight'] * (COVERAGE_VALUE + capability) - TRAVEL_COST_PER_HOUR * hours
+
+def solve_assignment(incidents, teams, travel_times=None, fixed=None):
+    """
+    Assign available teams to the slots of all incidents at once, maximizing
+    priority-weighted coverage minus travel cost. Each team serves at most one slot.
+
+    ``travel_times(teams, incident)`` returns travel hours for a list of
+    teams. ``fixed`` maps slot ids to team ids that must be kept as they
+    are; only the remaining slots are solved.
+    """
+    travel_times = travel_times or estimate_travel_hours_many
+    fixed = fixed or {}
+
+    slots = build_slots(incidents)
+    slot_by_id = {s['slot_id']: s for s in slots}
+    teams_by_id = {t['team_id']: t for t in teams}
+
+    fixed = {slot_id: team_id for slot_id, team_id in fixed.items()
+             if slot_id in slot_by_id and team_id in teams_by_id}
+    taken = set(fixed.values())
+    open_slots = [s for s in slots if s['slot_id'] not in fixed]
+
+    index = SpecializationIndex(t for t in teams if t['team_id'] not in taken)
+
+    # Sparse candidate edges, pruned to each slot's best candidates
+    rows, cols, scores = [], [], []
+    column_of = {}
+    column_teams = []
+    for r, slot in enumerate(open_slots):
+        candidates = index.candidates(slot['specialization'], slot['incident'].get('affected_countries', []))
+        candidate_scores = score_teams(slot, candidates, travel_times)
+        keep = np.flatnonzero(candidate_scores > 0)
+        if len(keep) > MAX_CANDIDATES_PER_SLOT:
+            keep = keep[np.argpartition(-candidate_scores[keep], MAX_CANDIDATES_PER_SLOT)[:MAX_CANDIDATES_PER_SLOT]]
+
+        for k in keep:
+            team, score = candidates[k], float(candidate_scores[k])
+            c = column_of.get(team['team_id'])
+            if c is None:
+                c = column_of[team['team_id']] = len(column_teams)
+                column_teams.append(team)
+            rows.append(r)
+            cols.append(c)
+            scores.append(score)
+
+    assigned = dict(fixed)
+    assigned.update(match_components(open_slots, column_teams, rows, cols, scores))
+
+    return build_solution(incidents, slots, assigned, teams_by_id, travel_times)
+
+def match_components(open_slots, column_teams, rows, cols, scores):
+    """Solve each connected component of the candidate graph with the Hungarian method"""
+    if not rows:
+        return {}
+
+    n_rows = len(open_slots)
+    rows = np.asarray(rows)
+    cols = np.asarray(cols)
+    scores = np.asarray(scores, dtype=np.float64)
+
+    size = n_rows + len(column_teams)
+    graph = coo_matrix((np.ones(len(rows)), (rows, cols + n_rows)), shape=(size, size))
+    _, labels = connected_components(graph, directed=False)
+
+    edge_component = labels[rows]
+    order = np.argsort(edge_component, kind='stable')
+    boundaries = np.flatnonzero(np.diff(edge_component[order])) + 1
+
+    assigned = {}
+    for edges in np.split(order, boundaries):
+        comp_rows, row_pos = np.unique(rows[edges], return_inverse=True)
+        comp_cols, col_pos = np.unique(cols[edges], return_inverse=True)
+
+        # Missing edges cost 0, the same as leaving the slot unassigned
+        cost = np.zeros((len(comp_rows), len(comp_cols)))
+        cost[row_pos, col_pos] = -scores[edges]
+
+        for i, j in zip(*linear_sum_assignment(cost)):
+            if cost[i, j] < 0:
+                assigned[open_slots[comp_rows[i]]['slot_id']] = column_teams[comp_cols[j]]['team_id']
+
+    return assigned
+
+def build_solution(incidents, slots, assigned, teams_by_id, travel_times):
+    """Group slot assignments back into per-incident allocations"""
+    allocations = {
+        incident['incident_id']: {'selected_teams': [], 'specializations_covered': [], 'uncovered': []}
+        for incident in incidents
+    }
+
+    objective = 0.0
+    for slot in slots:
+        allocation = allocations[slot['incident']['incident_id']]
+        team_id = assigned.get(slot['slot_id'])
+        if team_id is None:
+            allocation['uncovered'].append(slot['specialization'])
+            continue
+
+        team = teams_by_id[team_id]
+        objective += float(score_teams(slot, [team], travel_times)[0])
+        allocation['selected_teams'].append(team)
+        allocation['specializations_covered'].append(slot['specialization'])
+
+    return {
+        'slot_assignments': {slot_id: team_id for slot_id, team_id in assigned.items()},
+        'incidents': allocations,
+        'objective': objective,
+        'uncovered_slots': sum(len(a['uncovered']) for a in allocations.values())
+    }
+
+def resolve_assignment(previous, incidents, teams, changed_incident_ids=(), changed_team_ids=(), travel_times=None):
+    """
+    Warm-started re-solve: keep every previous slot assignment whose incident
+    and team are unchanged and still available, and solve only the rest.
+    """
+    changed_incident_ids = set(changed_incident_ids)
+    changed_team_ids = set(changed_team_ids)
+    available = {t['team_id'] for t in teams}
+
+    fixed = {
+        slot_id: team_id
+        for slot_id, team_id in previous.get('slot_assignments', {}).items()
+        if slot_incident_id(slot_id) not in changed_incident_ids
+        and team_id not in changed_team_ids
+        and team_id in available
+    }
+    return solve_assignment(incidents, teams, travel_times, fixed)
@@ -0,0 +1,289 @@
+"""
+Incident demand forecasting by region, waste type and hazard level.
+
+The model is a ridge regression on log counts with a trend, day-of-week
+and annual harmonics, fitted jointly for every series in one solve. It is
+trained offline from the DisasterIncidents and ResourceOptimization
+history, saved as an .npz artifact and uploaded to the model bucket:
+
+    python demand_forecast.py --output demand-forecast.npz --bucket <ModelArtifactsBucket>
+
+The Lambda only loads that artifact; it never trains inside a request.
+"""
+import os
+import sys
+import time
+import io
+import argparse
+import logging
+from datetime import datetime, timezone
+
+import boto3
+import numpy as np
+from botocore.exceptions import ClientError
+
+from team_catalogue import to_plain
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+dynamodb = boto3.resource('dynamodb')
+s3 = boto3.client('s3')
+
+INCIDENTS_TABLE = os.environ.get('INCIDENTS_TABLE', 'DisasterIncidents')
+OPTIMIZATION_TABLE = os.environ.get('OPTIMIZATION_TABLE', 'ResourceOptimization')
+MODEL_BUCKET = os.environ.get('FORECAST_MODEL_BUCKET')
+MODEL_KEY = os.environ.get('FORECAST_MODEL_KEY', 'models/demand-forecast.npz')
+
+# Artifact shipped in the deployment package, used when no bucket is configured
+PACKAGED_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'demand-forecast.npz')
+
+# Seconds between checks for a newer artifact in the bucket
+MODEL_CHECK_SECONDS = float(os.environ.get('FORECAST_MODEL_CHECK_SECONDS', '300'))
+
+HISTORY_DAYS = 365
+RIDGE_PENALTY = 1.0
+ANNUAL_HARMONICS = 2
+
+SECONDS_PER_DAY = 86400
+
+def incident_day(incident):
+    """Days since the epoch an incident was reported, or None"""
+    stamp = incident.get('created_at') or incident.get('timestamp')
+    if not stamp:
+        return None
+    try:
+        moment = datetime.fromisoformat(str(stamp))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() // SECONDS_PER_DAY)
+
+def incident_columns(incidents):
+    """Incident history as column arrays"""
+    rows = []
+    for incident in incidents:
+        day = incident_day(incident)
+        if day is None:
+            continue
+        classification = incident.get('waste_classification') or {}
+        location = incident.get('location') or {}
+        countries = incident.get('affected_countries') or ['Unknown']
+        rows.append((
+            incident.get('incident_id'),
+            day,
+            countries[0],
+            classification.get('primary_type', 'Unknown'),
+            int(classification.get('hazard_level', 3)),
+            float(location['latitude']) if location.get('latitude') is not None else np.nan,
+            float(location['longitude']) if location.get('longitude') is not None else np.nan
+        ))
+
+    ids, days, regions, waste_types, hazards, lats, lngs = zip(*rows) if rows else ([],) * 7
+    return {
+        'incident_id': np.array(ids, dtype=object),
+        'day': np.array(days, dtype=np.int64),
+        'region': np.array(regions, dtype=object),
+        'waste_type': np.array(waste_types, dtype=object),
+        'hazard_level': np.array(hazards, dtype=np.int64),
+        'latitude': np.array(lats, dtype=np.float64),
+        'longitude': np.array(lngs, dtype=np.float64)
+    }
+
+def scan_table(table_name, projection, names=None):
+    """Every item of a table, restricted to a projection"""
+    table = dynamodb.Table(table_name)
+    kwargs = {'ProjectionExpression': projection}
+    if names:
+        kwargs['ExpressionAttributeNames'] = names
+    items = []
+    while True:
+        response = table.scan(**kwargs)
+        items.extend(to_plain(item) for item in response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def load_history():
+    """Incident columns and {incident_id: teams deployed by specialization}"""
+    incidents = scan_table(
+        INCIDENTS_TABLE,
+        'incident_id, created_at, #ts, affected_countries, waste_classification, #loc',
+        {'#ts': 'timestamp', '#loc': 'location'}
+    )
+    optimizations = scan_table(OPTIMIZATION_TABLE, 'incident_id, selected_teams')
+
+    deployed = {}
+    for item in optimizations:
+        counts = {}
+        for team in item.get('selected_teams') or []:
+            counts[team.get('specialization', 'Unknown')] = counts.get(team.get('specialization', 'Unknown'), 0) + 1
+        deployed[item['incident_id']] = counts
+    return incident_columns(incidents), deployed
+
+def design_matrix(days, origin):
+    """Intercept, trend, day-of-week and annual harmonics for each day"""
+    days = np.asarray(days, dtype=np.float64)
+    columns = [np.ones_like(days), (days - origin) / 365.0]
+    weekday = (days.astype(np.int64) + 3) % 7          # 1970-01-01 was a Thursday
+    for d in range(1, 7):
+        columns.append((weekday == d).astype(np.float64))
+    for k in range(1, ANNUAL_HARMONICS + 1):
+        angle = 2 * np.pi * k * days / 365.25
+        columns.extend([np.sin(angle), np.cos(angle)])
+    return np.column_stack(columns)
+
+def train(columns, deployed, end_day=None, history_days=HISTORY_DAYS, ridge=RIDGE_PENALTY):
+    """
+    Fit one regression per (region, waste_type, hazard_level) series over
+    the last ``history_days``, all series in a single least-squares solve
+    """
+    if end_day is None:
+        end_day = int(time.time() // SECONDS_PER_DAY)
+    start_day = end_day - history_days
+    window = (columns['day'] >= start_day) & (columns['day'] < end_day)
+
+    keys = np.array([f"{r}|{w}|{h}" for r, w, h in zip(
+        columns['region'][window], columns['waste_type'][window], columns['hazard_level'][window]
+    )], dtype=object)
+    series, series_index = np.unique(keys, return_inverse=True)
+
+    # Daily counts, days x series
+    counts = np.zeros((history_days, len(series)))
+    np.add.at(counts, (columns['day'][window] - start_day, series_index), 1)
+
+    x = design_matrix(np.arange(start_day, end_day), start_day)
+    penalty = ridge * np.eye(x.shape[1])
+    penalty[0, 0] = 0.0                                    # leave the intercept unpenalized
+    coefficients = np.linalg.solve(x.T @ x + penalty, x.T @ np.log1p(counts))
+
+    # Where each region's incidents happen, for pre-positioning
+    regions, region_index = np.unique(columns['region'][window], return_inverse=True)
+    centres = np.full((len(regions), 2), np.nan)
+    for r in range(len(regions)):
+        lats = columns['latitude'][window][region_index == r]
+        lngs = columns['longitude'][window][region_index == r]
+        if np.isfinite(lats).any():
+            centres[r] = [np.nanmean(lats), np.nanmean(lngs)]
+
+    # Teams actually deployed per incident of each series, by specialization
+    specializations = sorted({s for counts_by_spec in deployed.values() for s in counts_by_spec})
+    teams_per_incident = np.zeros((len(series), len(specializations)))
+    incidents_seen = np.zeros(len(series))
+    spec_column = {s: k for k, s in enumerate(specializations)}
+    for incident_id, s in zip(columns['incident_id'][window], series_index):
+        counts_by_spec = deployed.get(incident_id)
+        if counts_by_spec is None:
+            continue
+        incidents_seen[s] += 1
+        for specialization, n in counts_by_spec.items():
+            teams_per_incident[s, spec_column[specialization]] += n
+    seen = incidents_seen > 0
+    teams_per_incident[seen] /= incidents_seen[seen, None]
+
+    # Keys are stored as plain strings so the artifact loads without pickle
+    return {
+        'series': np.array(series, dtype=str),
+        'coefficients': coefficients,
+        'origin': np.int64(start_day),
+        'end_day': np.int64(end_day),
+        'regions': np.array(regions, dtype=str),
+        'region_centres': centres,
+        'specializations': np.array(specializations, dtype=str),
+        'teams_per_incident': teams_per_incident,
+        'calibrated': seen
+    }
+
+def forecast(model, horizon_days, start_day=None):
+    """Expected incident counts per series over the next ``horizon_days``"""
+    if start_day is None:
+        start_day = int(model['end_day'])
+    x = design_matrix(np.arange(start_day, start_day + horizon_days), int(model['origin']))
+    daily = np.clip(np.expm1(x @ model['coefficients']), 0, None)
+
+    expected = daily.sum(axis=0)
+    results = []
+    for key, value, peak in zip(model['series'], expected, daily.max(axis=0)):
+        region, waste_type, hazard_level = key.split('|')
+        results.append({
+            'region': region,
+            'waste_type': waste_type,
+            'hazard_level': int(hazard_level),
+            'expected_incidents': round(float(value), 2),
+            'peak_daily_incidents': round(float(peak), 2)
+        })
+    return results
+
+def save_model(model, path=PACKAGED_MODEL_PATH):
+    """Write a trained model as an .npz artifact"""
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, **model)
+    os.replace(tmp_path, path)
+
+def read_model(source):
+    """Model arrays from an .npz path or file object; object arrays are refused"""
+    with np.load(source, allow_pickle=False) as data:
+        return {key: data[key] for key in data.files}
+
+_model = {'model': None, 'etag': None, 'checked_at': 0.0}
+
+def get_model():
+    """
+    The offline-trained model, or None when no artifact is available.
+
+    With FORECAST_MODEL_BUCKET set, the artifact is read from S3 and its
+    ETag is re-checked at most every MODEL_CHECK_SECONDS; an unchanged
+    artifact is not downloaded again. Otherwise the artifact packaged with
+    the function is used.
+    """
+    now = time.monotonic()
+    if _model['model'] is not None and now - _model['checked_at'] < MODEL_CHECK_SECONDS:
+        return _model['model']
+    _model['checked_at'] = now
+
+    if not MODEL_BUCKET:
+        if _model['model'] is None and os.path.exists(PACKAGED_MODEL_PATH):
+            _model['model'] = read_model(PACKAGED_MODEL_PATH)
+        return _model['model']
+
+    kwargs = {'Bucket': MODEL_BUCKET, 'Key': MODEL_KEY}
+    if _model['etag']:
+        kwargs['IfNoneMatch'] = _model['etag']
+    try:
+        response = s3.get_object(**kwargs)
+        model = read_model(io.BytesIO(response['Body'].read()))
+        _model['model'], _model['etag'] = model, response['ETag']
+        logger.info(f"Loaded forecast model s3://{MODEL_BUCKET}/{MODEL_KEY} ({response['ETag']})")
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('304', 'NotModified'):
+            # Keep serving the model already loaded, if any
+            logger.error(f"Failed to load forecast model s3://{MODEL_BUCKET}/{MODEL_KEY}: {str(e)}")
+    return _model['model']
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the incident demand forecast')
+    parser.add_argument('--output', default=PACKAGED_MODEL_PATH, help='model artifact path')
+    parser.add_argument('--bucket', default=MODEL_BUCKET, help='upload the artifact to this S3 bucket')
+    parser.add_argument('--key', default=MODEL_KEY, help='S3 key of the uploaded artifact')
+    parser.add_argument('--history-days', type=int, default=HISTORY_DAYS)
+    parser.add_argument('--horizon-days', type=int, default=3, help='print a forecast for this many days')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    columns, deployed = load_history()
+    model = train(columns, deployed, history_days=args.history_days)
+    save_model(model, args.output)
+    print(f"Trained {len(model['series'])} series from {len(columns['day'])} incidents "
+          f"in {time.perf_counter() - start:.1f}s -> {args.output}")
+    if args.bucket:
+        s3.upload_file(args.output, args.bucket, args.key)
+        print(f"Uploaded to s3://{args.bucket}/{args.key}")
+
+    for row in sorted(forecast(model, args.horizon_days), key=lambda r: -r['expected_incidents'])[:20]:
+        print(f"{row['region']:<20} {row['waste_type']:<20} hazard={row['hazard_level']} "
+              f"expected={row['expected_incidents']:.2f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,338 @@
+import os
+import time
+import logging
+
+import boto3
+import numpy as np
+from botocore.exceptions import ClientError
+from scipy.optimize import linprog
+from scipy.sparse import coo_matrix
+
+from assignment import PRIORITY_WEIGHTS
+from team_catalogue import to_plain
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+dynamodb = boto3.resource('dynamodb')
+dynamodb_client = boto3.client('dynamodb')
+
+DEPOTS_TABLE = os.environ.get('DEPOTS_TABLE', 'EquipmentDepots')
+DEPOT_CACHE_SECONDS = float(os.environ.get('DEPOT_CACHE_SECONDS', '60'))
+
+# Re-solves after depot stock changed between reading and reserving it
+MAX_STOCK_ATTEMPTS = 3
+
+# Depot updates per TransactWriteItems call
+TRANSACTION_LIMIT = 100
+
+# Cost of leaving one unit unmet, in travel hours, before priority weighting
+SHORTAGE_PENALTY_HOURS = 1000
+
+# Units of each item needed per deployed team (default 1)
+EQUIPMENT_UNITS_PER_TEAM = {
+    'Safety Equipment': 5,
+    'Chemical Suits': 5,
+    'Biohazard Suits': 5,
+    'Transportation': 2
+}
+
+# Sample depots used when the EquipmentDepots table is empty or unreachable; their stock is not reserved
+SAMPLE_DEPOTS = [
+    {'depot_id': 'BD-DEPOT-DHK', 'country': 'Bangladesh', 'latitude': 23.81, 'longitude': 90.41,
+     'stock': {'Communication Systems': 20, 'Safety Equipment': 200, 'Transportation': 30, 'Chemical Suits': 60,
+               'Neutralization Agents': 10, 'Containment Systems': 8, 'Heavy Machinery': 6, 'Disposal Trucks': 10,
+               'Sorting Equipment': 6, 'Biohazard Suits': 40, 'Medical Waste Containers': 20}},
+    {'depot_id': 'IN-DEPOT-CCU', 'country': 'India', 'latitude': 22.57, 'longitude': 88.36,
+     'stock': {'Communication Systems': 30, 'Safety Equipment': 300, 'Transportation': 40, 'Chemical Suits': 80,
+               'Neutralization Agents': 15, 'Containment Systems': 12, 'Heavy Machinery': 10, 'Industrial Containers': 12,
+               'Filtration Systems': 6, 'Sterilization Equipment': 6}},
+    {'depot_id': 'US-DEPOT-DC', 'country': 'United States', 'latitude': 38.90, 'longitude': -77.04,
+     'stock': {'Communication Systems': 50, 'Safety Equipment': 500, 'Transportation': 60, 'Chemical Suits': 150,
+               'Neutralization Agents': 30, 'Containment Systems': 20, 'Biohazard Suits': 100,
+               'Sterilization Equipment': 10, 'Medical Waste Containers': 40}},
+    {'depot_id': 'CA-DEPOT-WPG', 'country': 'Canada', 'latitude': 49.90, 'longitude': -97.14,
+     'stock': {'Communication Systems': 25, 'Safety Equipment': 250, 'Transportation': 40, 'Heavy Machinery': 12,
+               'Sorting Equipment': 10, 'Disposal Trucks': 20, 'Filtration Systems': 8}},
+    {'depot_id': 'DE-DEPOT-DUI', 'country': 'Germany', 'latitude': 51.43, 'longitude': 6.76,
+     'stock': {'Communication Systems': 30, 'Safety Equipment': 300, 'Transportation': 40, 'Chemical Suits': 100,
+               'Containment Systems': 15, 'Heavy Machinery': 15, 'Industrial Containers': 20, 'Filtration Systems': 10}},
+    {'depot_id': 'NL-DEPOT-RTM', 'country': 'Netherlands', 'latitude': 51.92, 'longitude': 4.48,
+     'stock': {'Communication Systems': 20, 'Safety Equipment': 200, 'Transportation': 30, 'Filtration Systems': 12,
+               'Containment Systems': 10, 'Sorting Equipment': 8, 'Disposal Trucks': 12}}
+]
+
+_depot_cache = {'depots': None, 'loaded_at': 0.0, 'source': 'table'}
+
+def equipment_demand(equipment, team_count):
+    """Units of each listed item an incident needs for its deployed teams"""
+    teams = max(team_count, 1)
+    return {item: EQUIPMENT_UNITS_PER_TEAM.get(item, 1) * teams for item in equipment}
+
+def load_depots(fresh=False):
+    """
+    Depot locations and stock levels, cached in the container. ``stock``
+    holds the units still free; ``reserved`` maps ``<incident_id>|<item>``
+    to the units held for an incident.
+    """
+    now = time.monotonic()
+    if not fresh and _depot_cache['depots'] is not None and now - _depot_cache['loaded_at'] < DEPOT_CACHE_SECONDS:
+        return _depot_cache['depots']
+
+    try:
+        table = dynamodb.Table(DEPOTS_TABLE)
+        kwargs = {}
+        depots = []
+        while True:
+            response = table.scan(**kwargs)
+            depots.extend(to_plain(item) for item in response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    except Exception as e:
+        logger.error(f"Failed to load equipment depots: {str(e)}")
+        depots = []
+
+    _depot_cache['source'] = 'table' if depots else 'sample'
+    if not depots:
+        depots = SAMPLE_DEPOTS
+
+    _depot_cache['depots'] = depots
+    _depot_cache['loaded_at'] = now
+    return depots
+
+def depot_sites(depots):
+    """Depots as travel-matrix sites (matrix columns are keyed by team_id)"""
+    return [{
+        'team_id': f"depot:{d['depot_id']}",
+        'base_latitude': d['latitude'],
+        'base_longitude': d['longitude']
+    } for d in depots]
+
+def stock_for(depots, incident_ids):
+    """Depots with the units already reserved for the given incidents counted as free again"""
+    prefixes = tuple(f"{incident_id}|" for incident_id in incident_ids)
+    result = []
+    for depot in depots:
+        stock = dict(depot.get('stock', {}))
+        for key, units in depot.get('reserved', {}).items():
+            if key.startswith(prefixes):
+                item = key.rsplit('|', 1)[1]
+                stock[item] = stock.get(item, 0) + units
+        result.append(dict(depot, stock=stock))
+    return result
+
+def stock_changes(depots, allocation):
+    """
+    {depot_id: [(item, key, previous, new)]} for every reservation of the
+    allocated incidents that differs from what the depot currently holds
+    """
+    shipped = {}
+    for incident_id, items in allocation.items():
+        for item, result in items.items():
+            for shipment in result['shipments']:
+                shipped[(shipment['depot_id'], f"{incident_id}|{item}")] = shipment['quantity']
+
+    prefixes = tuple(f"{incident_id}|" for incident_id in allocation)
+    changes = {}
+    for depot in depots:
+        reserved = depot.get('reserved', {})
+        keys = {key for key in reserved if key.startswith(prefixes)}
+        keys |= {key for depot_id, key in shipped if depot_id == depot['depot_id']}
+        for key in sorted(keys):
+            previous, new = reserved.get(key, 0), shipped.get((depot['depot_id'], key), 0)
+            if new != previous:
+                changes.setdefault(depot['depot_id'], []).append((key.rsplit('|', 1)[1], key, previous, new))
+    return changes
+
+def depot_update(depot_id, changes):
+    """
+    Transaction item moving units between a depot's free stock and its
+    reservations, conditional on the stock and reservations read
+    """
+    names = {'#stock': 'stock', '#reserved': 'reserved'}
+    values = {}
+    sets, removes, conditions = [], [], []
+    for n, (item, key, previous, new) in enumerate(changes):
+        names[f'#i{n}'] = item
+        names[f'#k{n}'] = key
+        values[f':d{n}'] = {'N': str(new - previous)}
+        sets.append(f"#stock.#i{n} = #stock.#i{n} - :d{n}")
+        if new > previous:
+            conditions.append(f"#stock.#i{n} >= :d{n}")
+        if new:
+            values[f':n{n}'] = {'N': str(new)}
+            sets.append(f"#reserved.#k{n} = :n{n}")
+        else:
+            removes.append(f"#reserved.#k{n}")
+        if previous:
+            values[f':p{n}'] = {'N': str(previous)}
+            conditions.append(f"#reserved.#k{n} = :p{n}")
+        else:
+            conditions.append(f"attribute_not_exists(#reserved.#k{n})")
+
+    expression = 'SET ' + ', '.join(sets) + (' REMOVE ' + ', '.join(removes) if removes else '')
+    return {
+        'Update': {
+            'TableName': DEPOTS_TABLE,
+            'Key': {'depot_id': {'S': depot_id}},
+            'UpdateExpression': expression,
+            'ConditionExpression': ' AND '.join(conditions),
+            'ExpressionAttributeNames': names,
+            'ExpressionAttributeValues': values
+        }
+    }
+
+def reserve_stock(depots, allocation):
+    """
+    Reserve the units an allocation ships, replacing what was reserved for
+    the same incidents before. Returns False when another execution changed
+    the stock since it was read; the caller reloads and re-solves.
+    """
+    if _depot_cache['source'] != 'table':
+        return True
+    changes = stock_changes(depots, allocation)
+    if not changes:
+        return True
+
+    by_id = {depot['depot_id']: depot for depot in depots}
+    for depot_id in changes:
+        if 'reserved' not in by_id[depot_id]:
+            dynamodb_client.update_item(
+                TableName=DEPOTS_TABLE,
+                Key={'depot_id': {'S': depot_id}},
+                UpdateExpression='SET #reserved = if_not_exists(#reserved, :empty)',
+                ExpressionAttributeNames={'#reserved': 'reserved'},
+                ExpressionAttributeValues={':empty': {'M': {}}}
+            )
+            by_id[depot_id]['reserved'] = {}
+
+    pending = list(changes.items())
+    try:
+        for start in range(0, len(pending), TRANSACTION_LIMIT):
+            chunk = pending[start:start + TRANSACTION_LIMIT]
+            dynamodb_client.transact_write_items(TransactItems=[depot_update(d, c) for d, c in chunk])
+            for depot_id, depot_changes in chunk:
+                depot = by_id[depot_id]
+                for item, key, previous, new in depot_changes:
+                    depot['stock'][item] = depot['stock'].get(item, 0) - (new - previous)
+                    if new:
+                        depot['reserved'][key] = new
+                    else:
+                        depot['reserved'].pop(key, None)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'TransactionCanceledException':
+            raise
+        return False
+    return True
+
+def release_stock(incident_id):
+    """Return every unit reserved for an incident to its depot's free stock"""
+    for attempt in range(MAX_STOCK_ATTEMPTS):
+        if reserve_stock(load_depots(fresh=attempt > 0), {incident_id: {}}):
+            return True
+    logger.error(f"Could not release equipment reserved for {incident_id}")
+    return False
+
+def unallocated(demands):
+    """Allocation result that ships nothing, for when stock could not be reserved"""
+    return {
+        demand['incident_id']: {
+            item: {'allocated': 0, 'shortfall': int(units), 'shipments': []}
+            for item, units in demand['units'].items() if units > 0
+        } for demand in demands
+    }
+
+class EquipmentAllocator:
+    """
+    Allocates depot stock to concurrent incidents by solving one
+    transportation problem per equipment item: ship from depots to
+    incidents at minimum travel time, with unmet demand penalized by
+    incident priority so CRITICAL incidents are served first.
+
+    Solutions are memoized per item and returned as they are while that
+    item's stock, demand and travel times are identical. This is not a
+    warm-started re-solve: any change to an item's inputs solves its LP
+    from scratch, but items the change does not touch are not solved again.
+    """
+
+    def __init__(self):
+        self._solved = {}
+
+    def allocate(self, depots, demands, travel_hours):
+        """
+        ``demands`` is a list of {'incident_id', 'priority', 'units': {item: n}};
+        ``travel_hours`` is a (depots x incidents) array.
+        Returns {incident_id: {item: {'allocated', 'shortfall', 'shipments'}}}.
+        """
+        travel_hours = np.asarray(travel_hours, dtype=np.float64)
+        weights = np.array([PRIORITY_WEIGHTS.get(d.get('priority', 'MEDIUM'), 2) for d in demands], dtype=np.float64)
+        allocation = {d['incident_id']: {} for d in demands}
+
+        items = sorted({item for d in demands for item in d['units']})
+        for item in items:
+            stock = np.array([d.get('stock', {}).get(item, 0) for d in depots], dtype=np.float64)
+            need = np.array([d['units'].get(item, 0) for d in demands], dtype=np.float64)
+
+            key = (stock.tobytes(), need.tobytes(), weights.tobytes(), travel_hours.tobytes(),
+                   tuple(d['incident_id'] for d in demands))
+            cached = self._solved.get(item)
+            if cached and cached[0] == key:
+                flows = cached[1]
+            else:
+                flows = solve_transportation(stock, need, weights, travel_hours)
+                self._solved[item] = (key, flows)
+
+            shipped = flows.sum(axis=0)
+            for j, demand in enumerate(demands):
+                if need[j] <= 0:
+                    continue
+                allocation[demand['incident_id']][item] = {
+                    'allocated': int(shipped[j]),
+                    'shortfall': int(need[j] - shipped[j]),
+                    'shipments': [
+                        {'depot_id': depots[i]['depot_id'], 'quantity': int(flows[i, j]),
+                         'travel_hours': round(float(travel_hours[i, j]), 2)}
+                        for i in np.flatnonzero(flows[:, j] > 0)
+                    ]
+                }
+        return allocation
+
+def solve_transportation(stock, need, weights, travel_hours):
+    """
+    Min-cost transportation LP (integral, as the constraint matrix is totally
+    unimodular). Returns a (depots x incidents) array of shipped units.
+    """
+    flows = np.zeros(travel_hours.shape)
+    depots = np.flatnonzero(stock > 0)
+    incidents = np.flatnonzero(need > 0)
+    if len(depots) == 0 or len(incidents) == 0:
+        return flows
+
+    n_d, n_i = len(depots), len(incidents)
+    n_x = n_d * n_i
+
+    # Variables: x[d, i] flattened row-major, then one shortage variable per incident
+    cost = np.concatenate([
+        travel_hours[np.ix_(depots, incidents)].ravel(),
+        SHORTAGE_PENALTY_HOURS * weights[incidents]
+    ])
+
+    d_idx, i_idx = np.divmod(np.arange(n_x), n_i)
+
+    # Each incident receives exactly its demand, shipped or short
+    eq_rows = np.concatenate([i_idx, np.arange(n_i)])
+    eq_cols = np.concatenate([np.arange(n_x), n_x + np.arange(n_i)])
+    a_eq = coo_matrix((np.ones(len(eq_rows)), (eq_rows, eq_cols)), shape=(n_i, n_x + n_i))
+
+    # Each depot ships at most its stock
+    a_ub = coo_matrix((np.ones(n_x), (d_idx, np.arange(n_x))), shape=(n_d, n_x + n_i))
+
+    result = linprog(cost, A_ub=a_ub.tocsr(), b_ub=stock[depots], A_eq=a_eq.tocsr(), b_eq=need[incidents],
+                     bounds=(0, None), method='highs')
+    if not result.success:
+        logger.error(f"Equipment transportation problem failed: {result.message}")
+        return flows
+
+    flows[np.ix_(depots, incidents)] = np.rint(result.x[:n_x]).reshape(n_d, n_i)
+    return flows
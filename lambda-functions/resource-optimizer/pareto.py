@@ -0,0 +1,113 @@
+import time
+
+import numpy as np
+
+# Objective rounding; plans closer than this are treated as equal when pruning
+COST_RESOLUTION = 100        # USD
+ETA_RESOLUTION = 0.1         # hours
+QUALITY_RESOLUTION = 0.01
+
+MAX_PARETO_PLANS = 50
+
+def non_dominated(points):
+    """
+    Indexes of the rows of ``points`` not dominated by any other row,
+    every column minimized. Rows are swept in lexicographic order, so each
+    one only needs checking against the front kept so far.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) == 0:
+        return np.zeros(0, dtype=int)
+
+    order = np.lexsort(points.T[::-1])
+    front = []
+    front_points = np.empty((0, points.shape[1]))
+    for i in order:
+        p = points[i]
+        if len(front) and np.any(np.all(front_points <= p, axis=1)):
+            continue
+        front.append(i)
+        front_points = np.vstack([front_points, p])
+    return np.array(front, dtype=int)
+
+def pareto_plans(slots, team_cost, fixed_cost=0.0, max_plans=MAX_PARETO_PLANS):
+    """
+    Team plans over (cost, response time, quality) that approximate the
+    Pareto front.
+
+    ``slots`` is a list of (specialization, candidates, etas) with one
+    candidate list per required specialization. A plan picks at most one
+    team per slot; leaving a slot empty is cheaper but loses coverage.
+    Quality is the capability-weighted coverage in [0, 1].
+
+    Each partial plan only picks teams it does not already use. The
+    candidates a plan could still pick that are dominated within their own
+    slot are skipped, and plans are built slot by slot, dropping dominated
+    partial plans after every step. This keeps the search to the size of
+    the front rather than every combination.
+
+    The result is an approximation of the Pareto front. Pruning compares
+    rounded objectives. It also compares partial plans that use different
+    teams, so a dropped plan may have left free a team that a later slot
+    needed.
+    """
+    start = time.perf_counter()
+    weight = 1.0 / max(len(slots), 1)
+
+    # Partial plans: (cost, eta, quality, [(specialization, team)])
+    labels = [(fixed_cost, 0.0, 0.0, [])]
+    for specialization, candidates, etas in slots:
+        pool = [(team, float(eta)) for team, eta in zip(candidates, etas)]
+        points = np.array([[team_cost(team, eta), eta, -team['capability'] / 10] for team, eta in pool])
+        slot_ids = {team['team_id'] for team, _ in pool}
+
+        # Options depend only on which of this slot's candidates a plan already uses
+        options_by_used = {}
+        extended = []
+        for cost, eta, quality, picks in labels:
+            used = frozenset(team['team_id'] for _, team in picks) & slot_ids
+            options = options_by_used.get(used)
+            if options is None:
+                options = [(0.0, 0.0, 0.0, None)]
+                free = [k for k, (team, _) in enumerate(pool) if team['team_id'] not in used]
+                if free:
+                    for k in np.asarray(free)[non_dominated(points[free])]:
+                        team, team_eta = pool[k]
+                        options.append((float(points[k, 0]), team_eta, team['capability'] / 10 * weight, team))
+                options_by_used[used] = options
+
+            for option_cost, option_eta, option_quality, team in options:
+                extended.append((
+                    cost + option_cost,
+                    max(eta, option_eta),
+                    quality + option_quality,
+                    picks + [(specialization, team)] if team else picks
+                ))
+        labels = prune(extended)
+
+    # Sending no one is trivially cheapest but never a plan worth offering
+    labels = [label for label in labels if label[3]]
+
+    if len(labels) > max_plans:
+        # Keep an even spread along the cost axis
+        labels.sort(key=lambda label: label[0])
+        keep = np.unique(np.linspace(0, len(labels) - 1, max_plans).round().astype(int))
+        labels = [labels[k] for k in keep]
+
+    plans = [{
+        'assignments': picks,
+        'cost': cost,
+        'eta_hours': eta,
+        'quality': quality,
+        'coverage': len(picks) / len(slots) if slots else 1.0
+    } for cost, eta, quality, picks in sorted(labels, key=lambda label: label[0])]
+    return plans, round((time.perf_counter() - start) * 1000, 2)
+
+def prune(labels):
+    """Drop partial plans dominated on rounded (cost, eta, -quality)"""
+    points = np.array([[
+        round(cost / COST_RESOLUTION),
+        round(eta / ETA_RESOLUTION),
+        -round(quality / QUALITY_RESOLUTION)
+    ] for cost, eta, quality, _ in labels])
+    return [labels[k] for k in non_dominated(points)]
@@ -0,0 +1,102 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+import travel_matrix
+from specialization_index import normalize_specialization, specialization_keys
+
+# Teams within this many hours of a region already count as positioned there
+POSITIONED_HOURS = 2.0
+
+# Cost of leaving a forecast unit unstaffed, in travel hours
+UNSTAFFED_PENALTY_HOURS = 10000
+
+def regional_demand(model, forecast_rows, required_specializations):
+    """
+    Expected team demand per (region, specialization) from a forecast.
+
+    Series with deployment history use the teams actually deployed per
+    incident; the rest fall back to the specializations the optimizer
+    would request for that waste type and hazard level.
+    """
+    series_index = {key: k for k, key in enumerate(model['series'])}
+    specializations = list(model['specializations'])
+
+    demand = {}
+    for row in forecast_rows:
+        key = f"{row['region']}|{row['waste_type']}|{row['hazard_level']}"
+        k = series_index[key]
+        region = demand.setdefault(row['region'], {})
+        if model['calibrated'][k]:
+            for s, per_incident in zip(specializations, model['teams_per_incident'][k]):
+                if per_incident > 0:
+                    region[s] = region.get(s, 0.0) + row['expected_incidents'] * per_incident
+        else:
+            for s in required_specializations(row['waste_type'], row['hazard_level']):
+                region[s] = region.get(s, 0.0) + row['expected_incidents']
+    return demand
+
+def plan_moves(model, demand, teams):
+    """
+    Choose which available teams to move ahead of forecast demand.
+
+    Each specialization is one assignment problem between demand units
+    (one per expected team, rounded) and matching teams, minimizing travel
+    from team bases to region centres. A team is used for at most one unit.
+    Returns moves, teams already in place and unmet units per region.
+    """
+    centres = {region: centre for region, centre in zip(model['regions'], model['region_centres'])
+               if np.isfinite(centre).all()}
+    located = [t for t in teams if t.get('base_latitude') is not None and t.get('base_longitude') is not None]
+    matrix = travel_matrix.get_matrix()
+
+    by_specialization = {}
+    for region, needs in demand.items():
+        if region not in centres:
+            continue
+        for specialization, expected in needs.items():
+            units = int(np.floor(expected + 0.5))
+            if units:
+                by_specialization.setdefault(specialization, []).extend([region] * units)
+
+    # Travel hours from every located team to every region centre
+    regions = sorted({r for units in by_specialization.values() for r in units})
+    region_column = {r: k for k, r in enumerate(regions)}
+    hours = np.zeros((len(located), len(regions)))
+    for region, k in region_column.items():
+        latitude, longitude = centres[region]
+        hours[:, k] = matrix.eta_hours(located, {'latitude': latitude, 'longitude': longitude})
+
+    moves, in_place, unmet = [], [], {}
+    used = set()
+    for specialization, units in sorted(by_specialization.items()):
+        key = normalize_specialization(specialization)
+        candidates = [i for i, team in enumerate(located)
+                      if team['team_id'] not in used and key in specialization_keys(team['specialization'])]
+
+        cost = np.full((len(units), len(candidates) + len(units)), float(UNSTAFFED_PENALTY_HOURS))
+        if candidates:
+            cost[:, :len(candidates)] = hours[np.ix_(candidates, [region_column[r] for r in units])].T
+        rows, cols = linear_sum_assignment(cost)
+
+        for u, c in zip(rows, cols):
+            region = units[u]
+            if c >= len(candidates):
+                unmet.setdefault(region, {})
+                unmet[region][specialization] = unmet[region].get(specialization, 0) + 1
+                continue
+            team = located[candidates[c]]
+            used.add(team['team_id'])
+            entry = {
+                'team_id': team['team_id'],
+                'specialization': specialization,
+                'region': region,
+                'travel_hours': round(float(cost[u, c]), 2)
+            }
+            if cost[u, c] <= POSITIONED_HOURS:
+                in_place.append(entry)
+            else:
+                entry['from_country'] = team.get('country')
+                moves.append(entry)
+
+    moves.sort(key=lambda m: -m['travel_hours'])
+    return {'moves': moves, 'already_positioned': in_place, 'unmet': unmet}
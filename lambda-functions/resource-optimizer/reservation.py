@@ -0,0 +1,163 @@
+import time
+import random
+import logging
+from datetime import datetime
+
+import boto3
+from botocore.exceptions import ClientError
+
+import team_catalogue
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+dynamodb_client = boto3.client('dynamodb')
+
+MAX_RESERVATION_ATTEMPTS = 5
+
+def reserve_teams(incident_id, assignments, find_replacement, publish=True):
+    """
+    Atomically mark the selected teams DEPLOYED for an incident.
+
+    ``assignments`` is a list of (specialization, team) pairs. When another
+    execution has already taken a team, the transaction is cancelled and
+    ``find_replacement(specialization, exclude_ids)`` is asked for the
+    next-best candidate before retrying. Returns the pairs that were reserved.
+    Callers reserving many incidents pass ``publish=False`` and call
+    ``team_catalogue.note_table_change`` once at the end.
+    """
+    if not team_catalogue.is_table_backed():
+        logger.info("Sample team catalogue in use, skipping reservation")
+        return assignments
+
+    pending = list(assignments)
+    rejected = set()
+
+    for attempt in range(MAX_RESERVATION_ATTEMPTS):
+        if not pending:
+            return []
+
+        taken, retry = transact_reserve(incident_id, [team for _, team in pending])
+        if not taken and not retry:
+            for _, team in pending:
+                team_catalogue.update_team_status(team['team_id'], 'DEPLOYED')
+            if publish:
+                team_catalogue.note_table_change()
+            return pending
+
+        if retry and not taken:
+            # Transaction conflict with a concurrent writer, back off and try the same teams
+            time.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+            continue
+
+        # Teams taken elsewhere are no longer available in this container either
+        rejected |= taken
+        for team_id in taken:
+            team_catalogue.update_team_status(team_id, 'DEPLOYED')
+        logger.info(f"Teams {sorted(taken)} already reserved, selecting replacements for {incident_id}")
+
+        exclude = rejected | {team['team_id'] for _, team in pending}
+        replaced = []
+        for specialization, team in pending:
+            if team['team_id'] not in taken:
+                replaced.append((specialization, team))
+                continue
+            replacement = find_replacement(specialization, exclude)
+            if replacement:
+                exclude.add(replacement['team_id'])
+                replaced.append((specialization, replacement))
+            else:
+                logger.warning(f"No replacement team for {specialization} on {incident_id}")
+        pending = replaced
+
+    logger.error(f"Could not reserve teams for {incident_id} after {MAX_RESERVATION_ATTEMPTS} attempts")
+    return []
+
+def transact_reserve(incident_id, teams):
+    """
+    Reserve all teams in one TransactWriteItems call.
+
+    Returns (taken_team_ids, retry): the teams whose condition failed, and
+    whether the cancellation was a transient conflict worth retrying.
+    """
+    now = datetime.now().isoformat()
+    items = [{
+        'Update': {
+            'TableName': team_catalogue.TEAMS_TABLE,
+            'Key': {'team_id': {'S': team['team_id']}},
+            'UpdateExpression': 'SET #status = :deployed, deployed_incident_id = :incident, deployed_at = :now',
+            'ConditionExpression': 'attribute_exists(team_id) AND (#status = :available OR deployed_incident_id = :incident)',
+            'ExpressionAttributeNames': {'#status': 'status'},
+            'ExpressionAttributeValues': {
+                ':deployed': {'S': 'DEPLOYED'},
+                ':available': {'S': 'AVAILABLE'},
+                ':incident': {'S': str(incident_id)},
+                ':now': {'S': now}
+            }
+        }
+    } for team in teams]
+
+    try:
+        dynamodb_client.transact_write_items(TransactItems=items)
+        return set(), False
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'TransactionCanceledException':
+            raise
+
+        reasons = e.response.get('CancellationReasons', [])
+        taken = {team['team_id'] for team, reason in zip(teams, reasons)
+                 if reason.get('Code') == 'ConditionalCheckFailed'}
+        return taken, not taken
+
+def release_teams(incident_id, team_ids, publish=True):
+    """
+    Return an incident's teams to AVAILABLE. Each update is conditional on
+    the team still being deployed to this incident, so a team already
+    reassigned elsewhere is left alone. Returns the released team ids.
+    """
+    if not team_catalogue.is_table_backed():
+        for team_id in team_ids:
+            team_catalogue.update_team_status(team_id, 'AVAILABLE')
+        return list(team_ids)
+
+    released = []
+    for team_id in team_ids:
+        try:
+            dynamodb_client.update_item(
+                TableName=team_catalogue.TEAMS_TABLE,
+                Key={'team_id': {'S': team_id}},
+                UpdateExpression='SET #status = :available REMOVE deployed_incident_id, deployed_at',
+                ConditionExpression='deployed_incident_id = :incident',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={
+                    ':available': {'S': 'AVAILABLE'},
+                    ':incident': {'S': str(incident_id)}
+                }
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            continue
+        team_catalogue.update_team_status(team_id, 'AVAILABLE')
+        released.append(team_id)
+    if released and publish:
+        team_catalogue.note_table_change()
+    return released
+
+def set_team_status(team_id, status):
+    """
+    Record a status reported from outside the optimizer (a team gone
+    offline, or released from work the plan does not know about), clearing
+    any deployment. Returns the cached team, if any.
+    """
+    if team_catalogue.is_table_backed():
+        dynamodb_client.update_item(
+            TableName=team_catalogue.TEAMS_TABLE,
+            Key={'team_id': {'S': team_id}},
+            UpdateExpression='SET #status = :status REMOVE deployed_incident_id, deployed_at',
+            ConditionExpression='attribute_exists(team_id)',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':status': {'S': status}}
+        )
+        team_catalogue.note_table_change()
+    return team_catalogue.update_team_status(team_id, status)
@@ -0,0 +1,76 @@
+import time
+
+import numpy as np
+
+DEFAULT_SAMPLES = 10000
+
+# Sample counts a request may ask for; each sample is a row of every drawn array
+MIN_SAMPLES = 100
+MAX_SAMPLES = 100_000
+
+# Lognormal spreads (sigma of the underlying normal) around each nominal value
+MOBILIZATION_SIGMA = 0.5
+TRAVEL_SIGMA = 0.25
+DURATION_SIGMA = 0.35
+
+PERCENTILES = [10, 50, 90, 95, 99]
+
+def simulate_plan_risk(optimization, deployment_strategy, cost_rates, mobilization_hours,
+                       samples=DEFAULT_SAMPLES, seed=None):
+    """
+    Monte Carlo distributions of response time and cost for one plan.
+
+    Every sample draws a mobilisation delay and a travel time for each team
+    and a duration for the incident, all lognormal around the point
+    estimates the optimizer already uses. Everything is drawn as
+    (samples x teams) arrays, so 10k samples take a few milliseconds.
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+
+    teams = optimization['selected_teams']
+    requirements = optimization['resource_requirements']
+    etas = optimization.get('team_etas', {})
+
+    # Nominal travel per team: known ETA, else the phase time less mobilisation
+    phase_of = {}
+    for phase in deployment_strategy['deployment_phases']:
+        for team in phase['teams']:
+            phase_of[team['team_id']] = phase
+    nominal_travel = np.array([
+        etas.get(t['team_id'], max(phase_of[t['team_id']]['deployment_time_hours'] - mobilization_hours, 0.5)
+                 if t['team_id'] in phase_of else 0.5)
+        for t in teams
+    ], dtype=np.float64)
+
+    result = {'samples': samples}
+    if teams:
+        shape = (samples, len(teams))
+        mobilization = mobilization_hours * rng.lognormal(0.0, MOBILIZATION_SIGMA, shape)
+        travel = nominal_travel * rng.lognormal(0.0, TRAVEL_SIGMA, shape)
+        arrival = mobilization + travel
+
+        # Response is complete once the whole IMMEDIATE phase is on site
+        immediate_ids = {t['team_id'] for t in deployment_strategy['deployment_phases'][0]['teams']}
+        immediate = np.array([t['team_id'] in immediate_ids for t in teams])
+        result['response_time_hours'] = distribution(arrival[:, immediate].max(axis=1))
+        result['first_arrival_hours'] = distribution(arrival.min(axis=1))
+
+    duration = requirements['estimated_duration_hours'] * rng.lognormal(0.0, DURATION_SIGMA, samples)
+    cost = (
+        len(teams) * cost_rates['team_per_hour'] * duration
+        + cost_rates['equipment_base']
+        + requirements['vehicles'] * cost_rates['vehicle_per_hour'] * duration
+    )
+    result['duration_hours'] = distribution(duration)
+    result['total_cost'] = distribution(cost)
+    result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+def distribution(values):
+    """Mean and percentiles of sampled values"""
+    points = np.percentile(values, PERCENTILES)
+    summary = {'mean': round(float(values.mean()), 2)}
+    for p, value in zip(PERCENTILES, points):
+        summary[f"p{p}"] = round(float(value), 2)
+    return summary
@@ -0,0 +1,161 @@
+import time
+
+import numpy as np
+
+import travel_matrix
+
+# Transport vehicles collecting teams at their bases
+VEHICLE_CAPACITY = 20            # seats per vehicle
+PERSONNEL_PER_TEAM = 5
+MAX_PICKUP_HOURS = 4             # teams based further from staging drive there themselves
+ROUTING_TIME_BUDGET_SECONDS = 0.5
+
+def build_time_matrix(sites):
+    """
+    Travel hours between sites ({'team_id', 'base_latitude', 'base_longitude'}),
+    one travel-matrix row slice per destination.
+    """
+    matrix = travel_matrix.get_matrix()
+    n = len(sites)
+    hours = np.zeros((n, n))
+    for j, site in enumerate(sites):
+        location = {'latitude': site['base_latitude'], 'longitude': site['base_longitude']}
+        hours[:, j] = matrix.eta_hours(sites, location)
+    np.fill_diagonal(hours, 0.0)
+    return hours
+
+def route_duration(route, times):
+    """Hours to drive depot -> stops -> depot"""
+    if not route:
+        return 0.0
+    total = times[0, route[0]] + times[route[-1], 0]
+    for a, b in zip(route, route[1:]):
+        total += times[a, b]
+    return total
+
+def solve_cvrp(times, loads, capacity=VEHICLE_CAPACITY, time_budget=ROUTING_TIME_BUDGET_SECONDS):
+    """
+    Capacitated vehicle routing from a single depot (index 0) to stops 1..n.
+
+    Builds routes with the Clarke-Wright savings algorithm, then improves them
+    with 2-opt inside each route and relocation between routes until no move
+    helps or the time budget runs out. Returns a list of routes (stop indexes).
+    """
+    deadline = time.perf_counter() + time_budget
+    times = np.asarray(times, dtype=np.float64)
+    loads = np.asarray(loads, dtype=np.float64)
+    n = len(loads)
+    if n == 0:
+        return []
+
+    routes = savings_routes(times, loads, capacity)
+    improve_routes(routes, times, loads, capacity, deadline)
+    return [r for r in routes if r]
+
+def savings_routes(times, loads, capacity):
+    """Clarke-Wright parallel savings construction"""
+    n = len(loads)
+    symmetric = (times + times.T) / 2
+
+    # Saving of serving i and j on one route instead of two
+    depot = symmetric[0, 1:]
+    savings = depot[:, None] + depot[None, :] - symmetric[1:, 1:]
+    i_idx, j_idx = np.triu_indices(n, k=1)
+    pair_savings = savings[i_idx, j_idx]
+    order = np.argsort(-pair_savings, kind='stable')
+
+    routes = [[i] for i in range(1, n + 1)]
+    route_of = list(range(-1, n))   # stop -> route position (stop 0 is the depot)
+    route_load = [float(loads[i - 1]) for i in range(1, n + 1)]
+
+    for k in order:
+        if pair_savings[k] <= 0:
+            break
+        i, j = int(i_idx[k]) + 1, int(j_idx[k]) + 1
+        ri, rj = route_of[i], route_of[j]
+        if ri == rj or route_load[ri] + route_load[rj] > capacity:
+            continue
+
+        a, b = routes[ri], routes[rj]
+        if a[-1] == i and b[0] == j:
+            merged = a + b
+        elif a[0] == i and b[-1] == j:
+            merged = b + a
+        elif a[-1] == i and b[-1] == j:
+            merged = a + b[::-1]
+        elif a[0] == i and b[0] == j:
+            merged = a[::-1] + b
+        else:
+            continue
+
+        routes[ri] = merged
+        routes[rj] = []
+        route_load[ri] += route_load[rj]
+        route_load[rj] = 0.0
+        for stop in b:
+            route_of[stop] = ri
+
+    return [r for r in routes if r]
+
+def improve_routes(routes, times, loads, capacity, deadline):
+    """Local search: 2-opt within routes and single-stop relocation between routes"""
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for r in range(len(routes)):
+            if two_opt(routes, r, times, deadline):
+                improved = True
+        if relocate(routes, times, loads, capacity, deadline):
+            improved = True
+
+def two_opt(routes, r, times, deadline):
+    """Reverse route segments while that shortens the route"""
+    route = routes[r]
+    best = route_duration(route, times)
+    changed = False
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for a in range(len(route) - 1):
+            for b in range(a + 1, len(route)):
+                candidate = route[:a] + route[a:b + 1][::-1] + route[b + 1:]
+                duration = route_duration(candidate, times)
+                if duration < best - 1e-9:
+                    route, best = candidate, duration
+                    improved = changed = True
+    routes[r] = route
+    return changed
+
+def relocate(routes, times, loads, capacity, deadline):
+    """Move single stops to the cheapest position in another route with spare capacity"""
+    route_loads = [sum(loads[s - 1] for s in route) for route in routes]
+    changed = False
+    for r in range(len(routes)):
+        for stop in list(routes[r]):
+            if time.perf_counter() >= deadline:
+                return changed
+
+            source = routes[r]
+            if stop not in source:
+                continue
+            without = [s for s in source if s != stop]
+            removal_gain = route_duration(source, times) - route_duration(without, times)
+
+            best = None
+            for t, target in enumerate(routes):
+                if t == r or not target or route_loads[t] + loads[stop - 1] > capacity:
+                    continue
+                base = route_duration(target, times)
+                for pos in range(len(target) + 1):
+                    added = route_duration(target[:pos] + [stop] + target[pos:], times) - base
+                    if added < removal_gain - 1e-9 and (best is None or added < best[0]):
+                        best = (added, t, pos)
+
+            if best:
+                _, t, pos = best
+                routes[t].insert(pos, stop)
+                routes[r] = without
+                route_loads[t] += loads[stop - 1]
+                route_loads[r] -= loads[stop - 1]
+                changed = True
+    return changed
@@ -0,0 +1,139 @@
+import heapq
+
+from assignment import PRIORITY_WEIGHTS
+
+# Crew rules
+SHIFT_HOURS = 12             # longest continuous shift
+MIN_REST_HOURS = 12          # rest after each shift
+MAX_HOURS_PER_TEAM = 48      # total on-site hours per team in one deployment
+
+def schedule_shifts(plans, relief_candidates):
+    """
+    Split long deployments into shifts and rotate crews under the rest and
+    maximum-hours rules.
+
+    ``plans`` is a list of {'incident_id', 'priority', 'end_hours',
+    'slots': [(specialization, team, arrival_hours)]}: every slot must be
+    staffed from its team's arrival until the incident ends.
+    ``relief_candidates(specialization, incident_id)`` returns (team,
+    arrival_hours) pairs in order of preference.
+
+    Each slot has a crew, starting with its assigned team. A shift goes to
+    the crew member who has rested longest; when nobody is rested, the next
+    fresh team is drawn from the relief candidates and joins the crew.
+    Shifts of all incidents are processed in time order from one event
+    heap (higher priority first on ties), so fresh teams go to whoever
+    needs them first. Returns {incident_id: {'timeline', 'gaps', 'crews'}}.
+    """
+    used = {team['team_id'] for plan in plans for _, team, _ in plan['slots']}
+    schedules = {plan['incident_id']: {'timeline': [], 'gaps': [], 'crews': {}} for plan in plans}
+
+    # Event: (start_hour, -priority_weight, sequence, plan, slot number)
+    events = []
+    crews = {}
+    sequence = 0
+    for plan in plans:
+        weight = PRIORITY_WEIGHTS.get(plan.get('priority', 'MEDIUM'), 2)
+        for n, (specialization, team, arrival) in enumerate(plan['slots']):
+            if arrival >= plan['end_hours']:
+                continue
+            # Crew members: [available_at, hours_worked, team]
+            crews[(plan['incident_id'], n)] = {
+                'specialization': specialization,
+                'members': [[arrival, 0.0, team]],
+                'candidates': None
+            }
+            heapq.heappush(events, (arrival, -weight, sequence, plan, n))
+            sequence += 1
+
+    while events:
+        start, neg_weight, _, plan, n = heapq.heappop(events)
+        incident_id = plan['incident_id']
+        specialization = plan['slots'][n][0]
+        crew = crews[(incident_id, n)]
+        end = min(start + SHIFT_HOURS, plan['end_hours'])
+
+        member = rested_member(crew['members'], start)
+        if member is None:
+            member = draw_relief(crew, specialization, incident_id, start, relief_candidates, used)
+
+        if member is None or member[0] >= plan['end_hours']:
+            # Nobody can cover the rest of the incident
+            schedules[incident_id]['gaps'].append({
+                'specialization': specialization,
+                'start_hour': round(start, 2),
+                'end_hour': round(plan['end_hours'], 2)
+            })
+            continue
+
+        if member[0] > start:
+            # Next team is still travelling or resting; the slot is uncovered until then
+            schedules[incident_id]['gaps'].append({
+                'specialization': specialization,
+                'start_hour': round(start, 2),
+                'end_hour': round(member[0], 2)
+            })
+            start = member[0]
+            end = min(start + SHIFT_HOURS, plan['end_hours'])
+
+        hours = min(end - start, MAX_HOURS_PER_TEAM - member[1])
+        end = start + hours
+        member[1] += hours
+        member[0] = end + MIN_REST_HOURS
+        schedules[incident_id]['timeline'].append({
+            'specialization': specialization,
+            'team_id': member[2]['team_id'],
+            'start_hour': round(start, 2),
+            'end_hour': round(end, 2)
+        })
+
+        if end < plan['end_hours'] - 1e-9:
+            heapq.heappush(events, (end, neg_weight, sequence, plan, n))
+            sequence += 1
+
+    for (incident_id, _), crew in crews.items():
+        schedules[incident_id]['crews'].setdefault(crew['specialization'], []).extend(
+            member[2]['team_id'] for member in crew['members']
+        )
+
+    for schedule in schedules.values():
+        schedule['timeline'].sort(key=lambda shift: (shift['start_hour'], shift['specialization']))
+        schedule['teams_required'] = sum(len(team_ids) for team_ids in schedule['crews'].values())
+    return schedules
+
+def rested_member(members, start):
+    """Crew member available by ``start`` with hours left, longest rested first"""
+    best = None
+    for member in members:
+        if member[0] <= start + 1e-9 and member[1] < MAX_HOURS_PER_TEAM:
+            if best is None or member[0] < best[0]:
+                best = member
+    return best
+
+def draw_relief(crew, specialization, incident_id, start, relief_candidates, used):
+    """
+    Add the next unused fresh team to a crew, unless a crew member with hours
+    left will be rested before that team could arrive
+    """
+    if crew['candidates'] is None:
+        crew['candidates'] = relief_candidates(specialization, incident_id)
+        crew['next'] = 0
+
+    waiting = [m for m in crew['members'] if m[1] < MAX_HOURS_PER_TEAM]
+    soonest = min(waiting, key=lambda m: m[0]) if waiting else None
+
+    candidates = crew['candidates']
+    while crew['next'] < len(candidates):
+        team, arrival = candidates[crew['next']]
+        if team['team_id'] in used:
+            crew['next'] += 1
+            continue
+        if soonest is not None and arrival > start and soonest[0] <= arrival:
+            break
+        crew['next'] += 1
+        used.add(team['team_id'])
+        member = [arrival, 0.0, team]
+        crew['members'].append(member)
+        return member
+
+    return soonest
@@ -0,0 +1,146 @@
+import heapq
+import itertools
+
+def normalize_specialization(name):
+    """Normalize a specialization name for index lookups"""
+    return ' '.join(name.lower().replace('-', ' ').split())
+
+def specialization_keys(name):
+    """All contiguous word sequences of a specialization, e.g. 'chemical', 'chemical response'"""
+    words = normalize_specialization(name).split()
+    return {' '.join(words[i:j]) for i in range(len(words)) for j in range(i + 1, len(words) + 1)}
+
+class SpecializationIndex:
+    """
+    Inverted index from normalized specialization to per-country heaps of
+    available teams, ordered by capability (highest first).
+
+    Removal is lazy: a heap entry is live only while its sequence number
+    matches the team's current one, so deploying and releasing a team are
+    O(1) and O(k log n) respectively.
+    """
+
+    def __init__(self, teams=()):
+        self._heaps = {}
+        self._teams = {}
+        self._live = {}
+        self._stale = 0
+        self._counter = itertools.count()
+        for team in teams:
+            self.add(team)
+
+    def __len__(self):
+        return len(self._live)
+
+    def __contains__(self, team_id):
+        return team_id in self._live
+
+    def add(self, team):
+        """Add (or refresh) an available team"""
+        if team.get('status', 'AVAILABLE') != 'AVAILABLE':
+            self.remove(team['team_id'])
+            return
+
+        team_id = team['team_id']
+        if team_id in self._live:
+            self._stale += 1
+
+        seq = next(self._counter)
+        self._teams[team_id] = team
+        self._live[team_id] = seq
+
+        entry = (-team['capability'], seq, team_id)
+        country = team.get('country', 'Unknown')
+        for key in specialization_keys(team['specialization']):
+            heapq.heappush(self._heaps.setdefault(key, {}).setdefault(country, []), entry)
+
+    def remove(self, team_id):
+        """Remove a team that is no longer available"""
+        if self._live.pop(team_id, None) is None:
+            return
+        self._teams.pop(team_id, None)
+        self._stale += 1
+        if self._stale > 2 * len(self._live) + 64:
+            self._compact()
+
+    def best(self, specialization, countries=None, exclude=()):
+        """Highest-capability available team for a specialization, skipping excluded ids"""
+        by_country = self._heaps.get(normalize_specialization(specialization))
+        if not by_country:
+            return None
+
+        best_entry = None
+        for country in (by_country if countries is None else countries):
+            heap = by_country.get(country)
+            if not heap:
+                continue
+            entry = self._peek(heap, exclude)
+            if entry and (best_entry is None or entry < best_entry):
+                best_entry = entry
+
+        return self._teams[best_entry[2]] if best_entry else None
+
+    def candidates(self, specialization, countries=None, limit=None, exclude=()):
+        """
+        Available teams for a specialization, best first, skipping excluded
+        ids. With a ``limit``, only that many are taken off the country
+        heaps, merged by capability, in O(limit log n); the live entries
+        taken are pushed back afterwards.
+        """
+        by_country = self._heaps.get(normalize_specialization(specialization), {})
+        countries = by_country if countries is None else dict.fromkeys(countries)
+        if limit is None:
+            entries = []
+            for country in countries:
+                entries.extend(e for e in by_country.get(country, [])
+                               if self._live.get(e[2]) == e[1] and e[2] not in exclude)
+            entries.sort()
+            return [self._teams[e[2]] for e in entries]
+
+        heaps = [by_country[country] for country in countries if by_country.get(country)]
+        frontier = [(heap[0], n) for n, heap in enumerate(heaps)]
+        heapq.heapify(frontier)
+        taken = []
+        found = []
+        while frontier and len(found) < limit:
+            entry, n = heapq.heappop(frontier)
+            heap = heaps[n]
+            heapq.heappop(heap)
+            if self._live.get(entry[2]) == entry[1]:
+                taken.append((n, entry))
+                if entry[2] not in exclude:
+                    found.append(entry)
+            if heap:
+                heapq.heappush(frontier, (heap[0], n))
+
+        for n, entry in taken:
+            heapq.heappush(heaps[n], entry)
+        return [self._teams[e[2]] for e in found]
+
+    def _peek(self, heap, exclude):
+        """Top live entry of a heap not in exclude, dropping stale entries on the way"""
+        skipped = []
+        found = None
+        while heap:
+            entry = heap[0]
+            if self._live.get(entry[2]) != entry[1]:
+                heapq.heappop(heap)
+                continue
+            if entry[2] in exclude:
+                skipped.append(heapq.heappop(heap))
+                continue
+            found = entry
+            break
+
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        return found
+
+    def _compact(self):
+        """Rebuild heaps without stale entries"""
+        for by_country in self._heaps.values():
+            for country, heap in by_country.items():
+                live = [e for e in heap if self._live.get(e[2]) == e[1]]
+                heapq.heapify(live)
+                by_country[country] = live
+        self._stale = 0
@@ -0,0 +1,302 @@
+import os
+import time
+import logging
+import threading
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+from specialization_index import SpecializationIndex
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+dynamodb = boto3.resource('dynamodb')
+
+TEAMS_TABLE = os.environ.get('TEAMS_TABLE', 'ResponseTeams')
+COUNTRY_INDEX = os.environ.get('TEAMS_COUNTRY_INDEX', 'CountryIndex')
+CATALOGUE_VERSION_KEY = '__CATALOGUE_VERSION__'
+
+# Tunables for loading and revalidating the in-container catalogue
+SCAN_SEGMENTS = int(os.environ.get('TEAMS_SCAN_SEGMENTS', '4'))
+COUNTRY_QUERY_LIMIT = int(os.environ.get('TEAMS_COUNTRY_QUERY_LIMIT', '8'))
+VERSION_CHECK_SECONDS = float(os.environ.get('TEAMS_VERSION_CHECK_SECONDS', '30'))
+
+# Sample catalogue used while the ResponseTeams table has not been seeded
+SAMPLE_TEAMS = [
+    {'team_id': 'BD-HAZMAT-01', 'country': 'Bangladesh', 'specialization': 'Chemical Response', 'status': 'AVAILABLE', 'capability': 9, 'base_latitude': 23.81, 'base_longitude': 90.41},
+    {'team_id': 'BD-FLOOD-02', 'country': 'Bangladesh', 'specialization': 'Flood Response', 'status': 'AVAILABLE', 'capability': 8, 'base_latitude': 22.36, 'base_longitude': 91.78},
+    {'team_id': 'IN-BORDER-01', 'country': 'India', 'specialization': 'Cross-Border Ops', 'status': 'AVAILABLE', 'capability': 9, 'base_latitude': 22.57, 'base_longitude': 88.36},
+    {'team_id': 'IN-ENV-02', 'country': 'India', 'specialization': 'Environmental', 'status': 'DEPLOYED', 'capability': 7, 'base_latitude': 28.61, 'base_longitude': 77.21},
+    {'team_id': 'US-HAZMAT-01', 'country': 'United States', 'specialization': 'Chemical Response', 'status': 'AVAILABLE', 'capability': 10, 'base_latitude': 38.9, 'base_longitude': -77.04},
+    {'team_id': 'US-FLOOD-02', 'country': 'United States', 'specialization': 'Flood Response', 'status': 'AVAILABLE', 'capability': 9, 'base_latitude': 29.76, 'base_longitude': -95.37},
+    {'team_id': 'CA-COORD-01', 'country': 'Canada', 'specialization': 'Coordination', 'status': 'AVAILABLE', 'capability': 8, 'base_latitude': 45.42, 'base_longitude': -75.69},
+    {'team_id': 'CA-ENV-02', 'country': 'Canada', 'specialization': 'Environmental', 'status': 'AVAILABLE', 'capability': 8, 'base_latitude': 49.9, 'base_longitude': -97.14},
+    {'team_id': 'DE-IND-01', 'country': 'Germany', 'specialization': 'Industrial Cleanup', 'status': 'AVAILABLE', 'capability': 9, 'base_latitude': 50.94, 'base_longitude': 6.96},
+    {'team_id': 'DE-CHEM-02', 'country': 'Germany', 'specialization': 'Chemical Response', 'status': 'AVAILABLE', 'capability': 9, 'base_latitude': 52.52, 'base_longitude': 13.4},
+    {'team_id': 'NL-ENV-01', 'country': 'Netherlands', 'specialization': 'Environmental', 'status': 'AVAILABLE', 'capability': 8, 'base_latitude': 52.37, 'base_longitude': 4.9},
+    {'team_id': 'NL-WATER-02', 'country': 'Netherlands', 'specialization': 'Water Management', 'status': 'AVAILABLE', 'capability': 10, 'base_latitude': 51.92, 'base_longitude': 4.48}
+]
+
+# Container-level cache, reused across warm invocations
+_cache = {
+    'version': None,
+    'checked_at': 0.0,
+    'complete': False,
+    'source': 'table',
+    'teams': {},
+    'by_country': {},
+    'loaded_countries': set(),
+    'index': SpecializationIndex()
+}
+_lock = threading.Lock()
+
+def get_available_teams(countries):
+    """Get AVAILABLE teams for the given countries from the cached catalogue"""
+    with _lock:
+        ensure_loaded(countries)
+        available = []
+        for country in countries:
+            available.extend(_cache['by_country'].get(country, {}).get('AVAILABLE', {}).values())
+    return available
+
+def get_teams(countries=None, status=None):
+    """Get catalogue teams filtered by country and status"""
+    with _lock:
+        if countries is None:
+            ensure_complete()
+            countries = list(_cache['by_country'].keys())
+        else:
+            ensure_loaded(countries)
+
+        teams = []
+        for country in countries:
+            statuses = _cache['by_country'].get(country, {})
+            if status is None:
+                for group in statuses.values():
+                    teams.extend(group.values())
+            else:
+                teams.extend(statuses.get(status, {}).values())
+    return teams
+
+def get_specialization_index(countries):
+    """Get the shared specialization index, loaded for the given countries"""
+    with _lock:
+        ensure_loaded(countries)
+        return _cache['index']
+
+def get_team(team_id):
+    """Get a single cached team by id"""
+    return _cache['teams'].get(team_id)
+
+def ensure_loaded(countries):
+    """Make sure the cache is current and holds every requested country"""
+    revalidate()
+
+    missing = [c for c in countries if c not in _cache['loaded_countries']]
+    if not missing or _cache['complete']:
+        return
+
+    if len(missing) <= COUNTRY_QUERY_LIMIT:
+        load_countries(missing)
+    else:
+        load_full_catalogue()
+
+def ensure_complete():
+    """Make sure the cache holds the full catalogue"""
+    revalidate()
+    if not _cache['complete']:
+        load_full_catalogue()
+
+def revalidate():
+    """Drop the cache when the catalogue version has moved on"""
+    now = time.monotonic()
+    if _cache['version'] is not None and now - _cache['checked_at'] < VERSION_CHECK_SECONDS:
+        return
+
+    version = read_catalogue_version()
+    _cache['checked_at'] = now
+    if version is None:
+        # Keep serving what we have when the marker cannot be read
+        return
+
+    if version != _cache['version'] or _cache['source'] == 'sample':
+        if _cache['version'] is not None and version != _cache['version']:
+            logger.info(f"Team catalogue version changed {_cache['version']} -> {version}, reloading")
+        # A sample catalogue is only kept until the table has been seeded
+        reset_cache()
+        _cache['version'] = version
+
+def reset_cache():
+    """Clear all cached teams"""
+    _cache['complete'] = False
+    _cache['source'] = 'table'
+    _cache['teams'] = {}
+    _cache['by_country'] = {}
+    _cache['loaded_countries'] = set()
+    _cache['index'] = SpecializationIndex()
+
+def read_catalogue_version():
+    """Read the catalogue version marker item (0 when never bumped, None on error)"""
+    try:
+        table = dynamodb.Table(TEAMS_TABLE)
+        response = table.get_item(
+            Key={'team_id': CATALOGUE_VERSION_KEY},
+            ProjectionExpression='version'
+        )
+        return int(response.get('Item', {}).get('version', 0))
+    except Exception as e:
+        logger.error(f"Failed to read team catalogue version: {str(e)}")
+        return None
+
+def bump_catalogue_version():
+    """Increment the catalogue version so other containers reload"""
+    try:
+        table = dynamodb.Table(TEAMS_TABLE)
+        response = table.update_item(
+            Key={'team_id': CATALOGUE_VERSION_KEY},
+            UpdateExpression='ADD version :one',
+            ExpressionAttributeValues={':one': 1},
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response['Attributes']['version'])
+    except Exception as e:
+        logger.error(f"Failed to bump team catalogue version: {str(e)}")
+        return None
+
+def note_table_change():
+    """
+    Bump the catalogue version after this container changed team items, so
+    other warm containers reload them. The local cache already holds the
+    change, so it keeps its teams when no one else bumped in between.
+    """
+    version = bump_catalogue_version()
+    with _lock:
+        if version is not None and _cache['version'] == version - 1:
+            _cache['version'] = version
+
+def load_countries(countries):
+    """Load teams for a few countries with parallel Query calls on the country GSI"""
+    try:
+        with ThreadPoolExecutor(max_workers=min(len(countries), COUNTRY_QUERY_LIMIT)) as executor:
+            results = list(executor.map(query_country, countries))
+    except Exception as e:
+        logger.error(f"Failed to query team catalogue: {str(e)}")
+        raise
+
+    if not any(results) and not _cache['teams'] and table_is_empty():
+        load_sample_catalogue()
+        return
+
+    for country, items in zip(countries, results):
+        _cache['by_country'].setdefault(country, {})
+        for item in items:
+            index_team(normalize_team(item))
+        _cache['loaded_countries'].add(country)
+
+def query_country(country):
+    """Query every team of one country, following pagination"""
+    table = dynamodb.Table(TEAMS_TABLE)
+    kwargs = {
+        'IndexName': COUNTRY_INDEX,
+        'KeyConditionExpression': Key('country').eq(country)
+    }
+    items = []
+    while True:
+        response = table.query(**kwargs)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def load_full_catalogue():
+    """Load the whole catalogue with a paginated parallel Scan"""
+    try:
+        with ThreadPoolExecutor(max_workers=SCAN_SEGMENTS) as executor:
+            segments = list(executor.map(scan_segment, range(SCAN_SEGMENTS)))
+    except Exception as e:
+        logger.error(f"Failed to scan team catalogue: {str(e)}")
+        raise
+
+    items = [item for segment in segments for item in segment if item['team_id'] != CATALOGUE_VERSION_KEY]
+    if not items:
+        load_sample_catalogue()
+        return
+
+    reset_cache()
+    for item in items:
+        index_team(normalize_team(item))
+    _cache['loaded_countries'] = set(_cache['by_country'].keys())
+    _cache['complete'] = True
+    logger.info(f"Loaded {len(items)} teams across {len(_cache['by_country'])} countries")
+
+def scan_segment(segment):
+    """Scan one segment of the teams table, following pagination"""
+    table = dynamodb.Table(TEAMS_TABLE)
+    kwargs = {'Segment': segment, 'TotalSegments': SCAN_SEGMENTS}
+    items = []
+    while True:
+        response = table.scan(**kwargs)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def table_is_empty():
+    """Whether the teams table holds no team items, only (at most) the version marker"""
+    response = dynamodb.Table(TEAMS_TABLE).scan(Limit=2, ProjectionExpression='team_id')
+    return all(item['team_id'] == CATALOGUE_VERSION_KEY for item in response.get('Items', []))
+
+def load_sample_catalogue():
+    """Fall back to the built-in sample catalogue"""
+    logger.info("Using sample team catalogue")
+    reset_cache()
+    for team in SAMPLE_TEAMS:
+        index_team(dict(team))
+    _cache['loaded_countries'] = set(_cache['by_country'].keys())
+    _cache['complete'] = True
+    _cache['source'] = 'sample'
+
+def is_table_backed():
+    """Whether cached teams come from the ResponseTeams table rather than the sample catalogue"""
+    return _cache['source'] == 'table'
+
+def normalize_team(item):
+    """Convert DynamoDB Decimals to plain numbers"""
+    team = to_plain(item)
+    if 'country' not in team:
+        team['country'] = 'Unknown'
+    return team
+
+def to_plain(value):
+    """Recursively convert Decimals in a DynamoDB value"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, dict):
+        return {k: to_plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [to_plain(v) for v in value]
+    return value
+
+def index_team(team):
+    """Add a team to the id, country, status and specialization indexes"""
+    _cache['teams'][team['team_id']] = team
+    statuses = _cache['by_country'].setdefault(team['country'], {})
+    statuses.setdefault(team.get('status', 'UNKNOWN'), {})[team['team_id']] = team
+    _cache['index'].add(team)
+
+def update_team_status(team_id, status):
+    """Move a cached team to a new status bucket"""
+    with _lock:
+        team = _cache['teams'].get(team_id)
+        if not team:
+            return None
+
+        statuses = _cache['by_country'].setdefault(team['country'], {})
+        statuses.get(team.get('status', 'UNKNOWN'), {}).pop(team_id, None)
+        team['status'] = status
+        statuses.setdefault(status, {})[team_id] = team
+        _cache['index'].add(team)
+        return team
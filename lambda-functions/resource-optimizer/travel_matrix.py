@@ -0,0 +1,285 @@
+import os
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MATRIX_DIR = os.environ.get('TRAVEL_MATRIX_DIR', '/tmp/travel-matrix')
+GEOHASH_PRECISION = int(os.environ.get('TRAVEL_GEOHASH_PRECISION', '4'))
+
+# Travel model: great-circle distance stretched to road distance at convoy speed
+ROAD_FACTOR = 1.3
+AVERAGE_SPEED_KMH = 60
+
+# Minutes are stored as uint16; the top value marks an unknown team base
+UNKNOWN_MINUTES = np.iinfo(np.uint16).max
+MAX_MINUTES = UNKNOWN_MINUTES - 1
+
+INITIAL_CELLS = 256
+INITIAL_TEAMS = 1024
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+def geohash_encode(lat, lng, precision=GEOHASH_PRECISION):
+    """Encode a coordinate as a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    cell = []
+    bits = 0
+    value = 0
+    even = True
+    while len(cell) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if coord >= mid:
+            value = (value << 1) | 1
+            rng[0] = mid
+        else:
+            value <<= 1
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            cell.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(cell)
+
+def geohash_center(cell):
+    """Centre coordinate of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    even = True
+    for char in cell:
+        value = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            rng = lng_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lng_range[0] + lng_range[1]) / 2
+
+def travel_minutes(base_lat, base_lng, lat, lng):
+    """Vectorized travel minutes between team bases and points, as uint16"""
+    base_lat, base_lng, lat, lng = (np.radians(np.asarray(v, dtype=np.float64)) for v in (base_lat, base_lng, lat, lng))
+    a = np.sin((lat - base_lat) / 2) ** 2 + np.cos(base_lat) * np.cos(lat) * np.sin((lng - base_lng) / 2) ** 2
+    km = 6371.0 * 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    minutes = km * ROAD_FACTOR / AVERAGE_SPEED_KMH * 60
+    minutes = np.where(np.isnan(minutes), UNKNOWN_MINUTES, np.minimum(np.rint(minutes), MAX_MINUTES))
+    return minutes.astype(np.uint16)
+
+def team_base(team):
+    """(lat, lng) of a team base, NaN when unknown"""
+    if 'base_latitude' not in team or 'base_longitude' not in team:
+        return np.nan, np.nan
+    return float(team['base_latitude']), float(team['base_longitude'])
+
+class TravelTimeMatrix:
+    """
+    Geohash-cell x team-base travel times in minutes.
+
+    Rows are incident cells and columns are teams, so the ETA of every team
+    to a cell is one row slice. The matrix lives in a memory-mapped .npy
+    file that survives warm invocations; rows are added for new cells and
+    columns are recomputed only for teams whose base has moved.
+    """
+
+    def __init__(self, directory=MATRIX_DIR):
+        self.directory = directory
+        self.cells = {}
+        self.columns = {}
+        self.cell_centers = np.full((INITIAL_CELLS, 2), np.nan)
+        self.bases = np.full((INITIAL_TEAMS, 2), np.nan)
+        self.minutes = None
+        self.dirty = False
+        if directory:
+            self._load()
+        if self.minutes is None:
+            self.minutes = self._allocate((INITIAL_CELLS, INITIAL_TEAMS))
+
+    def eta_minutes(self, teams, location):
+        """Travel minutes from each team's base to a location (UNKNOWN_MINUTES when unknown)"""
+        columns = self.ensure_teams(teams)
+        row = self.row_for(float(location['latitude']), float(location['longitude']))
+        return self.minutes[row][columns]
+
+    def eta_hours(self, teams, location):
+        """Travel hours from each team's base to a location, 0 when the base is unknown"""
+        if not teams:
+            return np.zeros(0)
+        minutes = self.eta_minutes(teams, location)
+        return np.where(minutes == UNKNOWN_MINUTES, 0, minutes) / 60.0
+
+    def row_for(self, lat, lng):
+        """Matrix row of the cell containing a point, computing it on first use"""
+        cell = geohash_encode(lat, lng)
+        row = self.cells.get(cell)
+        if row is not None:
+            return row
+
+        row = len(self.cells)
+        if row >= self.minutes.shape[0]:
+            self._grow(rows=row + 1)
+        self.cells[cell] = row
+        self.cell_centers[row] = geohash_center(cell)
+
+        n_teams = len(self.columns)
+        self.minutes[row, :n_teams] = travel_minutes(self.bases[:n_teams, 0], self.bases[:n_teams, 1],
+                                                     *self.cell_centers[row])
+        self.dirty = True
+        return row
+
+    def ensure_teams(self, teams):
+        """Column indexes for teams, adding new teams and refreshing moved bases"""
+        bases = np.array([team_base(team) for team in teams], dtype=np.float64).reshape(-1, 2)
+        columns = np.array([self.columns.get(team['team_id'], -1) for team in teams], dtype=np.intp)
+
+        new = np.flatnonzero(columns < 0)
+        for i in new:
+            team_id = teams[i]['team_id']
+            col = self.columns.get(team_id)
+            if col is None:
+                col = self.columns[team_id] = len(self.columns)
+            columns[i] = col
+        if len(self.columns) > self.minutes.shape[1]:
+            self._grow(cols=len(self.columns))
+
+        stored = self.bases[columns]
+        same = np.isclose(stored, bases) | (np.isnan(stored) & np.isnan(bases))
+        changed = np.flatnonzero(~same.all(axis=1))
+        if len(changed):
+            self.bases[columns[changed]] = bases[changed]
+            self._refresh_columns(np.unique(columns[changed]))
+        return columns
+
+    def precompute(self, teams, cells):
+        """Fill the matrix for a catalogue and a list of geohash cells ahead of time"""
+        self.ensure_teams(teams)
+        for cell in cells:
+            self.row_for(*geohash_center(cell))
+        self.flush()
+
+    def flush(self):
+        """Write pending changes to disk; rows and columns missing from the metadata are recomputed on load"""
+        if not self.dirty:
+            return
+        if isinstance(self.minutes, np.memmap):
+            self.minutes.flush()
+        self._save_meta()
+        self.dirty = False
+
+    def _refresh_columns(self, columns):
+        """Recompute travel times of some teams against every known cell"""
+        n_cells = len(self.cells)
+        if n_cells:
+            columns = np.asarray(columns)
+            centers = self.cell_centers[:n_cells]
+            self.minutes[:n_cells, columns] = travel_minutes(
+                self.bases[columns, 0][None, :], self.bases[columns, 1][None, :],
+                centers[:, 0][:, None], centers[:, 1][:, None]
+            )
+        self.dirty = True
+
+    def _allocate(self, shape):
+        """Allocate the minutes array, memory-mapped when a directory is configured"""
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, 'minutes.npy')
+                tmp_path = path + '.tmp'
+                array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint16, shape=shape)
+                array[:] = UNKNOWN_MINUTES
+                if self.minutes is not None:
+                    old_rows, old_cols = self.minutes.shape
+                    array[:old_rows, :old_cols] = self.minutes
+                array.flush()
+                os.replace(tmp_path, path)
+                return np.load(path, mmap_mode='r+')
+            except OSError as e:
+                logger.error(f"Travel matrix file unavailable, keeping it in memory: {str(e)}")
+                self.directory = None
+
+        array = np.full(shape, UNKNOWN_MINUTES, dtype=np.uint16)
+        if self.minutes is not None:
+            old_rows, old_cols = self.minutes.shape
+            array[:old_rows, :old_cols] = self.minutes
+        return array
+
+    def _grow(self, rows=0, cols=0):
+        """Double capacity along whichever axis is full"""
+        cur_rows, cur_cols = self.minutes.shape
+        new_rows = cur_rows if rows <= cur_rows else max(rows, cur_rows * 2)
+        new_cols = cur_cols if cols <= cur_cols else max(cols, cur_cols * 2)
+
+        self.cell_centers = np.vstack([self.cell_centers, np.full((new_rows - cur_rows, 2), np.nan)])
+        self.bases = np.vstack([self.bases, np.full((new_cols - cur_cols, 2), np.nan)])
+        self.minutes = self._allocate((new_rows, new_cols))
+
+    def _load(self):
+        """Memory-map a previously saved matrix"""
+        path = os.path.join(self.directory, 'minutes.npy')
+        meta_path = os.path.join(self.directory, 'meta.json')
+        if not (os.path.exists(path) and os.path.exists(meta_path)):
+            return
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get('precision') != GEOHASH_PRECISION:
+                logger.info("Travel matrix precision changed, rebuilding")
+                return
+            minutes = np.load(path, mmap_mode='r+')
+            rows, cols = minutes.shape
+
+            self.cells = {cell: row for row, cell in enumerate(meta['cells'])}
+            self.columns = {team_id: col for col, team_id in enumerate(meta['teams'])}
+            self.cell_centers = np.full((rows, 2), np.nan)
+            self.bases = np.full((cols, 2), np.nan)
+            for row, cell in enumerate(meta['cells']):
+                self.cell_centers[row] = geohash_center(cell)
+            self.bases[:len(meta['bases'])] = np.array(meta['bases'], dtype=np.float64).reshape(-1, 2)
+            self.minutes = minutes
+            logger.info(f"Loaded travel matrix with {len(self.cells)} cells x {len(self.columns)} teams")
+        except Exception as e:
+            logger.error(f"Failed to load travel matrix, rebuilding: {str(e)}")
+            self.cells = {}
+            self.columns = {}
+            self.minutes = None
+
+    def _save_meta(self):
+        """Persist the cell and team ordering next to the minutes file"""
+        if not self.directory:
+            return
+        n_teams = len(self.columns)
+        meta = {
+            'precision': GEOHASH_PRECISION,
+            'cells': sorted(self.cells, key=self.cells.get),
+            'teams': sorted(self.columns, key=self.columns.get),
+            'bases': [[None if np.isnan(v) else float(v) for v in base] for base in self.bases[:n_teams]]
+        }
+        meta_path = os.path.join(self.directory, 'meta.json')
+        try:
+            with open(meta_path + '.tmp', 'w') as f:
+                json.dump(meta, f)
+            os.replace(meta_path + '.tmp', meta_path)
+        except OSError as e:
+            logger.error(f"Failed to save travel matrix metadata: {str(e)}")
+
+_matrix = None
+
+def get_matrix():
+    """Container-wide travel matrix"""
+    global _matrix
+    if _matrix is None:
+        _matrix = TravelTimeMatrix()
+    return _matrix
+
+def set_matrix(matrix):
+    """Replace the container-wide travel matrix, e.g. with an in-memory one"""
+    global _matrix
+    _matrix = matrix
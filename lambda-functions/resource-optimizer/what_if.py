@@ -0,0 +1,158 @@
+"""
+What-if evaluation of hypothetical incident sets against the current team
+inventory, for planning ahead of a forecast event:
+
+    python what_if.py scenarios.json --teams teams.json --workers 8
+
+``scenarios.json`` is a list of {'name', 'incidents': [incident_data, ...]}.
+Without --teams the live team catalogue is used.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import app
+import team_catalogue
+import travel_matrix
+from assignment import PRIORITY_WEIGHTS
+from specialization_index import SpecializationIndex
+
+# Read-only inputs shared by every scenario. Workers are forked after these
+# are set, so they see the parent's index without pickling or rebuilding it.
+_shared = {'teams': None, 'index': None}
+
+def evaluate_scenarios(scenarios, teams, workers=None):
+    """
+    Evaluate scenarios against one team inventory. ``workers`` is the
+    process count (default: CPU count); 0 evaluates in this process.
+    """
+    start = time.perf_counter()
+    available = [t for t in teams if t.get('status', 'AVAILABLE') == 'AVAILABLE']
+    _shared['teams'] = available
+    _shared['index'] = SpecializationIndex(available)
+
+    # Fill every travel-matrix row up front so workers only ever read it
+    cells = {travel_matrix.geohash_encode(float(location['latitude']), float(location['longitude']))
+             for scenario in scenarios for incident in scenario.get('incidents', [])
+             for location in [app.incident_location(incident)] if location}
+    travel_matrix.get_matrix().precompute(available, sorted(cells))
+
+    workers = os.cpu_count() if workers is None else workers
+    if workers == 0 or len(scenarios) < 2:
+        summaries = [evaluate_scenario(scenario) for scenario in scenarios]
+    else:
+        chunksize = max(1, len(scenarios) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            summaries = list(pool.map(evaluate_scenario, scenarios, chunksize=chunksize))
+
+    return {
+        'scenarios': summaries,
+        'comparison': compare_scenarios(summaries),
+        'teams_available': len(available),
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 2)
+    }
+
+def evaluate_scenario(scenario):
+    """
+    Allocate teams to one scenario's incidents, highest priority first, with
+    incidents competing for the same inventory
+    """
+    start = time.perf_counter()
+    index, teams = _shared['index'], _shared['teams']
+
+    incidents = sorted(scenario.get('incidents', []),
+                       key=lambda i: PRIORITY_WEIGHTS.get(i.get('priority', 'MEDIUM'), 2), reverse=True)
+
+    taken = set()
+    gaps = {}
+    required = covered = 0
+    total_cost = 0
+    response_times = []
+    for incident in incidents:
+        optimization = app.optimize_resources(incident, teams, index, exclude=taken)
+        selected = optimization['selected_teams']
+        taken.update(team['team_id'] for team in selected)
+
+        for spec in optimization['specializations_covered']:
+            required += 1
+            if any(spec.lower() in team['specialization'].lower() for team in selected):
+                covered += 1
+            else:
+                gaps[spec] = gaps.get(spec, 0) + 1
+
+        total_cost += app.calculate_total_cost(optimization)
+        if selected:
+            response_times.append(app.calculate_response_time(app.calculate_deployment_strategy(optimization)))
+
+    return {
+        'name': scenario.get('name'),
+        'incidents': len(incidents),
+        'teams_deployed': len(taken),
+        'coverage': round(covered / required, 4) if required else 1.0,
+        'coverage_gaps': gaps,
+        'total_cost': total_cost,
+        'mean_response_hours': round(sum(response_times) / len(response_times), 2) if response_times else None,
+        'max_response_hours': max(response_times) if response_times else None,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 2)
+    }
+
+def compare_scenarios(summaries):
+    """Which scenario is best and worst on each measure"""
+    if not summaries:
+        return {}
+
+    timed = [s for s in summaries if s['max_response_hours'] is not None]
+    comparison = {
+        'best_coverage': max(summaries, key=lambda s: s['coverage'])['name'],
+        'worst_coverage': min(summaries, key=lambda s: s['coverage'])['name'],
+        'lowest_cost': min(summaries, key=lambda s: s['total_cost'])['name'],
+        'highest_cost': max(summaries, key=lambda s: s['total_cost'])['name']
+    }
+    if timed:
+        comparison['fastest_response'] = min(timed, key=lambda s: s['max_response_hours'])['name']
+        comparison['slowest_response'] = max(timed, key=lambda s: s['max_response_hours'])['name']
+
+    # Specializations short across scenarios point at inventory to add
+    shortages = {}
+    for summary in summaries:
+        for spec, count in summary['coverage_gaps'].items():
+            shortages[spec] = shortages.get(spec, 0) + count
+    comparison['coverage_gaps'] = dict(sorted(shortages.items(), key=lambda item: -item[1]))
+    return comparison
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Evaluate what-if incident scenarios against the team inventory')
+    parser.add_argument('scenarios', help='JSON file with a list of scenarios')
+    parser.add_argument('--teams', help='JSON file with the team inventory (default: live catalogue)')
+    parser.add_argument('--workers', type=int, help='worker processes (default: CPU count, 0 for none)')
+    parser.add_argument('--output', help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    with open(args.scenarios) as f:
+        scenarios = json.load(f)
+    if args.teams:
+        with open(args.teams) as f:
+            teams = json.load(f)
+    else:
+        teams = team_catalogue.get_teams(status='AVAILABLE')
+
+    results = evaluate_scenarios(scenarios, teams, args.workers)
+
+    for summary in results['scenarios']:
+        response = summary['max_response_hours']
+        print(f"{str(summary['name']):<24} incidents={summary['incidents']:>4} "
+              f"coverage={summary['coverage']:.2f} cost=${summary['total_cost']:,.0f} "
+              f"max_response={'-' if response is None else f'{response}h'}")
+    print(f"{len(scenarios)} scenarios in {results['elapsed_ms']:.0f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())